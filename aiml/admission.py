@@ -0,0 +1,147 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+from metrics import stage
+
+
+# Admission control for LLM calls, shared by every request in the process.
+# At most `max_in_flight` generations run at once; up to `max_queue` more wait
+# in FIFO order for a slot. Anything beyond that (or a waiter that times out)
+# is rejected with Overloaded, which the routes turn into 503 + Retry-After.
+#
+# Slots are handed directly from a finishing call to the oldest waiter. Each
+# request waits on its own (gunicorn worker) thread, so run threaded workers
+# (e.g. `-k gthread --threads 32`) to let the queue hold more students than
+# there are slots.
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+DEFAULT_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+DEFAULT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+
+# Retry-After bounds (seconds) and the call duration assumed before any call finished.
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+INITIAL_CALL_SECONDS = 10.0
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int, reason: str = "queue full"):
+        super().__init__(f"Server busy ({reason}); retry in {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    def __init__(self):
+        self.granted = False
+        self.event = threading.Event()
+
+    def wake(self) -> None:
+        # Called with the gate lock held, from the thread releasing the slot.
+        self.granted = True
+        self.event.set()
+
+
+class AdmissionGate:
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        # Moving average of slot hold time, for Retry-After.
+        self._call_seconds = INITIAL_CALL_SECONDS
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def retry_after(self) -> int:
+        # Time for the current queue (plus us) to drain through the slots.
+        with self._lock:
+            return self._retry_after_locked()
+
+    def _retry_after_locked(self) -> int:
+        rounds = (len(self._waiters) + 1) / self.max_in_flight
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(rounds * self._call_seconds))))
+
+    def check(self) -> None:
+        # Cheap early rejection, before a request spends time on retrieval.
+        with self._lock:
+            if self._in_flight >= self.max_in_flight and len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self._retry_after_locked())
+
+    def _enter(self) -> Optional[_Waiter]:
+        # None: admitted immediately. Otherwise the caller waits on the returned waiter.
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._in_flight += 1
+                self.admitted += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self._retry_after_locked())
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+            self.queued += 1
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        # A waiter gave up. True if it was granted a slot meanwhile (and now owns it).
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self.timed_out += 1
+            return False
+
+    def _release(self, held_for: float) -> None:
+        with self._lock:
+            self._call_seconds = 0.8 * self._call_seconds + 0.2 * held_for
+            if self._waiters:
+                # Hand the slot over; in_flight is unchanged.
+                self._waiters.popleft().wake()
+                self.admitted += 1
+            else:
+                self._in_flight -= 1
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        waiter = self._enter()
+        if waiter is not None:
+            with stage("queue"):
+                granted = waiter.event.wait(self.queue_timeout)
+            if not granted and not self._abandon(waiter):
+                raise Overloaded(self.retry_after(), reason="queue timeout")
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_call_seconds": round(self._call_seconds, 3),
+            }
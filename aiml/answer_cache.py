@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+# Semantic cache of generated answers, per (course, semester).
+# A question whose embedding is within `threshold` cosine similarity of an
+# earlier question in the same semester gets that question's answer back
+# without a generation. Entries are dropped when:
+# - the semester's index version changes (re-ingested notes -> new answers)
+# - they are older than `ttl_seconds`
+# - the cache holds more than `max_entries` (least recently used first)
+DEFAULT_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+DEFAULT_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+
+
+class CachedAnswer:
+    def __init__(self, question: str, vec: np.ndarray, result: Dict, generation_seconds: float):
+        self.question = question
+        self.vec = vec
+        self.result = result
+        self.generation_seconds = generation_seconds
+        self.created_at = time.monotonic()
+        self.hits = 0
+
+
+class _Scope:
+    def __init__(self, version: str):
+        self.version = version
+        self.entry_ids: List[int] = []
+        # Row i = unit vector of entry_ids[i]; rebuilt lazily after changes.
+        self._matrix: Optional[np.ndarray] = None
+
+    def matrix(self, entries: "OrderedDict[int, CachedAnswer]") -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.vstack([entries[i].vec for i in self.entry_ids])
+        return self._matrix
+
+    def add(self, entry_id: int) -> None:
+        self.entry_ids.append(entry_id)
+        self._matrix = None
+
+    def remove(self, entry_id: int) -> None:
+        self.entry_ids.remove(entry_id)
+        self._matrix = None
+
+
+def _unit(vec: np.ndarray) -> np.ndarray:
+    vec = np.asarray(vec, dtype="float32").reshape(-1)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+class SemanticAnswerCache:
+    # Thread-safe. Lookups are a brute-force dot product over one semester's
+    # entries, which at these sizes costs well under a millisecond.
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._entry_scope: Dict[int, Hashable] = {}
+        self._scopes: Dict[Hashable, _Scope] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.invalidated = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _drop(self, entry_id: int) -> None:
+        del self._entries[entry_id]
+        scope_key = self._entry_scope.pop(entry_id)
+        scope = self._scopes[scope_key]
+        scope.remove(entry_id)
+        if not scope.entry_ids:
+            del self._scopes[scope_key]
+
+    def _scope(self, scope_key: Hashable, version: str) -> Optional[_Scope]:
+        scope = self._scopes.get(scope_key)
+        if scope is not None and scope.version != version:
+            self.invalidated += len(scope.entry_ids)
+            for entry_id in list(scope.entry_ids):
+                self._drop(entry_id)
+            scope = None
+        return scope
+
+    def _expire(self, scope: _Scope, now: float) -> None:
+        stale = [i for i in scope.entry_ids if now - self._entries[i].created_at > self.ttl_seconds]
+        self.expired += len(stale)
+        for entry_id in stale:
+            self._drop(entry_id)
+
+    def get(self, scope_key: Hashable, version: str, vec: np.ndarray) -> Optional[Tuple[CachedAnswer, float]]:
+        # (entry, similarity) of the closest earlier question above threshold.
+        vec = _unit(vec)
+        with self._lock:
+            scope = self._scope(scope_key, version)
+            if scope is not None:
+                self._expire(scope, time.monotonic())
+                scope = self._scopes.get(scope_key)
+            if scope is not None:
+                sims = scope.matrix(self._entries) @ vec
+                best = int(np.argmax(sims))
+                if float(sims[best]) >= self.threshold:
+                    entry_id = scope.entry_ids[best]
+                    entry = self._entries[entry_id]
+                    self._entries.move_to_end(entry_id)
+                    entry.hits += 1
+                    self.hits += 1
+                    self.seconds_saved += entry.generation_seconds
+                    return entry, float(sims[best])
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        scope_key: Hashable,
+        version: str,
+        vec: np.ndarray,
+        question: str,
+        result: Dict,
+        generation_seconds: float,
+    ) -> None:
+        entry = CachedAnswer(question, _unit(vec), result, generation_seconds)
+        with self._lock:
+            scope = self._scope(scope_key, version)
+            if scope is None:
+                scope = self._scopes[scope_key] = _Scope(version)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._entry_scope[entry_id] = scope_key
+            scope.add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evicted += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "scopes": len(self._scopes),
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "seconds_saved": round(self.seconds_saved, 3),
+                "invalidated": self.invalidated,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
@@ -1,21 +1,113 @@
-from typing import Dict
-from rag import Retriever
+import time
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from admission import AdmissionGate
+from answer_cache import SemanticAnswerCache
+from context_packer import ContextPacker
+from metrics import count_rate_limits, record_usage, stage
+from rag import Retriever, filter_key
+from sessions import ConversationStore
 from google.genai import Client
 from google.api_core.exceptions import ResourceExhausted
 from google.genai.types import Content, Part, GenerateContentConfig, UserContent
 from google.genai import types
 
+
+def build_prompt(context: str, question: str) -> str:
+    return f"""
+You are a helpful campus teaching assistant.
+
+IMPORTANT RULES:
+- Prefer answering using the information present in the context below.
+- If the context does not contain enough information to answer, use google search tool to find the answer.
+- If you still cannot find the answer, respond with:
+  "I don't have enough information in the provided notes to answer this."
+
+ANSWERING GUIDE:
+1. Don't shorten the answer, keep it long and easy to understand for learner prupose.
+2. Structure the answer with clear sections and headings (use KaTeX and Markdown).
+3. Include examples, use bullet points, and step-by-step explanations where applicable.
+4. Google search for extra information if context is insufficient.
+5. Give the ORIGINAL context definition or statement in simple as well (do not oversimplify).
+6. Use a SIMPLE ANALOGY or real-life comparison to make the idea intuitive.
+7. If applicable, mention WHY this concept is important for exams or applications.
+8. Keep the explanation clear, structured, and student-friendly.
+   (do NOT give a single short summary paragraph unless asked).
+
+TONE:
+- Clear
+- Student-friendly
+- Exam-oriented
+- No unnecessary jargon unless explained
+
+RAG Search:
+---
+{context}
+
+Question:
+---
+{question}
+"""
+
+
+def format_sources(retrieved_chunks: List[Dict]) -> List[Dict]:
+    # Format sources for frontend
+    formatted_sources = []
+    for idx, chunk in enumerate(retrieved_chunks):
+        formatted_sources.append({
+            "id": str(idx + 1),
+            "fileName": chunk.get("doc_name", "Unknown"),
+            "category": chunk.get("category", "Unknown"),
+            "semester": chunk.get("semester", "Unknown"),
+            "source": chunk.get("source", "Unknown"),
+            "title": chunk.get("subject", "No Title"),
+            "pageNumber": chunk.get("page", 0),
+            "pageEnd": chunk.get("page_end"),  # set when short pages were coalesced into one chunk
+            "relevance": chunk.get("relevance", 0),  # You can calculate this based on similarity score
+            "excerpt": chunk.get("text", "")[:200] + "..." if len(chunk.get("text", "")) > 200 else chunk.get("text", ""),
+            "filePath": chunk.get("source_path", ""),
+            "scope": chunk.get("scope"),  # "FY/Sem-1" when several semesters were searched
+            # Near-duplicate copies of this excerpt elsewhere (other pages/files).
+            "alsoIn": [
+                {"fileName": d.get("doc_name"), "pageNumber": d.get("page"), "filePath": d.get("source_path", "")}
+                for d in chunk.get("duplicates", [])
+            ],
+        })
+    return formatted_sources
+
+
 class QAService:
-    def __init__(self, client: Client, retriever: Retriever, model_name: str = "gemini-2.5-flash"):
+    def __init__(
+        self,
+        client: Client,
+        retriever: Retriever,
+        model_name: str = "gemini-2.5-flash",
+        conversations: Optional[ConversationStore] = None,
+        gate: Optional[AdmissionGate] = None,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        packer: Optional[ContextPacker] = None,
+    ):
         self.client = client
         self.retriever = retriever
         self.model_name = model_name
+        # Bounded per-session history (keyed by JWT identity + frontend session id)
+        # instead of one chat shared by every student.
+        self.conversations = conversations or ConversationStore()
+        # Caps concurrent generate calls across ask / ask_stream;
+        # raises admission.Overloaded when the wait queue is full.
+        self.gate = gate or AdmissionGate()
+        # Optional: reuse answers to near-identical first questions per semester.
+        self.answer_cache = answer_cache
+        # Turns a wider set of retrieved chunks into a context of bounded size.
+        self.packer = packer or ContextPacker()
 
         tools = [
             types.Tool(url_context=types.UrlContext()),
             types.Tool(google_search=types.GoogleSearch())
         ]
-        generate_content_config = GenerateContentConfig(
+        self.generate_content_config = GenerateContentConfig(
             temperature=0.7,
             max_output_tokens=5536,
             # thinking_config=ThinkingConfig(
@@ -36,73 +128,160 @@ class QAService:
         #     Content(parts=[Part(text="""YAHOOOOO!"""),], role='model'),
         # ]
 
-        self.chat = self.client.chats.create(model=self.model_name, config=generate_content_config)#, history=self.history_content)
-        
-    
-    def ask(self, question: str, course:str = None, semester: str = None) -> Dict:
-        retrieved_chunks = self.retriever.retrieve(question, course=course, semester=semester)
+    def _build_contents(self, history: List[Tuple[str, str]], prompt: str) -> List[Content]:
+        contents: List[Content] = []
+        for past_question, past_answer in history:
+            contents.append(UserContent(parts=[Part(text=past_question)]))
+            contents.append(Content(role="model", parts=[Part(text=past_answer)]))
+        contents.append(UserContent(parts=[Part(text=prompt)]))
+        return contents
+
+    def _prepare(
+        self,
+        question: str,
+        course: str,
+        semester: str,
+        session_key: Optional[Tuple[str, str]],
+        scopes: Optional[List[Tuple[str, str]]] = None,
+        filters: Optional[Dict[str, List[str]]] = None,
+    ) -> Tuple[List[Content], List[Dict]]:
+        # scopes: several (course, semester) indexes searched together instead of one.
+        # filters: restrict retrieval by subject / category / doc_name (see rag.FILTER_FIELDS).
+        top_k = self.packer.candidates
+        if scopes:
+            candidates = self.retriever.retrieve_many(question, scopes, top_k=top_k, filters=filters)
+        else:
+            candidates = self.retriever.retrieve(
+                question, top_k=top_k, course=course, semester=semester, filters=filters
+            )
+        with stage("pack"):
+            retrieved_chunks = self.packer.pack(candidates)
 
         context = "\n\n".join(f"- {c['text']}" for c in retrieved_chunks)
+        prompt = build_prompt(context, question)
 
-        prompt = f"""
-You are a helpful campus teaching assistant.
+        history = self.conversations.history(session_key) if session_key else []
+        return self._build_contents(history, prompt), format_sources(retrieved_chunks)
 
-IMPORTANT RULES:
-- Prefer answering using the information present in the context below.
-- If the context does not contain enough information to answer, use google search tool to find the answer.
-- If you still cannot find the answer, respond with:
-  "I don't have enough information in the provided notes to answer this."
+    def _probe_answer_cache(
+        self,
+        question: str,
+        course: str,
+        semester: str,
+        session_key: Optional[Tuple[str, str]],
+        scopes: Optional[List[Tuple[str, str]]] = None,
+        filters: Optional[Dict[str, List[str]]] = None,
+    ) -> Tuple[Optional[Dict], Optional[Tuple[Hashable, str, np.ndarray]]]:
+        # (cached result, None) on a hit; (None, key to store the new answer under)
+        # on a miss; (None, None) when the cache doesn't apply.
+        if self.answer_cache is None:
+            return None, None
+        # Follow-ups depend on the conversation so far; only first turns are shared.
+        if session_key and self.conversations.history(session_key):
+            return None, None
+        vec = self.retriever.embed_query_with_fallback(question)
+        if vec is None:
+            return None, None
 
-ANSWERING GUIDE:
-1. Don't shorten the answer, keep it long and easy to understand for learner prupose.
-2. Structure the answer with clear sections and headings (use KaTeX and Markdown).
-3. Include examples, use bullet points, and step-by-step explanations where applicable.
-4. Google search for extra information if context is insufficient.
-5. Give the ORIGINAL context definition or statement in simple as well (do not oversimplify).
-6. Use a SIMPLE ANALOGY or real-life comparison to make the idea intuitive.
-7. If applicable, mention WHY this concept is important for exams or applications.
-8. Keep the explanation clear, structured, and student-friendly.
-   (do NOT give a single short summary paragraph unless asked).
+        scope = tuple(scopes) if scopes else (course, semester)
+        # Answers from a filtered search only serve the same filter.
+        scope = (scope, filter_key(filters))
+        if scopes:
+            version = "||".join(self.retriever.index_version(c, sem) for c, sem in scopes)
+        else:
+            version = self.retriever.index_version(course, semester)
+        with stage("answer_cache"):
+            hit = self.answer_cache.get(scope, version, vec)
+        if hit is None:
+            return None, (scope, version, vec)
+        entry, _ = hit
+        if session_key:
+            self.conversations.append(session_key, question, entry.result["answer"])
+        return {**entry.result, "cached": True}, None
 
-TONE:
-- Clear
-- Student-friendly
-- Exam-oriented
-- No unnecessary jargon unless explained
+    def _store_answer(self, cache_key, question: str, result: Dict, started: float) -> None:
+        if cache_key is not None and result["answer"]:
+            self.answer_cache.put(*cache_key, question, result, time.perf_counter() - started)
 
-RAG Search:
----
-{context}
+    def ask(
+        self,
+        question: str,
+        course: str = None,
+        semester: str = None,
+        session_key: Optional[Tuple[str, str]] = None,
+        scopes: Optional[List[Tuple[str, str]]] = None,
+        filters: Optional[Dict[str, List[str]]] = None,
+    ) -> Dict:
+        started = time.perf_counter()
+        cached, cache_key = self._probe_answer_cache(question, course, semester, session_key, scopes, filters)
+        if cached is not None:
+            return cached
 
-Question:
----
-{question}
-"""
+        self.gate.check()
+        contents, formatted_sources = self._prepare(question, course, semester, session_key, scopes, filters)
 
-        # response = self.client.models.generate_content(model=self.model_name, contents=prompt)
-        response = self.chat.send_message(
-            message=prompt
-        )
+        with self.gate.slot(), stage("generate"), count_rate_limits("generate"):
+            response = self.client.models.generate_content(
+                model=self.model_name,
+                contents=contents,
+                config=self.generate_content_config,
+            )
+        record_usage(getattr(response, "usage_metadata", None))
         answer_text = response.text
-        # print(self.chat.get_history())
-
-        # Format sources for frontend
-        formatted_sources = []
-        for idx, chunk in enumerate(retrieved_chunks):
-            formatted_sources.append({
-                "id": str(idx + 1),
-                "fileName": chunk.get("doc_name", "Unknown"),
-                "category": chunk.get("category", "Unknown"),
-                "semester": chunk.get("semester", "Unknown"),
-                "source": chunk.get("source", "Unknown"),
-                "title": chunk.get("subject", "No Title"),
-                "pageNumber": chunk.get("page", 0),
-                "relevance": chunk.get("relevance", 0),  # You can calculate this based on similarity score
-                "excerpt": chunk.get("text", "")[:200] + "..." if len(chunk.get("text", "")) > 200 else chunk.get("text", ""),
-                "filePath": chunk.get("source_path", "")
-            })
-
-        return {
-            "answer": answer_text, 
+        if session_key and answer_text:
+            self.conversations.append(session_key, question, answer_text)
+
+        result = {
+            "answer": answer_text,
             "sources": formatted_sources,
         }
+        self._store_answer(cache_key, question, result, started)
+        return result
+
+    def ask_stream(
+        self,
+        question: str,
+        course: str = None,
+        semester: str = None,
+        session_key: Optional[Tuple[str, str]] = None,
+        scopes: Optional[List[Tuple[str, str]]] = None,
+        filters: Optional[Dict[str, List[str]]] = None,
+    ) -> Iterator[Tuple[str, object]]:
+        # Yields ("sources", [...]) as soon as retrieval is done, then ("token", text)
+        # for each streamed piece of the answer, then ("done", {"answer": full_text}).
+        # Callers should run self.gate.check() first: once the stream has started,
+        # a queue timeout can only surface as an exception mid-stream.
+        # A cached answer is sent as a single token; "done" then has "cached": true.
+        started = time.perf_counter()
+        cached, cache_key = self._probe_answer_cache(question, course, semester, session_key, scopes, filters)
+        if cached is not None:
+            yield "sources", cached["sources"]
+            yield "token", cached["answer"]
+            yield "done", {"answer": cached["answer"], "cached": True}
+            return
+
+        contents, formatted_sources = self._prepare(question, course, semester, session_key, scopes, filters)
+        yield "sources", formatted_sources
+
+        pieces: List[str] = []
+        usage = None
+        # "generate" here includes the time the client takes to read each token.
+        with self.gate.slot(), stage("generate"), count_rate_limits("generate"):
+            for chunk in self.client.models.generate_content_stream(
+                model=self.model_name,
+                contents=contents,
+                config=self.generate_content_config,
+            ):
+                # Cumulative; the last chunk carries the totals.
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                text = chunk.text
+                if text:
+                    pieces.append(text)
+                    yield "token", text
+        record_usage(usage)
+
+        answer_text = "".join(pieces)
+        if session_key and answer_text:
+            self.conversations.append(session_key, question, answer_text)
+        self._store_answer(cache_key, question, {"answer": answer_text, "sources": formatted_sources}, started)
+        yield "done", {"answer": answer_text}
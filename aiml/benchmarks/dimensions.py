@@ -0,0 +1,182 @@
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+from benchmarks.retrieval import environment
+from benchmarks.stubs import StubClient
+from embedder import Embedder, create_gemini_client
+from embedding_store import EmbeddingStore
+
+
+# Recall vs. size of reduced-dimension embeddings on our own chunks.
+# The corpus and a sample of queries are embedded once at the largest size;
+# each smaller size is the L2-normalised prefix of those vectors (the model is
+# Matryoshka-trained, which is what output_dimensionality returns; pass
+# --exact to request every size from the API instead). Per size it reports:
+# - recall@k: overlap of the top k with the top k at the largest size
+# - source@k: how often the chunk a query was taken from is in the top k
+# - index bytes and mean single-query search latency (flat inner product)
+# plus the same latency for a full-size IndexFlatL2, the pre-existing layout.
+#
+#   cd aiml && python -m benchmarks.dimensions --chunks data/SY/Sem-3/SY_Sem-3_chunks.jsonl
+#
+# Needs GEMINI_API_KEY (aiml/.env) unless --stub; vectors are cached in the
+# ingestion embedding store, so reruns and later ingestions don't pay again.
+
+AIML_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CHUNKS = AIML_DIR / "data" / "FY" / "Sem-1" / "FY_Sem-1_chunks.jsonl"
+DEFAULT_STORE = AIML_DIR / "ingestion" / "output" / "embeddings"
+DEFAULT_DIMS = "3072,1536,768,256"
+DEFAULT_QUERIES = 200
+DEFAULT_TOP_K = 10
+
+# Queries are the first words of sampled chunks: short, like a student's question.
+QUERY_WORDS = 12
+SEED = 1234
+
+
+def _unit_prefix(vectors: np.ndarray, dim: int) -> np.ndarray:
+    prefix = np.ascontiguousarray(vectors[:, :dim])
+    norms = np.linalg.norm(prefix, axis=1, keepdims=True)
+    return prefix / np.where(norms > 0, norms, 1.0)
+
+
+def _embed(embedder: Embedder, store: Optional[EmbeddingStore], texts: List[str]) -> np.ndarray:
+    if store is None:
+        return embedder.embed_texts(texts)
+    vectors = store.get_many(embedder.vector_key, texts)
+    missing = [i for i, vec in enumerate(vectors) if vec is None]
+    if missing:
+        print(f"Embedding {len(missing)} of {len(texts)} texts ({embedder.vector_key})", file=sys.stderr)
+        fresh = embedder.embed_texts([texts[i] for i in missing])
+        store.put_many(embedder.vector_key, [texts[i] for i in missing], fresh)
+        for i, vec in zip(missing, fresh):
+            vectors[i] = vec
+    return np.vstack(vectors)
+
+
+def _search_latency(index: faiss.Index, queries: np.ndarray, k: int) -> float:
+    # Mean seconds per single-query search, as the Retriever issues them.
+    started = time.perf_counter()
+    for q in queries:
+        index.search(q.reshape(1, -1), k)
+    return (time.perf_counter() - started) / len(queries)
+
+
+def _top_k(index: faiss.Index, queries: np.ndarray, k: int) -> np.ndarray:
+    _, labels = index.search(queries, k)
+    return labels
+
+
+def measure(
+    chunks_path: Path,
+    dims: List[int],
+    n_queries: int,
+    k: int,
+    client,
+    store: Optional[EmbeddingStore],
+    exact: bool,
+) -> Dict:
+    records = [json.loads(line) for line in open(chunks_path, encoding="utf-8") if line.strip()]
+    texts = [r["text"] for r in records if r.get("text")]
+    rng = np.random.default_rng(SEED)
+    sources = rng.choice(len(texts), size=min(n_queries, len(texts)), replace=False)
+    queries = [" ".join(texts[i].split()[:QUERY_WORDS]) for i in sources]
+
+    full_dim = max(dims)
+    vectors: Dict[int, np.ndarray] = {}
+    query_vectors: Dict[int, np.ndarray] = {}
+    for dim in sorted(dims, reverse=True):
+        if dim == full_dim or exact:
+            embedder = Embedder(client, output_dimensionality=dim)
+            vectors[dim] = _embed(embedder, store, texts)
+            query_vectors[dim] = _embed(embedder, store, queries)
+        else:
+            vectors[dim] = _unit_prefix(vectors[full_dim], dim)
+            query_vectors[dim] = _unit_prefix(query_vectors[full_dim], dim)
+
+    reference = faiss.IndexFlatIP(full_dim)
+    reference.add(vectors[full_dim])
+    reference_top = _top_k(reference, query_vectors[full_dim], k)
+
+    legacy = faiss.IndexFlatL2(full_dim)
+    legacy.add(vectors[full_dim])
+    results = [
+        {
+            "dim": full_dim,
+            "metric": "l2",
+            "index_bytes": len(texts) * full_dim * 4,
+            "search_ms": round(_search_latency(legacy, query_vectors[full_dim], k) * 1000, 4),
+        }
+    ]
+    for dim in sorted(dims, reverse=True):
+        index = faiss.IndexFlatIP(dim)
+        index.add(vectors[dim])
+        top = _top_k(index, query_vectors[dim], k)
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, reference_top)])
+        source_hits = np.mean([src in row for src, row in zip(sources, top)])
+        results.append(
+            {
+                "dim": dim,
+                "metric": "ip",
+                "index_bytes": len(texts) * dim * 4,
+                "size_ratio": round(full_dim / dim, 2),
+                f"recall@{k}": round(float(recall), 4),
+                f"source@{k}": round(float(source_hits), 4),
+                "search_ms": round(_search_latency(index, query_vectors[dim], k) * 1000, 4),
+            }
+        )
+    return {"chunks": len(texts), "queries": len(queries), "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall / size / latency of reduced-dimension embeddings")
+    parser.add_argument("--chunks", type=Path, default=DEFAULT_CHUNKS, help="chunks.jsonl to embed")
+    parser.add_argument("--dims", default=DEFAULT_DIMS, help="Comma-separated sizes; the largest is the reference")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES)
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--exact", action="store_true", help="Request each size from the API instead of truncating")
+    parser.add_argument("--store", type=Path, default=DEFAULT_STORE, help="Embedding store for cached vectors")
+    parser.add_argument("--no-store", action="store_true", help="Don't read or write cached vectors")
+    parser.add_argument("--stub", action="store_true", help="Random stub vectors (smoke test; recall is meaningless)")
+    parser.add_argument("--output", type=Path, help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=AIML_DIR / ".env")
+    dims = sorted({int(d) for d in args.dims.split(",") if d}, reverse=True)
+    client = StubClient(dim=max(dims)) if args.stub else create_gemini_client()
+    # Stub vectors must never land in the real store.
+    store = None if args.no_store or args.stub else EmbeddingStore(args.store)
+
+    report = {
+        "benchmark": "dimensions",
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": {
+            "chunks": str(args.chunks),
+            "dims": dims,
+            "top_k": args.top_k,
+            "exact": args.exact,
+            "stub": args.stub,
+        },
+        **measure(args.chunks, dims, args.queries, args.top_k, client, store, args.exact),
+    }
+    if store is not None:
+        store.close()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from benchmarks.stubs import StubClient
+from chunk_store import write_chunk_store
+from embedder import Embedder
+from index_factory import INDEX_KINDS, build_index, write_index_meta
+from lexical import write_lexical_index
+from rag import RETRIEVAL_MODES, Retriever
+
+
+# Retrieval micro-benchmark on synthetic corpora, no network needed:
+# - chunks are pseudo-words drawn from a Zipf-like vocabulary (fixed seed)
+# - vectors are seeded Gaussian noise; queries go through the stub embedder
+# Each corpus is built once under --workdir, then measured in a fresh
+# subprocess so index load time and resident memory aren't skewed by the
+# build. Prints one JSON report (also written to --output).
+#
+#   cd aiml && python -m benchmarks.retrieval --sizes 10k,100k --output bench.json
+#
+# Vector memory is size * dim * 4 bytes: 1M chunks at dim 768 need ~3 GB for a
+# flat index (use --index-type sq8/ivf_pq or a smaller --dim on small machines).
+
+DEFAULT_SIZES = "10k,100k,1M"
+DEFAULT_DIM = 768
+DEFAULT_QUERIES = 200
+DEFAULT_THREADS = "1,4,8"
+DEFAULT_TOP_K = 3
+
+VOCAB_SIZE = 50_000
+WORDS_PER_CHUNK = 60
+CHUNKS_PER_DOC = 40
+ZIPF_EXPONENT = 1.07
+SEED = 1234
+
+# Corpus files; the chunk store and BM25 index sit next to a (never written) chunks.jsonl.
+CORPUS_NAME = "BENCH"
+CORPUS_META = "corpus.json"
+
+_SYLLABLES = ["ka", "ri", "to", "mu", "sen", "lo", "ve", "dra", "pi", "gon", "ther", "ux", "am", "quo", "zel", "fi"]
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def vocabulary(size: int = VOCAB_SIZE) -> List[str]:
+    # Distinct, tokenizer-friendly pseudo-words: base-16 digits spelled as syllables.
+    words = []
+    for i in range(size):
+        n, parts = i, []
+        while True:
+            parts.append(_SYLLABLES[n % len(_SYLLABLES)])
+            n //= len(_SYLLABLES)
+            if not n:
+                break
+        words.append("".join(parts) + "x")
+    return words
+
+
+def _word_probs(size: int) -> np.ndarray:
+    weights = 1.0 / np.arange(1, size + 1) ** ZIPF_EXPONENT
+    return weights / weights.sum()
+
+
+def corpus_paths(corpus_dir: Path) -> Dict[str, Path]:
+    return {
+        "index": corpus_dir / f"{CORPUS_NAME}_faiss.index",
+        "chunks": corpus_dir / f"{CORPUS_NAME}_chunks.jsonl",
+        "store": corpus_dir / f"{CORPUS_NAME}_chunks.store",
+        "bm25": corpus_dir / f"{CORPUS_NAME}_chunks.bm25",
+    }
+
+
+def _write_bm25(path: Path, word_ids: np.ndarray, vocab: List[str]) -> None:
+    # Vectorized equivalent of lexical.build_lexical_index for synthetic
+    # chunks (every token is a vocabulary word, none are stopwords).
+    n_docs, n_words = word_ids.shape
+    order = np.argsort(np.asarray(vocab))  # vocab must be written sorted
+    rank = np.empty(len(vocab), dtype=np.int64)
+    rank[order] = np.arange(len(vocab))
+
+    terms = rank[word_ids].ravel()
+    docs = np.repeat(np.arange(n_docs, dtype=np.int64), n_words)
+    pairs, tfs = np.unique(terms * n_docs + docs, return_counts=True)
+    term_of_pair = pairs // n_docs
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.uint64)
+    np.cumsum(np.bincount(term_of_pair, minlength=len(vocab)), out=term_offsets[1:])
+    write_lexical_index(
+        path,
+        [vocab[i] for i in order],
+        term_offsets,
+        pairs % n_docs,
+        np.minimum(tfs, np.iinfo(np.uint16).max),
+        np.full(n_docs, n_words, dtype=np.uint32),
+    )
+
+
+def build_corpus(corpus_dir: Path, size: int, dim: int, index_type: str) -> Dict:
+    meta = {"size": size, "dim": dim, "index_type": index_type, "seed": SEED, "words_per_chunk": WORDS_PER_CHUNK}
+    meta_path = corpus_dir / CORPUS_META
+    if meta_path.exists() and json.loads(meta_path.read_text()).get("corpus") == meta:
+        return json.loads(meta_path.read_text())
+
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    corpus_dir.mkdir(parents=True)
+    paths = corpus_paths(corpus_dir)
+    rng = np.random.default_rng(SEED + size)
+    vocab = vocabulary()
+    started = time.perf_counter()
+
+    word_ids = rng.choice(len(vocab), size=(size, WORDS_PER_CHUNK), p=_word_probs(len(vocab))).astype(np.int32)
+    words = np.asarray(vocab, dtype=object)
+    records = (
+        {
+            "text": " ".join(words[row]),
+            "doc_name": f"doc_{i // CHUNKS_PER_DOC:06d}.pdf",
+            "page": i % CHUNKS_PER_DOC + 1,
+            "subject": f"SUBJ{i % 7}",
+            "category": "Theory",
+            "semester": "1",
+        }
+        for i, row in enumerate(word_ids)
+    )
+    write_chunk_store(paths["store"], records)
+    _write_bm25(paths["bm25"], word_ids, vocab)
+    del word_ids
+
+    if index_type == "flat":
+        # Add in blocks so only the index holds the full matrix.
+        index, params = faiss.IndexFlatL2(dim), {"kind": "flat", "factory": "Flat"}
+        for start in range(0, size, 100_000):
+            index.add(rng.standard_normal((min(100_000, size - start), dim), dtype=np.float32))
+    else:
+        index, params = build_index(rng.standard_normal((size, dim), dtype=np.float32), index_type)
+    faiss.write_index(index, str(paths["index"]))
+    write_index_meta(
+        paths["index"],
+        {"index": params, "dim": dim, "ntotal": int(index.ntotal), "metric": "l2", "ids": "position"},
+    )
+
+    info = {
+        "corpus": meta,
+        "build_seconds": round(time.perf_counter() - started, 3),
+        "files_bytes": {name: p.stat().st_size for name, p in paths.items() if p.exists()},
+    }
+    meta_path.write_text(json.dumps(info, indent=2))
+    return info
+
+
+def make_queries(count: int) -> List[str]:
+    # 2-5 mid-frequency words, so BM25 has real postings lists to score.
+    rng = np.random.default_rng(SEED)
+    vocab = vocabulary()
+    return [" ".join(vocab[i] for i in rng.integers(20, 5_000, rng.integers(2, 6))) for _ in range(count)]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # ru_maxrss is KiB on Linux, bytes on macOS; peak rather than current.
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def _percentiles_ms(samples: List[float]) -> Dict:
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+    }
+
+
+def measure(corpus_dir: Path, dim: int, modes: List[str], queries: int, threads: List[int], top_k: int) -> Dict:
+    paths = corpus_paths(corpus_dir)
+    retriever = Retriever(
+        Embedder(StubClient(dim=dim)),
+        index_path=str(paths["index"]),
+        chunks_path=str(paths["chunks"]),
+    )
+    qs = make_queries(queries)
+
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    retriever.retrieve(qs[0], top_k=top_k, mode="lexical")  # first call loads the index
+    first_call = time.perf_counter() - started
+    rss_after = rss_bytes()
+    entry = retriever.registry.stats()["entries"][0]
+
+    result = {
+        "load": {
+            "load_seconds": entry["load_seconds"],
+            "first_query_seconds": round(first_call, 4),
+            "rss_before_bytes": rss_before,
+            "rss_after_bytes": rss_after,
+            "rss_delta_bytes": rss_after - rss_before,
+            "estimated_resident_bytes": entry["resident_bytes"],
+        },
+        "modes": {},
+    }
+
+    for mode in modes:
+        for q in qs[:5]:
+            retriever.retrieve(q, top_k=top_k, mode=mode)  # warm-up
+        latencies = []
+        for q in qs:
+            t0 = time.perf_counter()
+            retriever.retrieve(q, top_k=top_k, mode=mode)
+            latencies.append(time.perf_counter() - t0)
+
+        throughput = {}
+        for n in threads:
+            with ThreadPoolExecutor(max_workers=n) as pool:
+                t0 = time.perf_counter()
+                list(pool.map(lambda q: retriever.retrieve(q, top_k=top_k, mode=mode), qs))
+                elapsed = time.perf_counter() - t0
+            throughput[str(n)] = round(len(qs) / elapsed, 2)
+
+        result["modes"][mode] = {
+            "queries": len(qs),
+            "latency": _percentiles_ms(latencies),
+            "throughput_qps": throughput,
+        }
+    result["rss_end_bytes"] = rss_bytes()
+    return result
+
+
+def environment() -> Dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "faiss": getattr(faiss, "__version__", "?"),
+        "faiss_threads": faiss.omp_get_max_threads(),
+        "numpy": np.__version__,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Retriever.retrieve on synthetic corpora")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated corpus sizes, e.g. 10k,100k,1M")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--index-type", default="flat", choices=INDEX_KINDS)
+    parser.add_argument("--modes", default=",".join(RETRIEVAL_MODES))
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Queries per mode")
+    parser.add_argument("--threads", default=DEFAULT_THREADS, help="Thread counts for the throughput runs")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--workdir", type=Path, help="Keep corpora here and reuse them (default: temp dir)")
+    parser.add_argument("--output", type=Path, help="Also write the JSON report here")
+    parser.add_argument("--measure", type=Path, help=argparse.SUPPRESS)  # internal: corpus dir
+    parser.add_argument("--result-file", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    modes = [m for m in args.modes.split(",") if m]
+    threads = [int(t) for t in args.threads.split(",") if t]
+
+    if args.measure:
+        result = measure(args.measure, args.dim, modes, args.queries, threads, args.top_k)
+        args.result_file.write_text(json.dumps(result))
+        return
+
+    workdir: Optional[Path] = args.workdir
+    temp = workdir is None
+    if temp:
+        workdir = Path(tempfile.mkdtemp(prefix="retrieval-bench-"))
+
+    report = {
+        "benchmark": "retrieval",
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": {
+            "dim": args.dim,
+            "index_type": args.index_type,
+            "modes": modes,
+            "queries": args.queries,
+            "threads": threads,
+            "top_k": args.top_k,
+            "words_per_chunk": WORDS_PER_CHUNK,
+            "vocab_size": VOCAB_SIZE,
+        },
+        "results": [],
+    }
+    try:
+        for size_text in args.sizes.split(","):
+            size = parse_size(size_text)
+            corpus_dir = workdir / f"{size}-{args.dim}-{args.index_type}"
+            print(f"[{size_text}] building corpus in {corpus_dir}", file=sys.stderr)
+            corpus = build_corpus(corpus_dir, size, args.dim, args.index_type)
+
+            print(f"[{size_text}] measuring", file=sys.stderr)
+            result_file = corpus_dir / "result.json"
+            cmd = [
+                sys.executable, "-m", "benchmarks.retrieval",
+                "--measure", str(corpus_dir), "--result-file", str(result_file),
+                "--dim", str(args.dim), "--modes", ",".join(modes), "--queries", str(args.queries),
+                "--threads", ",".join(map(str, threads)), "--top-k", str(args.top_k),
+            ]
+            # Retriever logs to stdout; keep ours for the report.
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, cwd=Path(__file__).resolve().parent.parent)
+            report["results"].append({"size": size, **corpus, **json.loads(result_file.read_text())})
+    finally:
+        if temp:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Dict, List
+
+# The app reads these at import time; the stub client never uses the key.
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.stubs import StubClient
+from main import create_app
+
+
+# Compares time-to-first-byte of /ask (JSON, whole answer at once) with
+# /ask/stream (SSE: sources first, then tokens) against a local stub model.
+#
+#   cd aiml && python -m benchmarks.stream_ttfb --runs 5 --first-token 0.5 --token 0.02
+
+
+def _measure(client, path: str, body: Dict, headers: Dict) -> Dict:
+    start = time.perf_counter()
+    resp = client.post(path, json=body, headers=headers, buffered=False)
+    ttfb = None
+    size = 0
+    for chunk in resp.response:
+        if chunk and ttfb is None:
+            ttfb = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    resp.close()
+    return {"status": resp.status_code, "ttfb_s": ttfb, "total_s": total, "bytes": size}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure /ask vs /ask/stream TTFB with a stub model")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--first-token", type=float, default=0.5, help="Stub model latency to first token (s)")
+    parser.add_argument("--token", type=float, default=0.02, help="Stub model latency per token (s)")
+    parser.add_argument("--tokens", type=int, default=200, help="Answer length in tokens")
+    args = parser.parse_args()
+
+    stub = StubClient(first_token_latency=args.first_token, token_latency=args.token, answer_tokens=args.tokens)
+    app = create_app(client=stub)
+    with app.app_context():
+        token = create_access_token(identity="bench@example.com", additional_claims={"role": "student"})
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {"question": "explain drift velocity", "course": "FY", "semester": "Sem-1", "sessionId": "bench"}
+
+    results: Dict[str, List[Dict]] = {"/ask": [], "/ask/stream": []}
+    with app.test_client() as client:
+        for _ in range(args.runs):
+            for path in results:
+                results[path].append(_measure(client, path, body, headers))
+
+    report = {
+        "stub": {"first_token_s": args.first_token, "token_s": args.token, "tokens": args.tokens},
+        "runs": args.runs,
+        "endpoints": {
+            path: {
+                "ttfb_p50_s": statistics.median(r["ttfb_s"] for r in runs),
+                "total_p50_s": statistics.median(r["total_s"] for r in runs),
+                "status": sorted({r["status"] for r in runs}),
+            }
+            for path, runs in results.items()
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
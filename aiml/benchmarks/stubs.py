@@ -0,0 +1,76 @@
+import hashlib
+import time
+from types import SimpleNamespace
+from typing import Iterator, List, Union
+
+import numpy as np
+
+
+# Local stand-ins for the Gemini client so benchmarks run without network access.
+# Shapes mirror the google-genai responses the app reads:
+# - embed_content(...).embeddings[i].values
+# - generate_content(...).text / .usage_metadata
+# - generate_content_stream(...) -> chunks with .text
+
+DEFAULT_STUB_DIM = 768
+
+
+def stub_vector(text: str, dim: int = DEFAULT_STUB_DIM) -> np.ndarray:
+    # Deterministic pseudo-embedding: same text -> same unit vector, on any machine.
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype("float32")
+    return vec / np.linalg.norm(vec)
+
+
+class StubModels:
+    def __init__(
+        self,
+        dim: int = DEFAULT_STUB_DIM,
+        embed_latency: float = 0.0,
+        first_token_latency: float = 0.5,
+        token_latency: float = 0.02,
+        answer_tokens: int = 200,
+    ):
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.embed_calls = 0
+        self.generate_calls = 0
+
+    def embed_content(self, model: str, contents: Union[str, List[str]], config=None):
+        self.embed_calls += 1
+        if self.embed_latency:
+            time.sleep(self.embed_latency)
+        texts = [contents] if isinstance(contents, str) else list(contents)
+        dim = getattr(config, "output_dimensionality", None) or self.dim
+        return SimpleNamespace(
+            embeddings=[SimpleNamespace(values=stub_vector(t, self.dim)[:dim].tolist()) for t in texts]
+        )
+
+    def _tokens(self) -> List[str]:
+        return [f"tok{i} " for i in range(self.answer_tokens)]
+
+    def _response(self) -> SimpleNamespace:
+        return SimpleNamespace(
+            text="".join(self._tokens()),
+            usage_metadata=SimpleNamespace(prompt_token_count=0, candidates_token_count=self.answer_tokens),
+        )
+
+    def generate_content(self, model: str, contents, config=None):
+        self.generate_calls += 1
+        time.sleep(self.first_token_latency + self.token_latency * self.answer_tokens)
+        return self._response()
+
+    def generate_content_stream(self, model: str, contents, config=None) -> Iterator[SimpleNamespace]:
+        self.generate_calls += 1
+        time.sleep(self.first_token_latency)
+        for tok in self._tokens():
+            time.sleep(self.token_latency)
+            yield SimpleNamespace(text=tok)
+
+
+class StubClient:
+    def __init__(self, **kwargs):
+        self.models = StubModels(**kwargs)
@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+# Compact, read-only chunk metadata store aligned with FAISS row ids.
+#
+# File layout:
+#   MAGIC | uint64 header length | JSON header | arrays...
+# - every non-text field is an interned column: a value table in the header
+#   plus one uint32 code per chunk (MISSING_CODE when the key is absent)
+# - all texts live in one contiguous blob addressed by a uint64 offsets array;
+#   with compression, texts are zlib-compressed in blocks of `block_size` chunks
+# - chunk_id (unique per chunk, so pointless to intern) is an int64 array,
+#   NO_CHUNK_ID where a record has none
+# Arrays are memory-mapped, so opening a store costs only the header.
+
+MAGIC = b"CKSTORE1"
+STORE_SUFFIX = ".store"
+MISSING_CODE = np.iinfo(np.uint32).max
+NO_CHUNK_ID = -1
+DEFAULT_BLOCK_SIZE = 64
+DEFAULT_COMPRESSION = "zlib"
+
+# Decompressed text blocks kept per open store.
+BLOCK_CACHE_SIZE = 32
+
+
+def store_path_for(chunks_path: Path) -> Path:
+    # data/FY/Sem-1/FY_Sem-1_chunks.jsonl -> data/FY/Sem-1/FY_Sem-1_chunks.store
+    return Path(chunks_path).with_suffix(STORE_SUFFIX)
+
+
+def _align(n: int, to: int = 8) -> int:
+    return (n + to - 1) // to * to
+
+
+def write_chunk_store(
+    path: Path,
+    records: Iterable[Dict],
+    compression: Optional[str] = DEFAULT_COMPRESSION,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> int:
+    if compression not in (None, "zlib"):
+        raise ValueError(f"Unsupported chunk store compression: {compression}")
+
+    texts: List[bytes] = []
+    chunk_ids: List[int] = []
+    value_tables: Dict[str, List] = {}
+    value_codes: Dict[str, Dict[str, int]] = {}
+    codes: Dict[str, List[int]] = {}
+
+    for i, record in enumerate(records):
+        texts.append((record.get("text") or "").encode("utf-8"))
+        chunk_ids.append(record.get("chunk_id", NO_CHUNK_ID))
+        for key, value in record.items():
+            if key in ("text", "chunk_id"):
+                continue
+            if key not in codes:
+                value_tables[key] = []
+                value_codes[key] = {}
+                codes[key] = [MISSING_CODE] * i
+            # JSON-encode for the intern key so 1 and "1" stay distinct.
+            interned = json.dumps(value, ensure_ascii=False, sort_keys=True)
+            code = value_codes[key].get(interned)
+            if code is None:
+                code = len(value_tables[key])
+                value_codes[key][interned] = code
+                value_tables[key].append(value)
+            codes[key].append(code)
+        for key in codes:
+            if len(codes[key]) < i + 1:
+                codes[key].append(MISSING_CODE)
+
+    count = len(texts)
+    text_offsets = np.zeros(count + 1, dtype=np.uint64)
+    if count:
+        text_offsets[1:] = np.cumsum([len(t) for t in texts], dtype=np.uint64)
+
+    if compression == "zlib":
+        blocks = [
+            zlib.compress(b"".join(texts[start:start + block_size]), 6)
+            for start in range(0, count, block_size)
+        ]
+        block_offsets = np.zeros(len(blocks) + 1, dtype=np.uint64)
+        if blocks:
+            block_offsets[1:] = np.cumsum([len(b) for b in blocks], dtype=np.uint64)
+        blob = b"".join(blocks)
+    else:
+        block_offsets = np.zeros(0, dtype=np.uint64)
+        blob = b"".join(texts)
+
+    arrays = {"text_offsets": text_offsets, "block_offsets": block_offsets}
+    if any(cid != NO_CHUNK_ID for cid in chunk_ids):
+        arrays["chunk_ids"] = np.asarray(chunk_ids, dtype=np.int64)
+    for key, column in codes.items():
+        arrays[f"col:{key}"] = np.asarray(column, dtype=np.uint32)
+
+    # Arrays follow the header, each 8-byte aligned.
+    layout: Dict[str, Dict] = {}
+    header: Dict = {
+        "version": 1,
+        "count": count,
+        "compression": compression,
+        "block_size": block_size,
+        "columns": value_tables,
+        "arrays": layout,
+        "blob": {},
+    }
+    # Offsets depend on the header size and vice versa: reserve space and grow until it fits.
+    reserved = 4096
+    while True:
+        pos = _align(len(MAGIC) + 8 + reserved)
+        for name, arr in arrays.items():
+            layout[name] = {"offset": pos, "dtype": arr.dtype.str, "length": int(arr.shape[0])}
+            pos = _align(pos + arr.nbytes)
+        header["blob"] = {"offset": pos, "length": len(blob)}
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        if len(header_bytes) <= reserved:
+            header_bytes += b" " * (reserved - len(header_bytes))
+            break
+        reserved = _align(len(header_bytes) + 1024)
+
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(layout[name]["offset"])
+            f.write(arr.tobytes())
+        f.seek(header["blob"]["offset"])
+        f.write(blob)
+    os.replace(tmp, path)
+    return count
+
+
+class ChunkStore:
+    # Sequence-like view: len(store), store[faiss_id] -> dict (same shape as a
+    # chunks.jsonl record). Only the requested records are materialized.
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a chunk store file: {self.path}")
+            header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            self.header = json.loads(f.read(header_len).decode("utf-8"))
+        self._header_len = header_len
+
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode="r")
+        self.count = int(self.header["count"])
+        self.compression = self.header["compression"]
+        self.block_size = int(self.header["block_size"])
+        self._values: Dict[str, List] = self.header["columns"]
+
+        self._text_offsets = self._array("text_offsets")
+        self._block_offsets = self._array("block_offsets")
+        self._codes = {key: self._array(f"col:{key}") for key in self._values}
+        self._chunk_ids = self._array("chunk_ids") if "chunk_ids" in self.header["arrays"] else None
+
+        blob = self.header["blob"]
+        self._blob = self._mm[blob["offset"]:blob["offset"] + blob["length"]]
+
+        self._blocks: "OrderedDict[int, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _array(self, name: str) -> np.ndarray:
+        spec = self.header["arrays"][name]
+        dtype = np.dtype(spec["dtype"])
+        start = spec["offset"]
+        return self._mm[start:start + spec["length"] * dtype.itemsize].view(dtype)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, idx: int) -> Dict:
+        return self.get(idx)
+
+    def _block(self, block_id: int) -> bytes:
+        with self._lock:
+            data = self._blocks.get(block_id)
+            if data is not None:
+                self._blocks.move_to_end(block_id)
+                return data
+
+        start, end = int(self._block_offsets[block_id]), int(self._block_offsets[block_id + 1])
+        data = zlib.decompress(self._blob[start:end].tobytes())
+
+        with self._lock:
+            self._blocks[block_id] = data
+            while len(self._blocks) > BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return data
+
+    def text(self, idx: int) -> str:
+        start, end = int(self._text_offsets[idx]), int(self._text_offsets[idx + 1])
+        if self.compression == "zlib":
+            block_id = idx // self.block_size
+            base = int(self._text_offsets[block_id * self.block_size])
+            return self._block(block_id)[start - base:end - base].decode("utf-8")
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def get(self, idx: int) -> Dict:
+        idx = int(idx)
+        if idx < 0 or idx >= self.count:
+            raise IndexError(f"chunk id {idx} out of range (0..{self.count - 1})")
+
+        record: Dict = {"text": self.text(idx)}
+        for key, column in self._codes.items():
+            code = int(column[idx])
+            if code != MISSING_CODE:
+                record[key] = self._values[key][code]
+        if self._chunk_ids is not None and self._chunk_ids[idx] != NO_CHUNK_ID:
+            record["chunk_id"] = int(self._chunk_ids[idx])
+        return record
+
+    def column(self, key: str) -> List:
+        # One field for every record (None where missing), without touching texts.
+        if key == "chunk_id":
+            ids = self._chunk_ids
+            return [None] * self.count if ids is None else [None if i == NO_CHUNK_ID else int(i) for i in ids]
+        codes = self._codes.get(key)
+        if codes is None:
+            return [None] * self.count
+        values = self._values[key]
+        return [None if code == MISSING_CODE else values[code] for code in codes.tolist()]
+
+    def matches(self, key: str, values: Iterable[str]) -> np.ndarray:
+        # Boolean mask of records whose `key` is one of `values` (case-insensitive),
+        # computed on the interned codes without decoding any record.
+        codes = self._codes.get(key)
+        if codes is None:
+            return np.zeros(self.count, dtype=bool)
+        wanted = {str(v).casefold() for v in values}
+        hits = [code for code, value in enumerate(self._values[key]) if str(value).casefold() in wanted]
+        return np.isin(codes, np.asarray(hits, dtype=codes.dtype))
+
+    def chunk_ids(self) -> Optional[np.ndarray]:
+        # int64 chunk id per record (memory-mapped), or None for stores built
+        # from chunks without ids.
+        return self._chunk_ids
+
+    def resident_bytes(self) -> int:
+        # Header tables + code/offset arrays + decompressed block cache.
+        # The compressed text blob stays in the OS page cache.
+        arrays = self._text_offsets.nbytes + self._block_offsets.nbytes
+        arrays += sum(c.nbytes for c in self._codes.values())
+        if self._chunk_ids is not None:
+            arrays += self._chunk_ids.nbytes
+        with self._lock:
+            blocks = sum(len(b) for b in self._blocks.values())
+        return self._header_len + arrays + blocks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a chunk store from a chunks.jsonl file")
+    parser.add_argument("chunks_jsonl", type=Path)
+    parser.add_argument("--out", type=Path, default=None, help="Output path (default: <chunks>.store)")
+    parser.add_argument("--no-compress", action="store_true", help="Store texts uncompressed")
+    args = parser.parse_args()
+
+    def records() -> Iterable[Dict]:
+        # Same filter as Ingestor: only chunks with text get a FAISS row.
+        with open(args.chunks_jsonl, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if record.get("text"):
+                    yield record
+
+    out = args.out or store_path_for(args.chunks_jsonl)
+    count = write_chunk_store(out, records(), compression=None if args.no_compress else DEFAULT_COMPRESSION)
+    print(f"Wrote {count} chunks to {out} ({out.stat().st_size / 1e6:.2f} MB, "
+          f"jsonl was {args.chunks_jsonl.stat().st_size / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
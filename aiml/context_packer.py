@@ -0,0 +1,184 @@
+import os
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from embedder import APPROX_CHARS_PER_TOKEN, estimate_tokens
+from metrics import REGISTRY
+
+
+# Builds the RAG context from a wider set of retrieved chunks, so the prompt
+# size stays predictable whatever the index returns:
+# 1. chunks of the same document that overlap (the chunker repeats the last
+#    CHUNK_OVERLAP words of a window at the start of the next) or sit on the
+#    same/adjacent pages are merged into one passage, without the repeat
+# 2. passages are picked in MMR order: relevance, minus similarity (word
+#    overlap) to the passages already picked, so near-repeats lose out
+# 3. passages that don't fit the token budget are skipped; the first one
+#    that doesn't fit is cut at a word boundary instead if enough room is
+#    left to be useful, which ends the packing
+DEFAULT_BUDGET_TOKENS = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+DEFAULT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "12"))
+DEFAULT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+# ingestion/chunker.py CHUNK_OVERLAP; shorter runs aren't treated as overlap.
+MAX_OVERLAP_WORDS = 50
+MIN_OVERLAP_WORDS = 5
+
+# Don't bother including a truncated passage smaller than this.
+MIN_TRUNCATED_TOKENS = 80
+
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "aiml_context_tokens",
+    "Estimated tokens of packed RAG context per prompt",
+    buckets=(250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000),
+)
+
+
+def _doc_key(chunk: Dict) -> Tuple:
+    return chunk.get("scope"), chunk.get("source_path") or chunk.get("doc_name")
+
+
+def _page_range(chunk: Dict) -> Optional[Tuple[int, int]]:
+    page = chunk.get("page")
+    if not isinstance(page, int):
+        return None
+    end = chunk.get("page_end")
+    return page, end if isinstance(end, int) else page
+
+
+def _overlap(head: List[str], tail: List[str]) -> int:
+    # Longest k with head[-k:] == tail[:k] (MIN_OVERLAP_WORDS..MAX_OVERLAP_WORDS), else 0.
+    for k in range(min(MAX_OVERLAP_WORDS, len(head), len(tail)), MIN_OVERLAP_WORDS - 1, -1):
+        if head[-k:] == tail[:k]:
+            return k
+    return 0
+
+
+class _Passage:
+    def __init__(self, chunk: Dict):
+        self.chunk = chunk
+        self.words = chunk.get("text", "").split()
+        self.pages = _page_range(chunk)
+        self.relevance = float(chunk.get("relevance", 0.0))
+
+    def join(self, other: "_Passage") -> bool:
+        # Absorb `other` (same document) if it overlaps or is on the same or an
+        # adjacent page. Text is kept in reading order.
+        first, second = (self, other)
+        k = _overlap(self.words, other.words)
+        if not k:
+            k = _overlap(other.words, self.words)
+            if k:
+                first, second = other, self
+            elif self.pages is None or other.pages is None:
+                return False
+            elif other.pages[0] > self.pages[1] + 1 or self.pages[0] > other.pages[1] + 1:
+                return False
+            elif other.pages[0] < self.pages[0]:
+                first, second = other, self
+
+        best = self.chunk if self.relevance >= other.relevance else other.chunk
+        self.words = first.words + second.words[k:]
+        if self.pages is not None and other.pages is not None:
+            self.pages = (min(self.pages[0], other.pages[0]), max(self.pages[1], other.pages[1]))
+        self.relevance = max(self.relevance, other.relevance)
+        self.chunk = best
+        return True
+
+    def to_chunk(self, words: Optional[List[str]] = None) -> Dict:
+        chunk = {**self.chunk, "text": " ".join(words if words is not None else self.words), "relevance": self.relevance}
+        if self.pages is not None:
+            chunk["page"] = self.pages[0]
+            if self.pages[1] != self.pages[0]:
+                chunk["page_end"] = self.pages[1]
+            else:
+                chunk.pop("page_end", None)
+        return chunk
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextPacker:
+    def __init__(
+        self,
+        budget_tokens: int = DEFAULT_BUDGET_TOKENS,
+        candidates: int = DEFAULT_CANDIDATES,
+        mmr_lambda: float = DEFAULT_MMR_LAMBDA,
+    ):
+        self.budget_tokens = budget_tokens
+        # How many chunks to retrieve for packing (vs. the 3 used unpacked).
+        self.candidates = max(1, candidates)
+        self.mmr_lambda = mmr_lambda
+
+    def merge(self, chunks: Sequence[Dict]) -> List[_Passage]:
+        # Chunks are best first; a merged passage sits where its best chunk was.
+        passages: List[_Passage] = []
+        for chunk in chunks:
+            passage = _Passage(chunk)
+            if not passage.words:
+                continue
+            for existing in passages:
+                if _doc_key(existing.chunk) == _doc_key(chunk) and existing.join(passage):
+                    break
+            else:
+                passages.append(passage)
+
+        # A merge can bridge two passages that were separate before.
+        merged = True
+        while merged:
+            merged = False
+            for i, a in enumerate(passages):
+                for j in range(i + 1, len(passages)):
+                    if _doc_key(a.chunk) == _doc_key(passages[j].chunk) and a.join(passages[j]):
+                        del passages[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return passages
+
+    def pack(self, chunks: Sequence[Dict]) -> List[Dict]:
+        # Retrieved chunks (best first, with "relevance") -> passages for the
+        # prompt, in MMR order, within budget_tokens.
+        passages = self.merge(chunks)
+        vocab = [set(w.lower() for w in p.words) for p in passages]
+        remaining = list(range(len(passages)))
+        picked: List[int] = []
+        packed: List[Dict] = []
+        budget = self.budget_tokens
+        used = 0
+
+        while remaining and used < budget:
+            def mmr(i: int) -> float:
+                redundancy = max((_jaccard(vocab[i], vocab[j]) for j in picked), default=0.0)
+                return self.mmr_lambda * passages[i].relevance - (1 - self.mmr_lambda) * redundancy
+
+            best = max(remaining, key=mmr)
+            remaining.remove(best)
+            picked.append(best)
+
+            passage = passages[best]
+            tokens = estimate_tokens(" ".join(passage.words))
+            if used + tokens <= budget:
+                packed.append(passage.to_chunk())
+                used += tokens
+                continue
+            room = budget - used
+            if room >= MIN_TRUNCATED_TOKENS:
+                max_chars = room * APPROX_CHARS_PER_TOKEN
+                words: List[str] = []
+                chars = 0
+                for word in passage.words:
+                    chars += len(word) + 1
+                    if chars > max_chars:
+                        break
+                    words.append(word)
+                packed.append(passage.to_chunk(words + ["…"]))
+                used += estimate_tokens(" ".join(words))
+                break
+
+        CONTEXT_TOKENS.observe(used)
+        return packed
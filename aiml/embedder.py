@@ -1,12 +1,41 @@
 import os
-from typing import Any, Optional
+import re
+import zlib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 import numpy as np
 from google import genai
+from google.genai import types
 
 
 DEFAULT_EMBED_MODEL = "gemini-embedding-001"
 
+# Embedding backends (see create_embedder):
+# - gemini:  remote embed_content calls (network round trip, API quota)
+# - hashing: in-process feature hashing of words, word bigrams and character
+#            trigrams into `dim` buckets; no network, no model download
+# The backend, model and dim an index was built with are written to its meta
+# and checked when it is loaded or extended.
+EMBED_BACKENDS = ("gemini", "hashing")
+DEFAULT_EMBED_BACKEND = os.getenv("EMBED_BACKEND", "gemini")
+DEFAULT_HASHING_DIM = int(os.getenv("HASHING_EMBED_DIM", "768"))
+
+# gemini-embedding-001 returns 3072 dims. A smaller output_dimensionality
+# (Matryoshka truncation: 1536, 768, 256, ...) gives a 2-12x smaller index and
+# faster scans; the truncated vectors are L2-normalised and indexed by inner
+# product. Empty = full size, as in indexes built before this setting.
+DEFAULT_GEMINI_DIM = int(os.getenv("GEMINI_EMBED_DIM") or 0) or None
+
+# Limits for a single batched embed_content call. The API accepts up to 100
+# contents per request; the token cap keeps large chunks from hitting payload limits.
+MAX_TEXTS_PER_REQUEST = 100
+MAX_TOKENS_PER_REQUEST = 20000
+
+# Rough token estimate used only for request splitting (no tokenizer round trip).
+APPROX_CHARS_PER_TOKEN = 4
+
 
 def create_gemini_client() -> Any:
     api_key = os.getenv("GEMINI_API_KEY")
@@ -15,27 +44,299 @@ def create_gemini_client() -> Any:
     return genai.Client(api_key=api_key)
 
 
-class Embedder:
-    def __init__(self, client: Optional[Any] = None, model: str = DEFAULT_EMBED_MODEL):
-        self.client = client or create_gemini_client()
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // APPROX_CHARS_PER_TOKEN)
+
+
+def split_batches(
+    texts: Sequence[str],
+    max_texts: int = MAX_TEXTS_PER_REQUEST,
+    max_tokens: int = MAX_TOKENS_PER_REQUEST,
+) -> Iterator[Tuple[int, int]]:
+    # Yield [start, end) ranges over `texts`, each small enough for one request.
+    # A single text larger than max_tokens still gets its own batch (the API truncates it).
+    start = 0
+    batch_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if i > start and (i - start >= max_texts or batch_tokens + tokens > max_tokens):
+            yield start, i
+            start = i
+            batch_tokens = 0
+        batch_tokens += tokens
+    if start < len(texts):
+        yield start, len(texts)
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    # 429 / RESOURCE_EXHAUSTED from google-genai (ClientError) or google-api-core.
+    if getattr(exc, "code", None) == 429:
+        return True
+    msg = str(exc)
+    return (
+        ("429" in msg)
+        or ("RESOURCE_EXHAUSTED" in msg)
+        or ("rate" in msg.lower() and "limit" in msg.lower())
+        or ("quota" in msg.lower() and "exceed" in msg.lower())
+    )
+
+
+def _embedding_values(embedding: Any) -> List[float]:
+    if hasattr(embedding, "values"):
+        return embedding.values
+    if hasattr(embedding, "embedding"):
+        return embedding.embedding
+    raise AttributeError("Unexpected embedding object shape in response.embeddings")
+
+
+class EmbeddingMismatch(ValueError):
+    pass
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+class EmbeddingBackend(ABC):
+    # What ingestion and retrieval need from an embedding model. Subclasses
+    # implement embed_texts(); the rest has working defaults.
+    backend = ""
+    # Remote backends go through the ingestion rate limiter and embedding store.
+    remote = True
+    # Unit-length output: indexes are built with the inner-product metric.
+    normalized = False
+
+    def __init__(
+        self,
+        model: str,
+        max_texts_per_request: int,
+        max_tokens_per_request: int,
+        dim: Optional[int] = None,
+        vector_key: Optional[str] = None,
+    ):
         self.model = model
+        self.max_texts_per_request = max_texts_per_request
+        self.max_tokens_per_request = max_tokens_per_request
+        # None until known (Gemini returns the model's native size).
+        self.dim = dim
+        # Key for cached vectors (query cache, embedding store); differs
+        # whenever the vectors would, e.g. per output dimensionality.
+        self.vector_key = vector_key or model
+
+    @property
+    def metric(self) -> str:
+        return "ip" if self.normalized else "l2"
+
+    def batches(self, texts: Sequence[str]) -> Iterator[Tuple[int, int]]:
+        return split_batches(texts, self.max_texts_per_request, self.max_tokens_per_request)
 
     def embed_text(self, text: str) -> np.ndarray:
-        response = self.client.models.embed_content(model=self.model, contents=text)
+        return self.embed_texts([text])[0]
+
+    @abstractmethod
+    def embed_texts(self, texts: Sequence[str]) -> np.ndarray:
+        # (len(texts), dim) float32, in input order.
+        ...
+
+    def meta(self) -> Dict:
+        # Written to the index meta next to "dim".
+        return {"embed_backend": self.backend, "embed_model": self.model, "embed_key": self.vector_key}
+
+    def check_index(self, meta: Dict, index_dim: int) -> None:
+        # Raises EmbeddingMismatch if vectors from this embedder can't be
+        # searched against (or added to) an index built with `meta`.
+        # Indexes from before backends were recorded are Gemini indexes.
+        backend = meta.get("embed_backend", "gemini")
+        key = meta.get("embed_key") or meta.get("embed_model", self.model if backend == self.backend else None)
+        if (backend, key) != (self.backend, self.vector_key):
+            raise EmbeddingMismatch(
+                f"index was built with {backend}/{key}, this embedder is {self.backend}/{self.vector_key}"
+            )
+        if meta.get("dim") not in (None, index_dim):
+            raise EmbeddingMismatch(f"index dim {index_dim} != dim {meta['dim']} recorded in its meta")
+        if self.dim is not None and index_dim != self.dim:
+            raise EmbeddingMismatch(f"index dim {index_dim} != {self.backend}/{self.model} dim {self.dim}")
+
+
+class Embedder(EmbeddingBackend):
+    # Gemini embed_content backend.
+    backend = "gemini"
+
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        model: str = DEFAULT_EMBED_MODEL,
+        max_texts_per_request: int = MAX_TEXTS_PER_REQUEST,
+        max_tokens_per_request: int = MAX_TOKENS_PER_REQUEST,
+        output_dimensionality: Optional[int] = DEFAULT_GEMINI_DIM,
+    ):
+        super().__init__(
+            model,
+            max_texts_per_request,
+            max_tokens_per_request,
+            dim=output_dimensionality,
+            vector_key=f"{model}@{output_dimensionality}" if output_dimensionality else model,
+        )
+        self.client = client or create_gemini_client()
+        self.output_dimensionality = output_dimensionality
+        # Only full-size Gemini vectors come back unit length.
+        self.normalized = output_dimensionality is not None
+        self._config = (
+            types.EmbedContentConfig(output_dimensionality=output_dimensionality) if output_dimensionality else None
+        )
+
+    def meta(self) -> Dict:
+        meta = super().meta()
+        if self.output_dimensionality:
+            meta["embed_output_dim"] = self.output_dimensionality
+        return meta
+
+    def _embed_content(self, contents):
+        if self._config is None:
+            return self.client.models.embed_content(model=self.model, contents=contents)
+        return self.client.models.embed_content(model=self.model, contents=contents, config=self._config)
+
+    def embed_text(self, text: str) -> np.ndarray:
+        response = self._embed_content(text)
         # SDK response shapes vary by version:
         # - older: response.embedding -> list[float]
         # - newer: response.embeddings -> list[Embedding], each with `.values`
         if hasattr(response, "embedding"):
             values = response.embedding
         elif hasattr(response, "embeddings") and response.embeddings:
-            first = response.embeddings[0]
-            if hasattr(first, "values"):
-                values = first.values
-            elif hasattr(first, "embedding"):
-                values = first.embedding
-            else:
-                raise AttributeError("Unexpected embedding object shape in response.embeddings[0]")
+            values = _embedding_values(response.embeddings[0])
         else:
             raise AttributeError("EmbedContentResponse has no 'embedding' or 'embeddings' data")
 
-        return np.array(values, dtype="float32")
+        vec = np.array(values, dtype="float32")
+        return _normalize_rows(vec.reshape(1, -1))[0] if self.normalized else vec
+
+    def embed_texts(self, texts: Sequence[str]) -> np.ndarray:
+        # Returns an (N, D) float32 matrix in the same order as `texts`.
+        # Issues one embed_content call per batch from `batches()`.
+        if not texts:
+            return np.empty((0, 0), dtype="float32")
+
+        rows: List[np.ndarray] = []
+        for start, end in self.batches(texts):
+            rows.append(self._embed_batch(list(texts[start:end])))
+        return np.vstack(rows)
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        response = self._embed_content(texts)
+        embeddings = getattr(response, "embeddings", None)
+        if not embeddings:
+            raise AttributeError("EmbedContentResponse has no 'embeddings' data for batch request")
+        if len(embeddings) != len(texts):
+            raise RuntimeError(
+                f"Embedding count mismatch: sent {len(texts)} texts, got {len(embeddings)} embeddings"
+            )
+        matrix = np.array([_embedding_values(e) for e in embeddings], dtype="float32")
+        return _normalize_rows(matrix) if self.normalized else matrix
+
+
+_WORD = re.compile(r"\w+")
+
+# Function words carry no topic and would make every pair of texts look similar.
+_STOPWORDS = frozenset(
+    "a an and are as at be by can for from has have in is it its of on or that the this "
+    "to was were which with will not but if then than so into also these those their there".split()
+)
+
+
+@lru_cache(maxsize=200_000)
+def _hashed_feature(feature: str, dim: int) -> Tuple[int, float]:
+    # Stable across processes (unlike hash()): bucket from the low bits, sign from the top one.
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % dim, (1.0 if h & 0x80000000 else -1.0)
+
+
+@lru_cache(maxsize=100_000)
+def _word_features(word: str, dim: int, char_ngram: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Buckets and signed weights for one word: the word itself plus its
+    # character n-grams (with boundary marks), which match inflected forms.
+    features = [(_hashed_feature("w:" + word, dim), 1.0)]
+    if char_ngram and len(word) > char_ngram:
+        padded = f"<{word}>"
+        grams = [padded[i : i + char_ngram] for i in range(len(padded) - char_ngram + 1)]
+        weight = 1.0 / len(grams)
+        features.extend((_hashed_feature("c:" + g, dim), weight) for g in grams)
+    buckets = np.fromiter((b for (b, _), _ in features), dtype=np.int64, count=len(features))
+    weights = np.fromiter((sign * w for (_, sign), w in features), dtype=np.float32, count=len(features))
+    return buckets, weights
+
+
+class HashingEmbedder(EmbeddingBackend):
+    # In-process CPU embeddings: signed feature hashing of words, adjacent word
+    # pairs and character n-grams, log-scaled and L2-normalised. Lexical rather
+    # than semantic, but stateless (no fitted vocabulary, so every index and
+    # query agree) and fast enough to embed a semester in seconds offline.
+    backend = "hashing"
+    remote = False
+    normalized = True
+
+    def __init__(self, dim: int = DEFAULT_HASHING_DIM, char_ngram: int = 3):
+        if dim <= 0:
+            raise ValueError(f"dim must be positive, got {dim}")
+        # No request limits; batches only bound memory.
+        super().__init__(f"hashing-v1-{dim}-c{char_ngram}", 1024, 1_000_000, dim=dim)
+        self.char_ngram = char_ngram
+
+    def _embed_one(self, text: str, out: np.ndarray) -> None:
+        words = [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+        if not words:
+            return
+        parts = [_word_features(w, self.dim, self.char_ngram) for w in words]
+        bigrams = [_hashed_feature(f"b:{a} {b}", self.dim) for a, b in zip(words, words[1:])]
+        if bigrams:
+            parts.append(
+                (
+                    np.fromiter((b for b, _ in bigrams), dtype=np.int64, count=len(bigrams)),
+                    np.fromiter((sign for _, sign in bigrams), dtype=np.float32, count=len(bigrams)),
+                )
+            )
+        np.add.at(out, np.concatenate([b for b, _ in parts]), np.concatenate([w for _, w in parts]))
+        # Sublinear term frequency: long chunks don't drown out rarer terms.
+        np.copyto(out, np.sign(out) * np.log1p(np.abs(out)))
+        norm = float(np.linalg.norm(out))
+        if norm > 0:
+            out /= norm
+
+    def embed_texts(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in zip(matrix, texts):
+            self._embed_one(text, row)
+        return matrix
+
+    def meta(self) -> Dict:
+        return {**super().meta(), "embed_char_ngram": self.char_ngram}
+
+
+def create_embedder(
+    backend: Optional[str] = None,
+    client: Optional[Any] = None,
+    dim: Optional[int] = None,
+) -> EmbeddingBackend:
+    # backend defaults to EMBED_BACKEND; dim defaults to GEMINI_EMBED_DIM /
+    # HASHING_EMBED_DIM for the respective backend.
+    backend = (backend or DEFAULT_EMBED_BACKEND).lower()
+    if backend == "gemini":
+        return Embedder(client, output_dimensionality=dim or DEFAULT_GEMINI_DIM)
+    if backend == "hashing":
+        return HashingEmbedder(dim or DEFAULT_HASHING_DIM)
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {EMBED_BACKENDS}")
+
+
+def embedder_for_meta(meta: Dict, client: Optional[Any] = None) -> EmbeddingBackend:
+    # The embedder an index was built with, from its meta.
+    backend = meta.get("embed_backend", "gemini")
+    if backend == "gemini":
+        return Embedder(
+            client,
+            model=meta.get("embed_model", DEFAULT_EMBED_MODEL),
+            output_dimensionality=meta.get("embed_output_dim"),
+        )
+    if backend == "hashing":
+        return HashingEmbedder(int(meta["dim"]), char_ngram=int(meta.get("embed_char_ngram", 3)))
+    raise EmbeddingMismatch(f"Unknown embedding backend {backend!r} in index meta")
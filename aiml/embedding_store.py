@@ -0,0 +1,165 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Content-addressed store of chunk embeddings, shared by ingestion runs.
+#
+# Directory layout:
+#   keys.sqlite        key -> (dim, row); key = blake2b(model, text)
+#   vectors-<dim>.f32  append-only float32 rows, memory-mapped for reads
+# A re-chunked corpus mostly repeats text that was embedded before, so
+# ingest.py only sends texts whose key is missing. Rows are written before
+# their keys are committed: a crash leaves at most unreferenced rows at the
+# end of a vectors file, never a key pointing at a half-written row.
+
+KEYS_DB = "keys.sqlite"
+VECTOR_DTYPE = np.dtype("float32")
+
+# sqlite's default limit on host parameters is 999 on older builds.
+LOOKUP_CHUNK = 900
+
+
+def embedding_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingStore:
+    # Safe to share across ingestion worker threads.
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._maps: Dict[int, np.memmap] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+
+        self._db = sqlite3.connect(str(self.root / KEYS_DB), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " row INTEGER NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _vectors_path(self, dim: int) -> Path:
+        return self.root / f"vectors-{dim}.f32"
+
+    def _vectors(self, dim: int, min_rows: int) -> np.memmap:
+        # Re-map when the file has grown past the current mapping.
+        mm = self._maps.get(dim)
+        if mm is None or mm.shape[0] < min_rows:
+            path = self._vectors_path(dim)
+            rows = path.stat().st_size // (dim * VECTOR_DTYPE.itemsize)
+            mm = np.memmap(path, dtype=VECTOR_DTYPE, mode="r", shape=(rows, dim))
+            self._maps[dim] = mm
+        return mm
+
+    def _locate(self, keys: Sequence[bytes]) -> Dict[bytes, Tuple[int, int]]:
+        found: Dict[bytes, Tuple[int, int]] = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), LOOKUP_CHUNK):
+            part = unique[i:i + LOOKUP_CHUNK]
+            rows = self._db.execute(
+                f"SELECT key, dim, row FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update((key, (dim, row)) for key, dim, row in rows)
+        return found
+
+    def contains(self, model: str, texts: Sequence[str]) -> List[bool]:
+        keys = [embedding_key(model, t) for t in texts]
+        with self._lock:
+            found = self._locate(keys)
+        return [key in found for key in keys]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        # One vector (or None) per text, in order.
+        keys = [embedding_key(model, t) for t in texts]
+        out: List[Optional[np.ndarray]] = []
+        with self._lock:
+            found = self._locate(keys)
+            for key in keys:
+                loc = found.get(key)
+                if loc is None:
+                    out.append(None)
+                    continue
+                dim, row = loc
+                out.append(np.array(self._vectors(dim, row + 1)[row]))
+            hits = sum(v is not None for v in out)
+            self.hits += hits
+            self.misses += len(out) - hits
+        return out
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: np.ndarray) -> int:
+        vectors = np.ascontiguousarray(vectors, dtype=VECTOR_DTYPE)
+        if vectors.ndim != 2 or vectors.shape[0] != len(texts):
+            raise ValueError(f"Expected {len(texts)} vectors, got shape {vectors.shape}")
+        if not texts:
+            return 0
+
+        dim = int(vectors.shape[1])
+        row_bytes = dim * VECTOR_DTYPE.itemsize
+        keys = [embedding_key(model, t) for t in texts]
+        with self._lock:
+            with open(self._vectors_path(dim), "ab") as f:
+                # Drop a partial row left by an interrupted write.
+                start = f.tell() // row_bytes
+                f.truncate(start * row_bytes)
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            now = time.time()
+            cursor = self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, dim, row, created_at) VALUES (?, ?, ?, ?)",
+                [(key, dim, start + i, now) for i, key in enumerate(keys)],
+            )
+            self._db.commit()
+            self.added += cursor.rowcount
+        return len(keys)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(entries),
+                "bytes": sum(p.stat().st_size for p in self.root.glob("vectors-*.f32")),
+                "hits": self.hits,
+                "misses": self.misses,
+                "added": self.added,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._maps.clear()
+            self._db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show embedding store statistics")
+    parser.add_argument("root", type=Path)
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.root)
+    stats = store.stats()
+    print(f"{args.root}: {stats['entries']} embeddings, {stats['bytes'] / 1e6:.1f} MB of vectors")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
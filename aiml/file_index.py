@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+# Only these files are ever served from the data tree.
+SERVABLE_SUFFIXES = (".pdf",)
+
+# How often (seconds) lookups re-check the tree for added/removed files.
+DEFAULT_REFRESH_INTERVAL = 30.0
+
+
+class FileIndex:
+    # Filename / relative-path -> absolute path table for files under `root`.
+    # Built once, then rebuilt only when a directory mtime changes (files added,
+    # removed or renamed), checked at most every `refresh_interval` seconds.
+
+    def __init__(self, root: Path, refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.root = Path(root).resolve()
+        self.refresh_interval = refresh_interval
+        self._by_name: Dict[str, Path] = {}
+        self._by_relpath: Dict[str, Path] = {}
+        self._signature: Tuple = ()
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.refresh(force=True)
+
+    def _tree_signature(self) -> Tuple:
+        sig = []
+        for dirpath, dirnames, _ in os.walk(self.root):
+            dirnames.sort()
+            try:
+                sig.append((dirpath, os.stat(dirpath).st_mtime_ns))
+            except OSError:
+                continue
+        return tuple(sig)
+
+    def _build(self) -> None:
+        by_name: Dict[str, Path] = {}
+        by_relpath: Dict[str, Path] = {}
+        for path in sorted(self.root.rglob("*")):
+            if path.suffix.lower() not in SERVABLE_SUFFIXES or not path.is_file():
+                continue
+            # Sorted walk: on duplicate basenames the first path wins, deterministically.
+            by_name.setdefault(path.name, path)
+            by_relpath[path.relative_to(self.root).as_posix()] = path
+        self._by_name = by_name
+        self._by_relpath = by_relpath
+        self.rebuilds += 1
+
+    def refresh(self, force: bool = False) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked_at < self.refresh_interval:
+                return
+            self._checked_at = now
+            signature = self._tree_signature()
+            if force or signature != self._signature:
+                self._build()
+                self._signature = signature
+
+    def lookup(self, name: str) -> Optional[Path]:
+        # Accepts a bare filename ("Chapter_1.8_THEVENIN_DC.pdf") or a path
+        # relative to the data dir ("FY/Sem-1/Bee/.../Chapter_1.8_THEVENIN_DC.pdf").
+        self.refresh()
+        key = name.replace("\\", "/").lstrip("/")
+        path = self._by_relpath.get(key) or self._by_name.get(key)
+        if path is not None and not path.exists():
+            # Deleted since the last refresh.
+            self.refresh(force=True)
+            path = self._by_relpath.get(key) or self._by_name.get(key)
+        return path
+
+    def __len__(self) -> int:
+        return len(self._by_relpath)
@@ -0,0 +1,237 @@
+import json
+import math
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+
+# Index types selectable at ingestion time (INDEX_TYPE=<kind>).
+# - flat:     exact brute-force scan (default)
+# - hnsw:     graph index, no training; search knob efSearch
+# - ivf_flat: inverted lists over full vectors; search knob nprobe
+# - ivf_pq:   inverted lists over product-quantized codes (smallest); nprobe
+# - sq8:      8-bit scalar quantization, exact scan over 4x smaller codes
+INDEX_KINDS = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8")
+
+DEFAULT_HNSW_M = 32
+DEFAULT_HNSW_EF_CONSTRUCTION = 200
+DEFAULT_HNSW_EF_SEARCH = 64
+DEFAULT_NPROBE = 8
+DEFAULT_PQ_M = 64
+
+# faiss wants ~39 training points per centroid.
+MIN_POINTS_PER_CENTROID = 39
+
+INDEX_META_SUFFIX = ".json"
+
+# Distance metrics, recorded as "metric" in the index meta.
+# - l2: squared Euclidean distance (smaller is closer)
+# - ip: inner product (larger is closer); cosine similarity for unit vectors,
+#       which is what normalised embedders produce
+METRICS = {"l2": faiss.METRIC_L2, "ip": faiss.METRIC_INNER_PRODUCT}
+
+# Index kinds that store ids natively (add_with_ids / remove_ids on the index
+# itself). Everything else is wrapped in an IndexIDMap2 when built with ids.
+NATIVE_ID_KINDS = ("ivf_flat", "ivf_pq")
+
+
+def index_meta_path(index_path: Path) -> Path:
+    # FY_Sem-1_faiss.index -> FY_Sem-1_faiss.json
+    return Path(index_path).with_suffix(INDEX_META_SUFFIX)
+
+
+def read_index_meta(index_path: Path) -> Dict:
+    path = index_meta_path(index_path)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_index_meta(index_path: Path, meta: Dict) -> None:
+    path = index_meta_path(index_path)
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, path)
+
+
+def auto_nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, capped so every list gets enough training points.
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+
+
+def auto_pq_nbits(n: int) -> int:
+    # 8 bits (256 centroids per sub-quantizer) needs ~10k training points;
+    # small corpora fall back to fewer bits instead of failing to train.
+    nbits = 8
+    while nbits > 4 and (1 << nbits) * MIN_POINTS_PER_CENTROID > n:
+        nbits -= 1
+    return nbits
+
+
+def _pq_m_for(d: int, requested: int) -> int:
+    # Sub-quantizer count must divide the dimension.
+    m = min(requested, d)
+    while d % m:
+        m -= 1
+    return m
+
+
+def index_metric(index: faiss.Index) -> str:
+    # "l2" or "ip" for an index (or IndexIDMap around one).
+    return "ip" if base_index(index).metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+
+def flat_index(d: int, metric: str = "l2") -> faiss.Index:
+    return faiss.IndexFlatIP(d) if metric == "ip" else faiss.IndexFlatL2(d)
+
+
+def build_index(
+    vectors: np.ndarray,
+    kind: str = "flat",
+    ids: Optional[np.ndarray] = None,
+    metric: str = "l2",
+    **overrides,
+) -> tuple:
+    # Train (if needed) and fill an index of `kind` from an (N, D) float32 matrix.
+    # With `ids` (int64 chunk ids, one per row) searches return those ids
+    # instead of row numbers.
+    # Returns (index, params) where params is stored in the index metadata file.
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown index type {kind!r}; expected one of {INDEX_KINDS}")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}; expected one of {tuple(METRICS)}")
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, d = vectors.shape
+    params: Dict = {"kind": kind}
+
+    if kind == "flat":
+        factory = "Flat"
+    elif kind == "hnsw":
+        params["M"] = int(overrides.get("M", DEFAULT_HNSW_M))
+        params["efConstruction"] = int(overrides.get("efConstruction", DEFAULT_HNSW_EF_CONSTRUCTION))
+        params["efSearch"] = int(overrides.get("efSearch", DEFAULT_HNSW_EF_SEARCH))
+        factory = f"HNSW{params['M']}"
+    elif kind in ("ivf_flat", "ivf_pq"):
+        params["nlist"] = int(overrides.get("nlist") or auto_nlist(n))
+        params["nprobe"] = min(params["nlist"], int(overrides.get("nprobe", DEFAULT_NPROBE)))
+        if kind == "ivf_flat":
+            factory = f"IVF{params['nlist']},Flat"
+        else:
+            params["pq_m"] = _pq_m_for(d, int(overrides.get("pq_m", DEFAULT_PQ_M)))
+            params["pq_nbits"] = int(overrides.get("pq_nbits") or auto_pq_nbits(n))
+            factory = f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    else:
+        factory = "SQ8"
+
+    index = faiss.index_factory(d, factory, METRICS[metric])
+    params["factory"] = factory
+
+    if kind == "hnsw":
+        index.hnsw.efConstruction = params["efConstruction"]
+        index.hnsw.efSearch = params["efSearch"]
+
+    if not index.is_trained:
+        print(f"Training {factory} on {n} vectors...")
+        index.train(vectors)
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        index.nprobe = params["nprobe"]
+
+    if ids is None:
+        index.add(vectors)
+    else:
+        if kind not in NATIVE_ID_KINDS:
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype="int64"))
+    return index, params
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    # The wrapped index of an IndexIDMap, or the index itself.
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def stored_vectors(index: faiss.Index) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    # (vectors, ids) of a flat/HNSW index, in storage order. ids is None for a
+    # positional index. Used to rebuild without re-embedding.
+    base = base_index(index)
+    vectors = base.reconstruct_n(0, int(base.ntotal))
+    ids = faiss.vector_to_array(index.id_map) if isinstance(index, faiss.IndexIDMap) else None
+    return vectors, ids
+
+
+def remove_ids(index: faiss.Index, ids: np.ndarray, params: Optional[Dict] = None) -> Tuple[faiss.Index, int]:
+    # Drop vectors by chunk id. Returns (index, removed); the index is a new
+    # object for HNSW, whose graph can't delete nodes and is rebuilt from the
+    # stored vectors instead.
+    ids = np.ascontiguousarray(ids, dtype="int64")
+    if len(ids) == 0:
+        return index, 0
+
+    if isinstance(base_index(index), faiss.IndexHNSW):
+        vectors, current = stored_vectors(index)
+        keep = ~np.isin(current, ids)
+        hnsw_params = {k: v for k, v in (params or {}).items() if k in ("M", "efConstruction", "efSearch")}
+        rebuilt, _ = build_index(vectors[keep], "hnsw", ids=current[keep], metric=index_metric(index), **hnsw_params)
+        return rebuilt, int((~keep).sum())
+
+    return index, int(index.remove_ids(ids))
+
+
+def search_params(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    sel: Optional[faiss.IDSelector] = None,
+) -> Optional[faiss.SearchParameters]:
+    # Per-call search knobs. Passed to index.search(..., params=...) so concurrent
+    # requests never mutate the shared index. `sel` restricts the search to
+    # those labels (chunk ids or positions); vectors outside it are skipped,
+    # not scored. The caller must keep `sel` alive until the search returns.
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF) and (nprobe is not None or sel is not None):
+        return faiss.SearchParametersIVF(nprobe=int(nprobe if nprobe is not None else base.nprobe), sel=sel)
+    if isinstance(base, faiss.IndexHNSW) and (ef_search is not None or sel is not None):
+        ef = int(ef_search if ef_search is not None else base.hnsw.efSearch)
+        return faiss.SearchParametersHNSW(efSearch=ef, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def id_selector(labels: np.ndarray) -> faiss.IDSelector:
+    # Selector over sorted, unique labels: a range check when they are
+    # contiguous (one subject's chunks in a positional index), else a hash set.
+    labels = np.ascontiguousarray(labels, dtype="int64")
+    if len(labels) and labels[-1] - labels[0] + 1 == len(labels):
+        return faiss.IDSelectorRange(int(labels[0]), int(labels[-1]) + 1)
+    return faiss.IDSelectorBatch(labels)
+
+
+def index_nbytes(index: Optional[faiss.Index]) -> int:
+    # Estimate of resident bytes for the index types above.
+    if index is None:
+        return 0
+    if isinstance(index, faiss.IndexIDMap):
+        # id_map (int64 per vector) + IDMap2's reverse dict
+        return index_nbytes(base_index(index)) + int(index.ntotal) * (8 + 64)
+    ntotal, d = int(index.ntotal), int(index.d)
+    if isinstance(index, faiss.IndexHNSW):
+        storage = faiss.downcast_index(index.storage)
+        links = ntotal * index.hnsw.nb_neighbors(0) * 4
+        return index_nbytes(storage) + links
+    if isinstance(index, faiss.IndexIVF):
+        centroids = int(index.nlist) * d * 4
+        return centroids + ntotal * (int(index.code_size) + 8)
+    code_size = getattr(index, "code_size", None)
+    if code_size:
+        return ntotal * int(code_size)
+    return ntotal * d * 4
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class RegistryEntry:
+    def __init__(self, value: Any, load_seconds: float, resident_bytes: int, version: Hashable = None):
+        self.value = value
+        self.version = version
+        self.load_seconds = load_seconds
+        self.resident_bytes = resident_bytes
+        self.loaded_at = time.time()
+        self.hits = 0
+
+
+class IndexRegistry:
+    # Thread-safe cache of loaded per-semester resources.
+    # - Single-flight: concurrent first requests for a key share one load.
+    # - LRU eviction once the summed resident size exceeds `memory_budget_bytes`
+    #   (the most recently used entry is always kept).
+    # - An entry loaded for another `version` (e.g. file stats of the index)
+    #   is reloaded, so rewritten files are picked up without a restart.
+    # - Values must expose `resident_bytes() -> int`. Values with a false
+    #   `cacheable` attribute (missing or unreadable files) are returned but
+    #   not kept, so the next get tries again.
+
+    def __init__(self, memory_budget_bytes: Optional[int] = None):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._entries: "OrderedDict[Hashable, RegistryEntry]" = OrderedDict()
+        self._loading: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Any], version: Hashable = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                return entry.value
+
+            # Single-flight per (key, version).
+            future = self._loading.get((key, version))
+            owner = future is None
+            if owner:
+                future = Future()
+                self._loading[(key, version)] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            started = time.perf_counter()
+            value = loader()
+            load_seconds = time.perf_counter() - started
+            resident_bytes = int(value.resident_bytes())
+        except BaseException as e:
+            with self._lock:
+                del self._loading[(key, version)]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[(key, version)]
+            if getattr(value, "cacheable", True):
+                print(f"Loaded index {key} in {load_seconds:.2f}s ({resident_bytes / 1e6:.1f} MB)")
+                stale = self._entries.pop(key, None)
+                if stale is not None:
+                    print(f"Reloaded index {key}: files changed since it was loaded")
+                self._entries[key] = RegistryEntry(value, load_seconds, resident_bytes, version)
+                self._evict_over_budget()
+        future.set_result(value)
+        return value
+
+    def _evict_over_budget(self) -> None:
+        if not self.memory_budget_bytes:
+            return
+        while len(self._entries) > 1 and self.resident_bytes() > self.memory_budget_bytes:
+            key, entry = self._entries.popitem(last=False)
+            self.evictions += 1
+            print(f"Evicted index {key} ({entry.resident_bytes / 1e6:.1f} MB) to stay under memory budget")
+
+    def resident_bytes(self) -> int:
+        return sum(e.resident_bytes for e in self._entries.values())
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        # Snapshot of loaded (key, value) pairs, least recently used first.
+        with self._lock:
+            return [(key, e.value) for key, e in self._entries.items()]
+
+    def warm(self, jobs: Iterable[Tuple[Hashable, Callable[[], Any], Hashable]]) -> threading.Thread:
+        # Load the given (key, loader, version) jobs on a background daemon thread.
+        jobs = list(jobs)
+
+        def run() -> None:
+            for key, loader, version in jobs:
+                try:
+                    self.get(key, loader, version)
+                except Exception as e:
+                    print(f"Warm-up failed for {key}: {e}")
+
+        thread = threading.Thread(target=run, name="index-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries: List[Dict] = [
+                {
+                    "key": list(key) if isinstance(key, tuple) else key,
+                    "load_seconds": round(e.load_seconds, 4),
+                    "resident_bytes": e.resident_bytes,
+                    "hits": e.hits,
+                }
+                for key, e in self._entries.items()
+            ]
+            return {
+                "entries": entries,
+                "loading": len(self._loading),
+                "resident_bytes": self.resident_bytes(),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "evictions": self.evictions,
+            }
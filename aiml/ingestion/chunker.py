@@ -1,11 +1,18 @@
 import fitz  # PyMuPDF
+import hashlib
 import json
+import os
 import re
+import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from docx import Document
 from pptx import Presentation
 
+from lexical import build_lexical_index, iter_chunk_texts, lexical_path_for
+
 # ================= CONFIG =================
 
 SCRIPT_DIR = Path(__file__).resolve().parent
@@ -15,9 +22,36 @@ OUTPUT_DIR = SCRIPT_DIR / "output"
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 
+# Consecutive PDF pages shorter than SHORT_PAGE_WORDS (slide decks: a title
+# and one example per page) are merged into one chunk of up to
+# COALESCE_MAX_WORDS words spanning at most COALESCE_MAX_PAGES pages; the
+# record keeps the range as page..page_end.
+# Set SHORT_PAGE_WORDS = 0 to chunk every page on its own.
+SHORT_PAGE_WORDS = 150
+COALESCE_MAX_WORDS = CHUNK_SIZE
+COALESCE_MAX_PAGES = 10
+
+# Only used to report the index size saved by coalescing
+# (gemini-embedding-001 vectors, float32, flat index).
+REPORT_EMBED_DIM = 3072
+
 PROGRESS_FILE = OUTPUT_DIR / "progress.json"
 CHUNKS_FILE = OUTPUT_DIR / "chunks.jsonl"
 
+# Parallel mode (--workers N > 1): every worker process appends to its own
+# chunk shard and progress shard here; chunks.jsonl is rebuilt from them.
+SHARD_DIR = OUTPUT_DIR / "shards"
+SUPPORTED_SUFFIXES = (".pdf", ".docx", ".pptx")
+
+CHUNK_ID_MASK = (1 << 63) - 1
+
+# Incremental mode (--incremental): manifest.json maps each source file
+# (path relative to DATA_DIR) to its size, mtime, sha256 and the range of
+# chunks.jsonl lines it produced. delta.json describes the last incremental
+# run for ingest.py --delta.
+MANIFEST_FILE = OUTPUT_DIR / "manifest.json"
+DELTA_FILE = OUTPUT_DIR / "delta.json"
+
 # =========================================
 
 
@@ -28,6 +62,17 @@ def parse_args():
         action="store_true",
         help="Delete existing chunks and progress and re-chunk from scratch"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("CHUNK_WORKERS", "1")),
+        help="Worker processes; >1 extracts files in parallel into shards (env CHUNK_WORKERS)"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Re-chunk only files added or changed since the last run (uses manifest.json) and write delta.json"
+    )
     return parser.parse_args()
 
 
@@ -79,9 +124,128 @@ def extract_pptx_text(path: Path) -> str:
     return "\n".join(texts)
 
 
+def chunk_id(path: Path, page: Optional[int], ordinal: int) -> int:
+    # Stable 64-bit id: same file (relative to DATA_DIR), page and position
+    # within the page -> same id on every run and machine. Top bit cleared
+    # because FAISS ids are signed int64 and -1 means "no result".
+    key = f"{path.relative_to(DATA_DIR).as_posix()}|{page}|{ordinal}"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & CHUNK_ID_MASK
+
+
+def make_record(
+    text: str,
+    path: Path,
+    page: Optional[int],
+    folder_meta: dict,
+    ordinal: int,
+    page_end: Optional[int] = None,
+) -> dict:
+    record = {
+        "text": text,
+        "doc_name": path.name,
+        "page": page,
+    }
+    if page_end is not None and page_end != page:
+        record["page_end"] = page_end
+    record.update({
+        "source_path": str(path.resolve()),
+        "chunk_id": chunk_id(path, page, ordinal),
+        **folder_meta
+    })
+    return record
+
+
+def page_has_text(text: str) -> bool:
+    return bool(text) and len(text.strip()) >= 30
+
+
+def new_coalesce_stats() -> Dict[str, int]:
+    return {"short_pages": 0, "coalesced_chunks": 0}
+
+
+def add_coalesce_stats(total: Dict[str, int], stats: Dict[str, int]) -> None:
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+
+
+def read_pdf_pages(doc, pdf_path: Path, start_page: int = 0, verbose: bool = False) -> Iterator[Tuple[int, str]]:
+    # (page_num, cleaned text) from start_page on; "" for pages without text.
+    for page_num in range(start_page, doc.page_count):
+        text = doc.load_page(page_num).get_text()
+        if not page_has_text(text):
+            if verbose:
+                print(
+                    f"⚠️  No extractable text on "
+                    f"{pdf_path.name} page {page_num + 1} "
+                    f"(OCR needed)"
+                )
+            yield page_num, ""
+            continue
+        yield page_num, clean_text(text)
+
+
+def coalesce_pages(
+    pages: Iterable[Tuple[int, str]],
+    stats: Optional[Dict[str, int]] = None,
+) -> Iterator[Tuple[int, int, List[str]]]:
+    # Groups pages into (first_page, last_page, chunks) units, 0-based.
+    # A page of SHORT_PAGE_WORDS or more is a unit on its own (chunked as
+    # before); runs of shorter pages are joined up to the word/page limits.
+    # Pages without text yield an empty unit, or are absorbed by a pending run.
+    buffer: List[str] = []
+    first = last = -1
+    words = 0
+
+    def flush() -> Tuple[int, int, List[str]]:
+        nonlocal buffer, words
+        unit = (first, last, [" ".join(buffer)])
+        if stats is not None:
+            stats["short_pages"] += len(buffer)
+            stats["coalesced_chunks"] += 1
+        buffer, words = [], 0
+        return unit
+
+    for page_num, text in pages:
+        count = len(text.split())
+        if count == 0:
+            if not buffer:
+                yield page_num, page_num, []
+            continue
+
+        if count >= SHORT_PAGE_WORDS:
+            if buffer:
+                yield flush()
+            yield page_num, page_num, chunk_text(text)
+            continue
+
+        if buffer and (words + count > COALESCE_MAX_WORDS or page_num - first >= COALESCE_MAX_PAGES):
+            yield flush()
+        if not buffer:
+            first = page_num
+        buffer.append(text)
+        last = page_num
+        words += count
+
+    if buffer:
+        yield flush()
+
+
+def report_coalescing(stats: Dict[str, int], total_chunks: Optional[int] = None) -> None:
+    saved = stats["short_pages"] - stats["coalesced_chunks"]
+    if stats["short_pages"] == 0:
+        return
+    line = (f"\n🧱 Coalesced {stats['short_pages']} short pages into {stats['coalesced_chunks']} chunks: "
+            f"{saved} fewer vectors and embedding inputs")
+    if total_chunks:
+        line += f" ({saved / (total_chunks + saved):.1%} of {total_chunks + saved})"
+    line += f", ~{saved * REPORT_EMBED_DIM * 4 / 1e6:.1f} MB less flat index at {REPORT_EMBED_DIM} dims"
+    print(line)
+
+
 # ---------- PROCESSORS ----------
 
-def process_pdf(pdf_path: Path, folder_meta: dict, progress: dict):
+def process_pdf(pdf_path: Path, folder_meta: dict, progress: dict, stats: Optional[Dict[str, int]] = None):
     doc_key = str(pdf_path.resolve())
     last_page_done = progress.get(doc_key, -1)
 
@@ -97,51 +261,39 @@ def process_pdf(pdf_path: Path, folder_meta: dict, progress: dict):
     if last_page_done >= 0:
         print(f"↪ Resuming from page {last_page_done + 1}")
 
+    pages = read_pdf_pages(doc, pdf_path, last_page_done + 1, verbose=True)
     with open(CHUNKS_FILE, "a", encoding="utf-8") as out:
-        for page_num in range(last_page_done + 1, total_pages):
-            try:
-                page = doc.load_page(page_num)
-                text = page.get_text()
-
-                if not text or len(text.strip()) < 30:
-                    print(
-                        f"⚠️  No extractable text on "
-                        f"{pdf_path.name} page {page_num + 1} "
-                        f"(OCR needed)"
-                    )
-                    progress[doc_key] = page_num
-                    save_progress(progress)
-                    continue
-
-                chunks = chunk_text(clean_text(text))
-
-                for chunk in chunks:
-                    record = {
-                        "text": chunk,
-                        "doc_name": pdf_path.name,
-                        "page": page_num + 1,
-                        "source_path": str(pdf_path.resolve()),
-                        **folder_meta
-                    }
+        try:
+            # Progress only advances past whole units, so a coalesced run of
+            # pages is either fully written or redone on resume.
+            for first, last, chunks in coalesce_pages(pages, stats):
+                for ordinal, chunk in enumerate(chunks):
+                    record = make_record(chunk, pdf_path, first + 1, folder_meta, ordinal, last + 1)
                     out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
 
-                progress[doc_key] = page_num
+                progress[doc_key] = last
                 save_progress(progress)
 
-            except Exception as e:
-                print(
-                    f"❌ ERROR at {pdf_path.name} page {page_num + 1}\n"
-                    f"    {e}\n"
-                    f"➡ Progress saved. Re-run to resume."
-                )
-                save_progress(progress)
-                return
+        except Exception as e:
+            print(
+                f"❌ ERROR in {pdf_path.name} after page {progress.get(doc_key, -1) + 1}\n"
+                f"    {e}\n"
+                f"➡ Progress saved. Re-run to resume."
+            )
+            save_progress(progress)
+            return
 
     print(f"✅ Finished PDF: {pdf_path.name}")
 
 
-def process_docx(docx_path: Path, folder_meta: dict):
+def process_docx(docx_path: Path, folder_meta: dict, progress: dict):
+    # Written in one go, like a single PDF page: progress 0 means done.
+    doc_key = str(docx_path.resolve())
     print(f"\n📄 DOCX: {docx_path.relative_to(DATA_DIR)}")
+    if progress.get(doc_key, -1) >= 0:
+        print("↪ Already chunked, skipping")
+        return
 
     try:
         text = extract_docx_text(docx_path)
@@ -149,28 +301,29 @@ def process_docx(docx_path: Path, folder_meta: dict):
         print(f"❌ Failed to read DOCX: {docx_path}\n    {e}")
         return
 
-    if not text or len(text.strip()) < 30:
+    if not page_has_text(text):
         print("⚠️ No usable text found")
         return
 
     chunks = chunk_text(clean_text(text))
 
     with open(CHUNKS_FILE, "a", encoding="utf-8") as out:
-        for chunk in chunks:
-            record = {
-                "text": chunk,
-                "doc_name": docx_path.name,
-                "page": None,
-                "source_path": str(docx_path.resolve()),
-                **folder_meta
-            }
+        for ordinal, chunk in enumerate(chunks):
+            record = make_record(chunk, docx_path, None, folder_meta, ordinal)
             out.write(json.dumps(record, ensure_ascii=False) + "\n")
 
+    progress[doc_key] = 0
+    save_progress(progress)
     print(f"✅ Finished DOCX: {docx_path.name}")
 
 
-def process_pptx(pptx_path: Path, folder_meta: dict):
+def process_pptx(pptx_path: Path, folder_meta: dict, progress: dict):
+    # Written in one go, like a single PDF page: progress 0 means done.
+    doc_key = str(pptx_path.resolve())
     print(f"\n📊 PPTX: {pptx_path.relative_to(DATA_DIR)}")
+    if progress.get(doc_key, -1) >= 0:
+        print("↪ Already chunked, skipping")
+        return
 
     try:
         text = extract_pptx_text(pptx_path)
@@ -178,44 +331,426 @@ def process_pptx(pptx_path: Path, folder_meta: dict):
         print(f"❌ Failed to read PPTX: {pptx_path}\n    {e}")
         return
 
-    if not text or len(text.strip()) < 30:
+    if not page_has_text(text):
         print("⚠️ No usable text found")
         return
 
     chunks = chunk_text(clean_text(text))
 
     with open(CHUNKS_FILE, "a", encoding="utf-8") as out:
-        for chunk in chunks:
-            record = {
-                "text": chunk,
-                "doc_name": pptx_path.name,
-                "page": None,
-                "source_path": str(pptx_path.resolve()),
-                **folder_meta
-            }
+        for ordinal, chunk in enumerate(chunks):
+            record = make_record(chunk, pptx_path, None, folder_meta, ordinal)
             out.write(json.dumps(record, ensure_ascii=False) + "\n")
 
+    progress[doc_key] = 0
+    save_progress(progress)
     print(f"✅ Finished PPTX: {pptx_path.name}")
 
 
-def process_file(path: Path, folder_meta: dict, progress: dict):
+def process_file(path: Path, folder_meta: dict, progress: dict, stats: Optional[Dict[str, int]] = None):
     suffix = path.suffix.lower()
 
     if suffix == ".pdf":
-        process_pdf(path, folder_meta, progress)
+        process_pdf(path, folder_meta, progress, stats)
     elif suffix == ".docx":
-        process_docx(path, folder_meta)
+        process_docx(path, folder_meta, progress)
     elif suffix == ".pptx":
-        process_pptx(path, folder_meta)
+        process_pptx(path, folder_meta, progress)
     else:
         print(f"⚠️ Unsupported file type: {path}")
 
 
+# ---------- FILE DISCOVERY ----------
+
+def load_folder_meta(subject_dir: Path, year_name: str, sem_name: str) -> dict:
+    meta_file = subject_dir / "metadata.json"
+    if meta_file.exists():
+        with open(meta_file, "r", encoding="utf-8") as f:
+            folder_meta = json.load(f)
+    else:
+        print(f"⚠️ Missing metadata.json in {subject_dir}")
+        folder_meta = {}
+
+    # Add year and semester info to metadata
+    folder_meta["year"] = year_name
+    folder_meta["semester_folder"] = sem_name
+    return folder_meta
+
+
+def collect_jobs() -> List[Tuple[Path, dict]]:
+    # Every supported file as (path, folder_meta), in a fixed order:
+    # year / semester / subject by name, then PDFs, DOCX, PPTX, each sorted.
+    # Both modes write chunks in this order, so chunks.jsonl (and with it the
+    # FAISS row numbering) does not depend on directory listing order.
+    jobs = []
+
+    for year_dir in sorted(DATA_DIR.iterdir()):
+        if not year_dir.is_dir():
+            continue
+
+        for sem_dir in sorted(year_dir.iterdir()):
+            if not sem_dir.is_dir():
+                continue
+
+            for subject_dir in sorted(sem_dir.iterdir()):
+                if not subject_dir.is_dir():
+                    continue
+
+                folder_meta = load_folder_meta(subject_dir, year_dir.name, sem_dir.name)
+
+                files = []
+                for suffix in SUPPORTED_SUFFIXES:
+                    files.extend(sorted(subject_dir.rglob(f"*{suffix}")))
+
+                if not files:
+                    subject_name = folder_meta.get("subject", subject_dir.name)
+                    print(f"   (no supported files found for {subject_name})")
+                    continue
+
+                jobs.extend((file_path, folder_meta) for file_path in files)
+
+    return jobs
+
+
+def job_key(path: Path) -> str:
+    return path.relative_to(DATA_DIR).as_posix()
+
+
+# ---------- PARALLEL MODE ----------
+
+def extract_records(path: Path, folder_meta: dict, stats: Optional[Dict[str, int]] = None) -> List[dict]:
+    # Whole-file extraction for worker processes; same records, in the same
+    # order, as the sequential processors write.
+    suffix = path.suffix.lower()
+    records = []
+
+    if suffix == ".pdf":
+        with fitz.open(path) as doc:
+            for first, last, chunks in coalesce_pages(read_pdf_pages(doc, path), stats):
+                for ordinal, chunk in enumerate(chunks):
+                    records.append(make_record(chunk, path, first + 1, folder_meta, ordinal, last + 1))
+        return records
+
+    if suffix == ".docx":
+        text = extract_docx_text(path)
+    elif suffix == ".pptx":
+        text = extract_pptx_text(path)
+    else:
+        raise ValueError(f"Unsupported file type: {path}")
+
+    if page_has_text(text):
+        for ordinal, chunk in enumerate(chunk_text(clean_text(text))):
+            records.append(make_record(chunk, path, None, folder_meta, ordinal))
+    return records
+
+
+# Per-process shard names, set by the pool initializer. Names include the run
+# start time so a restarted run never appends to an older process' shard.
+_shard_names: Dict[str, Path] = {}
+
+
+def _init_worker(run_id: str) -> None:
+    name = f"{run_id}-{os.getpid()}"
+    _shard_names["chunks"] = SHARD_DIR / f"chunks-{name}.jsonl"
+    _shard_names["progress"] = SHARD_DIR / f"progress-{name}.jsonl"
+
+
+def _extract_with_stats(path: Path, folder_meta: dict) -> Tuple[List[dict], Dict[str, int]]:
+    stats = new_coalesce_stats()
+    return extract_records(path, folder_meta, stats), stats
+
+
+def _chunk_file(path_str: str, folder_meta: dict) -> Tuple[str, int, Dict[str, int]]:
+    path = Path(path_str)
+    key = job_key(path)
+    records, stats = _extract_with_stats(path, folder_meta)
+
+    # Shard lines are "<job key>\t<record json>". The progress line is only
+    # written after the file's chunks are flushed, so a worker that dies
+    # mid-file leaves no progress entry and its partial lines are ignored.
+    chunk_shard = _shard_names["chunks"]
+    with open(chunk_shard, "a", encoding="utf-8") as out:
+        for record in records:
+            out.write(key + "\t" + json.dumps(record, ensure_ascii=False) + "\n")
+    with open(_shard_names["progress"], "a", encoding="utf-8") as out:
+        out.write(json.dumps({"file": key, "chunks": len(records), "shard": chunk_shard.name}) + "\n")
+
+    return key, len(records), stats
+
+
+def load_shard_progress() -> Dict[str, str]:
+    # job key -> chunk shard holding its complete output (first one wins)
+    done: Dict[str, str] = {}
+    for progress_file in sorted(SHARD_DIR.glob("progress-*.jsonl")):
+        with open(progress_file, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entry = json.loads(line)
+                    done.setdefault(entry["file"], entry["shard"])
+    return done
+
+
+def merge_shards(jobs: List[Tuple[Path, dict]]) -> Tuple[int, int]:
+    # Rebuild chunks.jsonl from the shards in collect_jobs() order, so the
+    # output is identical however files were spread across workers.
+    done = load_shard_progress()
+
+    lines: Dict[str, List[str]] = {}
+    for chunk_shard in sorted(SHARD_DIR.glob("chunks-*.jsonl")):
+        with open(chunk_shard, "r", encoding="utf-8") as f:
+            for line in f:
+                key, sep, record = line.partition("\t")
+                if sep and done.get(key) == chunk_shard.name:
+                    lines.setdefault(key, []).append(record)
+
+    written = 0
+    tmp_path = CHUNKS_FILE.with_name(CHUNKS_FILE.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for path, _ in jobs:
+            for record in lines.get(job_key(path), ()):
+                out.write(record)
+                written += 1
+    os.replace(tmp_path, CHUNKS_FILE)
+
+    missing = sum(1 for path, _ in jobs if job_key(path) not in done)
+    return written, missing
+
+
+def run_parallel(jobs: List[Tuple[Path, dict]], workers: int) -> Dict[str, int]:
+    SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    done = load_shard_progress()
+    pending = [(path, meta) for path, meta in jobs if job_key(path) not in done]
+    print(f"\n⚙️  Parallel mode: {len(pending)} of {len(jobs)} files to chunk with {workers} workers")
+
+    failed = 0
+    stats = new_coalesce_stats()
+    run_id = time.strftime("%Y%m%d%H%M%S")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(run_id,)) as pool:
+        futures = {pool.submit(_chunk_file, str(path), meta): path for path, meta in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                _, count, file_stats = future.result()
+                add_coalesce_stats(stats, file_stats)
+                print(f"✅ {path.relative_to(DATA_DIR)} ({count} chunks)")
+            except Exception as e:
+                failed += 1
+                print(f"❌ Failed: {path.relative_to(DATA_DIR)}\n    {e}")
+
+    written, missing = merge_shards(jobs)
+    print(f"\n🧩 Merged shards: {written} chunks -> {CHUNKS_FILE.name}")
+    if missing:
+        print(f"⚠️ {missing} files produced no shard output ({failed} failed this run). Re-run to retry.")
+    return stats
+
+
+# ---------- INCREMENTAL MODE ----------
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_entry(path: Path, sha256: Optional[str] = None) -> dict:
+    stat = path.stat()
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256 or file_sha256(path),
+    }
+
+
+def load_manifest() -> Optional[dict]:
+    if MANIFEST_FILE.exists():
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return None
+
+
+def save_manifest(files: Dict[str, dict], total: int) -> None:
+    tmp_path = MANIFEST_FILE.with_name(MANIFEST_FILE.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "total": total, "files": files}, f, indent=2)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+
+def write_manifest_from_chunks(jobs: List[Tuple[Path, dict]]) -> None:
+    # After a full run: derive each file's chunk range from chunks.jsonl.
+    by_source = {str(path.resolve()): job_key(path) for path, _ in jobs}
+    ranges: Dict[str, List[int]] = {}
+    previous = None
+    total = 0
+
+    with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f):
+            key = by_source.get(json.loads(line).get("source_path"))
+            if key is None or (key in ranges and key != previous):
+                print("⚠️ chunks.jsonl has chunks from unknown or interleaved files; "
+                      "manifest not written (use --redo before --incremental)")
+                return
+            if key != previous:
+                ranges[key] = [line_num, 0]
+            ranges[key][1] += 1
+            previous = key
+            total = line_num + 1
+
+    files = {}
+    for path, _ in jobs:
+        key = job_key(path)
+        start, count = ranges.get(key, (total, 0))
+        files[key] = {**file_entry(path), "start": start, "count": count}
+
+    save_manifest(files, total)
+    print(f"\n🧾 Manifest: {len(files)} files, {total} chunks -> {MANIFEST_FILE.name}")
+
+
+def extract_many(jobs: List[Tuple[Path, dict]], workers: int, stats: Dict[str, int]) -> Dict[str, List[dict]]:
+    paths, metas = [path for path, _ in jobs], [meta for _, meta in jobs]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_extract_with_stats, paths, metas))
+    else:
+        results = [_extract_with_stats(path, meta) for path, meta in jobs]
+
+    extracted = {}
+    for path, (records, file_stats) in zip(paths, results):
+        add_coalesce_stats(stats, file_stats)
+        extracted[job_key(path)] = records
+    return extracted
+
+
+def run_incremental(jobs: List[Tuple[Path, dict]], manifest: dict, workers: int) -> None:
+    old_files: Dict[str, dict] = manifest["files"]
+    base_total = int(manifest["total"])
+
+    added, changed, unchanged = [], [], {}
+    for path, meta in jobs:
+        key = job_key(path)
+        old = old_files.get(key)
+        if old is None:
+            added.append((path, meta))
+            continue
+        stat = path.stat()
+        if stat.st_size == old["size"] and stat.st_mtime_ns == old["mtime_ns"]:
+            unchanged[key] = old
+            continue
+        # Size/mtime differ: only a different hash counts as a change.
+        sha256 = file_sha256(path)
+        if sha256 == old["sha256"]:
+            unchanged[key] = {**old, **file_entry(path, sha256)}
+        else:
+            changed.append((path, meta))
+
+    current = {job_key(path) for path, _ in jobs}
+    deleted = sorted(key for key in old_files if key not in current)
+
+    print(f"\n🧾 Manifest diff: {len(added)} added, {len(changed)} changed, "
+          f"{len(deleted)} deleted, {len(unchanged)} unchanged")
+    if not (added or changed or deleted):
+        # Still save: refreshed mtimes spare the next run from re-hashing.
+        save_manifest(unchanged, base_total)
+        print("✅ Nothing to re-chunk")
+        return
+
+    # Extract everything first: a failure leaves chunks.jsonl and the manifest untouched.
+    to_chunk = changed + added
+    print(f"⚙️  Chunking {len(to_chunk)} files")
+    stats = new_coalesce_stats()
+    new_records = extract_many(to_chunk, workers, stats)
+
+    # Removed ranges are in old chunks.jsonl positions.
+    removed_keys = [job_key(path) for path, _ in changed] + deleted
+    removed = sorted(
+        (old_files[key]["start"], old_files[key]["count"])
+        for key in removed_keys
+        if old_files[key]["count"] > 0
+    )
+    removed_lines = set()
+    for start, count in removed:
+        removed_lines.update(range(start, start + count))
+
+    # Kept chunks stay in their current order; re-chunked files are appended
+    # (in collect_jobs() order). That keeps existing FAISS rows valid after
+    # the removed rows are deleted, so the index only needs the delta.
+    files: Dict[str, dict] = {}
+    tmp_path = CHUNKS_FILE.with_name(CHUNKS_FILE.name + ".tmp")
+    with open(CHUNKS_FILE, "r", encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as out:
+        kept = 0
+        line_count = 0
+        removed_ids = []
+        for line_num, line in enumerate(src):
+            line_count += 1
+            if line_num not in removed_lines:
+                out.write(line)
+                kept += 1
+            else:
+                old_id = json.loads(line).get("chunk_id")
+                if old_id is not None:
+                    removed_ids.append(old_id)
+        if line_count != base_total:
+            out.close()
+            tmp_path.unlink()
+            raise RuntimeError(
+                f"chunks.jsonl has {line_count} lines but manifest.json expects {base_total}; "
+                f"run with --redo"
+            )
+
+        for key, entry in unchanged.items():
+            shift = sum(count for start, count in removed if start < entry["start"])
+            files[key] = {**entry, "start": entry["start"] - shift}
+
+        position = kept
+        for path, _ in to_chunk:
+            key = job_key(path)
+            records = new_records[key]
+            for record in records:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            files[key] = {**file_entry(path), "start": position, "count": len(records)}
+            position += len(records)
+
+    os.replace(tmp_path, CHUNKS_FILE)
+    # Order files like collect_jobs() for readable diffs of the manifest.
+    save_manifest({job_key(path): files[job_key(path)] for path, _ in jobs}, position)
+
+    delta = {
+        "id": hashlib.sha256(json.dumps([base_total, removed, kept, position, removed_keys,
+                                         [job_key(p) for p, _ in to_chunk]]).encode()).hexdigest()[:16],
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "base_total": base_total,
+        "new_total": position,
+        "removed": [list(r) for r in removed],
+        # Same chunks by id, for indexes built with chunk ids (empty for old chunks.jsonl files).
+        "removed_ids": removed_ids,
+        "added": [kept, position - kept],
+        "files": {
+            "added": [job_key(p) for p, _ in added],
+            "changed": [job_key(p) for p, _ in changed],
+            "deleted": deleted,
+        },
+    }
+    with open(DELTA_FILE, "w", encoding="utf-8") as f:
+        json.dump(delta, f, indent=2)
+
+    # Shards describe the previous layout of chunks.jsonl; they can't be resumed any more.
+    for shard in SHARD_DIR.glob("*.jsonl"):
+        shard.unlink()
+
+    print(f"🧩 chunks.jsonl: {base_total} -> {position} chunks "
+          f"(-{len(removed_lines)}, +{position - kept})")
+    print(f"📝 Delta for ingestion: {DELTA_FILE.name} (ingest.py --delta)")
+    report_coalescing(stats)
+
+
 # ---------- MAIN ----------
 
 def main():
     args = parse_args()
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    parallel = args.workers > 1
 
     if args.redo:
         print("🔁 REDO MODE: clearing previous output")
@@ -223,58 +758,59 @@ def main():
             PROGRESS_FILE.unlink()
         if CHUNKS_FILE.exists():
             CHUNKS_FILE.unlink()
+        for shard in SHARD_DIR.glob("*.jsonl"):
+            shard.unlink()
+        for path in (MANIFEST_FILE, DELTA_FILE):
+            if path.exists():
+                path.unlink()
         progress = {}
+        manifest = None
     else:
-        print("▶ RESUME MODE (default)")
+        manifest = load_manifest() if args.incremental and CHUNKS_FILE.exists() else None
+        if args.incremental and manifest is None:
+            print("⚠️ No manifest.json yet: doing a full run, later --incremental runs can use it")
+        print("▶ INCREMENTAL MODE" if manifest is not None else "▶ RESUME MODE (default)")
         progress = load_progress()
+        # The two modes track progress differently; resuming one from the
+        # other's output would drop or duplicate chunks.
+        has_shards = any(SHARD_DIR.glob("progress-*.jsonl"))
+        if manifest is None and parallel and CHUNKS_FILE.exists() and not has_shards:
+            print("❌ chunks.jsonl was built sequentially; use --redo to rebuild it in parallel mode")
+            return
+        if manifest is None and not parallel and has_shards:
+            print("❌ Shards from a parallel run exist; resume with --workers N or use --redo")
+            return
 
     print(f"\n📂 Scanning data directory: {DATA_DIR}")
+    jobs = collect_jobs()
 
-    for year_dir in DATA_DIR.iterdir():
-        if not year_dir.is_dir():
-            continue
-
-        year_name = year_dir.name  # e.g., "FY", "SY", "TY"
-
-        for sem_dir in year_dir.iterdir():
-            if not sem_dir.is_dir():
-                continue
-
-            sem_name = sem_dir.name  # e.g., "Sem-1", "Sem-2"
-
-            for subject_dir in sem_dir.iterdir():
-                if not subject_dir.is_dir():
-                    continue
-
-                meta_file = subject_dir / "metadata.json"
-                if meta_file.exists():
-                    with open(meta_file, "r", encoding="utf-8") as f:
-                        folder_meta = json.load(f)
-                else:
-                    print(f"⚠️ Missing metadata.json in {subject_dir}")
-                    folder_meta = {}
-
-                # Add year and semester info to metadata
-                folder_meta["year"] = year_name
-                folder_meta["semester_folder"] = sem_name
-
-                subject_name = folder_meta.get("subject", subject_dir.name)
-                print(f"\n📂 Subject: {subject_name}")
-
-                files = []
-                files.extend(subject_dir.rglob("*.pdf"))
-                files.extend(subject_dir.rglob("*.docx"))
-                files.extend(subject_dir.rglob("*.pptx"))
+    if manifest is not None:
+        run_incremental(jobs, manifest, args.workers)
+    else:
+        if parallel:
+            stats = run_parallel(jobs, args.workers)
+        else:
+            current_meta = None
+            stats = new_coalesce_stats()
+            for file_path, folder_meta in jobs:
+                if folder_meta is not current_meta:
+                    current_meta = folder_meta
+                    print(f"\n📂 Subject: {folder_meta.get('subject', file_path.parent.name)}")
+                process_file(file_path, folder_meta, progress, stats)
+        if CHUNKS_FILE.exists():
+            with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
+                report_coalescing(stats, sum(1 for _ in f))
 
-                if not files:
-                    print("   (no supported files found)")
-                    continue
+    if manifest is None and CHUNKS_FILE.exists():
+        write_manifest_from_chunks(jobs)
 
-                for file_path in files:
-                    process_file(file_path, folder_meta, progress)
+    if CHUNKS_FILE.exists():
+        bm25_path = lexical_path_for(CHUNKS_FILE)
+        count = build_lexical_index(bm25_path, iter_chunk_texts(CHUNKS_FILE))
+        print(f"\n🔎 BM25 index: {bm25_path.name} ({count} chunks)")
 
     print("\n🎉 Chunking complete")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from embedder import MAX_TEXTS_PER_REQUEST, MAX_TOKENS_PER_REQUEST, split_batches
+
+
+# Near-duplicate detection between chunker.py and ingest.py.
+#
+# Consecutive slides often repeat the previous page verbatim, and a PPTX and
+# its PDF export produce the same text twice. Each chunk gets a MinHash
+# signature over word shingles; LSH banding finds candidate pairs and a chunk
+# whose estimated Jaccard similarity with an earlier chunk is >= threshold
+# becomes an alias of it:
+#   alias:     "duplicate_of": <canonical chunk_id>   (not embedded)
+#   canonical: "duplicates": [{doc_name, page, page_end, source_path, chunk_id}, ...]
+# The first occurrence in chunks.jsonl order is canonical, so results are
+# deterministic.
+
+NUM_PERM = 64
+LSH_BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 Jaccard become candidates
+SHINGLE_WORDS = 5
+DEFAULT_THRESHOLD = 0.85
+
+PROVENANCE_KEYS = ("doc_name", "page", "page_end", "source_path", "chunk_id")
+
+# Fixed seeds: signatures are comparable across runs and machines.
+_rng = np.random.default_rng(20240611)
+_PERM_A = _rng.integers(1, np.iinfo(np.int64).max, NUM_PERM, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, np.iinfo(np.int64).max, NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text: str) -> np.ndarray:
+    hashes = np.fromiter((_hash64(s) for s in shingles(text)), dtype=np.uint64)
+    # (a*h + b) mod 2^64 with odd a permutes uint64; numpy wraps on overflow.
+    return (hashes[None, :] * _PERM_A[:, None] + _PERM_B[:, None]).min(axis=1)
+
+
+def find_near_duplicates(texts: List[str], threshold: float = DEFAULT_THRESHOLD) -> List[int]:
+    # canonical[i] = index of the earliest near-duplicate of texts[i] (i itself if none).
+    rows = NUM_PERM // LSH_BANDS
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    signatures: List[np.ndarray] = []
+    canonical: List[int] = []
+
+    for i, text in enumerate(texts):
+        sig = minhash(text)
+        signatures.append(sig)
+        keys = [(band, sig[band * rows:(band + 1) * rows].tobytes()) for band in range(LSH_BANDS)]
+
+        match = i
+        candidates = sorted({j for key in keys for j in buckets.get(key, ())})
+        for j in candidates:
+            if float(np.mean(signatures[j] == sig)) >= threshold:
+                match = j
+                break
+        canonical.append(match)
+
+        # Only canonical chunks are bucketed, so aliases never chain.
+        if match == i:
+            for key in keys:
+                buckets.setdefault(key, []).append(i)
+    return canonical
+
+
+def annotate_duplicates(records: List[Dict], threshold: float = DEFAULT_THRESHOLD) -> Tuple[List[Dict], int]:
+    # Returns (annotated copies of records, number of aliases). Records need
+    # "text" and "chunk_id"; stale annotations from an earlier pass are replaced.
+    canonical = find_near_duplicates([r["text"] for r in records], threshold)
+    annotated = []
+    for record in records:
+        record = {k: v for k, v in record.items() if k not in ("duplicate_of", "duplicates")}
+        annotated.append(record)
+
+    aliases = 0
+    for i, j in enumerate(canonical):
+        if i == j:
+            continue
+        aliases += 1
+        annotated[i]["duplicate_of"] = annotated[j]["chunk_id"]
+        provenance = {k: annotated[i][k] for k in PROVENANCE_KEYS if annotated[i].get(k) is not None}
+        annotated[j].setdefault("duplicates", []).append(provenance)
+    return annotated, aliases
+
+
+def main() -> None:
+    # Dry run: report what ingest.py would skip for a chunks.jsonl file.
+    parser = argparse.ArgumentParser(description="Report near-duplicate chunks in a chunks.jsonl file")
+    parser.add_argument("chunks_jsonl", type=Path)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--examples", type=int, default=5, help="Alias pairs to print")
+    args = parser.parse_args()
+
+    with open(args.chunks_jsonl, "r", encoding="utf-8") as f:
+        records = [r for r in (json.loads(line) for line in f if line.strip()) if r.get("text")]
+    for i, record in enumerate(records):
+        record.setdefault("chunk_id", i)
+
+    annotated, aliases = annotate_duplicates(records, args.threshold)
+    by_id = {r["chunk_id"]: r for r in annotated}
+    shown = 0
+    for record in annotated:
+        if "duplicate_of" in record and shown < args.examples:
+            original = by_id[record["duplicate_of"]]
+            print(f"  {record['doc_name']} p{record.get('page')} ~ {original['doc_name']} p{original.get('page')}")
+            shown += 1
+
+    def requests(texts: List[str]) -> int:
+        return len(list(split_batches(texts, MAX_TEXTS_PER_REQUEST, MAX_TOKENS_PER_REQUEST)))
+
+    requests_all = requests([r["text"] for r in annotated])
+    requests_kept = requests([r["text"] for r in annotated if "duplicate_of" not in r])
+    print(
+        f"{aliases} of {len(annotated)} chunks are near-duplicates (threshold {args.threshold}): "
+        f"{aliases} embedding inputs and {requests_all - requests_kept} of {requests_all} requests saved"
+    )
+
+
+if __name__ == "__main__":
+    main()
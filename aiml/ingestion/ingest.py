@@ -1,22 +1,52 @@
+import argparse
 import json
 import os
-import time
+import shutil
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
-from typing import Dict, Iterable, Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import faiss
 import numpy as np
 from dotenv import load_dotenv
 from google import genai
 
-from embedder import Embedder
+from chunk_store import ChunkStore, store_path_for, write_chunk_store
+from embedder import (
+    EMBED_BACKENDS,
+    EmbeddingBackend,
+    EmbeddingMismatch,
+    create_embedder,
+    estimate_tokens,
+    is_rate_limit_error,
+)
+from embedding_store import EmbeddingStore
+from index_factory import (
+    INDEX_KINDS,
+    base_index,
+    build_index,
+    flat_index,
+    index_meta_path,
+    index_metric,
+    read_index_meta,
+    remove_ids,
+    stored_vectors,
+    write_index_meta,
+)
+from ingestion.dedup import annotate_duplicates
+from ingestion.rate_limit import RateLimiter
+from lexical import lexical_path_for
 
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 ENV_PATH = SCRIPT_DIR.parent / ".env"  # one folder above: aiml/.env
 OUTPUT_DIR = SCRIPT_DIR / "output"
+# Where the server looks for per-semester indexes (see --publish).
+DATA_DIR = SCRIPT_DIR.parent / "data"
 
 DEFAULT_INPUT_JSONL = OUTPUT_DIR / "chunks.jsonl"
+DEFAULT_DELTA_PATH = OUTPUT_DIR / "delta.json"
 DEFAULT_INDEX_PATH = OUTPUT_DIR / "FY_Sem-1_faiss.index"
 
 # Resume/checkpointing
@@ -29,9 +59,46 @@ SAVE_INDEX_EVERY_BATCH = True
 # - If progress_faiss > 0: must load existing index and append
 REBUILD_IF_PROGRESS_ZERO = True
 
-# Throttle embedding calls to avoid rate limits
-EMBED_REQUESTS_PER_SECOND = 1.4
-MIN_SECONDS_BETWEEN_EMBEDS = 1.0 / EMBED_REQUESTS_PER_SECOND
+# Throttle embedding requests to avoid rate limits (shared by all workers).
+# Each request carries a whole batch of chunks (see EmbeddingBackend.batches).
+# Set these to your Gemini quota tier.
+EMBED_REQUESTS_PER_MINUTE = 84
+EMBED_TOKENS_PER_MINUTE = 1_000_000
+
+# Concurrent embedding workers. 1 = one request at a time.
+# Override with INGEST_WORKERS=<n>.
+DEFAULT_INGEST_WORKERS = 1
+
+# ANN index type built at the end of ingestion (see index_factory.INDEX_KINDS).
+# Override with INDEX_TYPE=hnsw|ivf_flat|ivf_pq|sq8. Parameters are written to
+# {course}_{semester}_faiss.json next to the index.
+DEFAULT_INDEX_TYPE = "flat"
+
+# Indexes are labelled with the chunker's stable chunk ids ("ids": "chunk_id"
+# in the index meta) when chunks.jsonl has them, so documents can be added,
+# removed or replaced in place. Older indexes are positional (label = row of
+# chunks.jsonl); of those, only kinds that keep insertion order and renumber
+# rows on remove_ids can take a chunker delta.
+DELTA_INDEX_KINDS = ("flat", "sq8")
+
+# Near-duplicate chunks (MinHash, see ingestion/dedup.py) are not embedded:
+# they alias an earlier chunk and are listed in its "duplicates". Only for
+# indexes labelled with chunk ids. Override with DEDUP_THRESHOLD=<0..1>; 0 disables.
+DEFAULT_DEDUP_THRESHOLD = 0.85
+
+# Embeddings are kept in a content-addressed store keyed by (model, text), so a
+# re-chunked corpus (chunker.py --redo) only sends text that was never embedded.
+# Override the location with EMBEDDING_STORE_DIR=<dir>. Local backends
+# (--embed-backend hashing) skip the store and the rate limiter.
+USE_EMBEDDING_STORE = True
+DEFAULT_EMBEDDING_STORE_DIR = OUTPUT_DIR / "embeddings"
+
+# Longest run of cached chunks handed to one worker, so checkpoints stay frequent.
+CACHED_BATCH_SPAN = 1024
+
+# Write a compact chunk store ({course}_{semester}_chunks.store) next to the index.
+# Retriever prefers it over chunks.jsonl when it is present and up to date.
+WRITE_CHUNK_STORE = True
 
 # Retry handling for quota/rate limits
 MAX_EMBED_RETRIES = 10
@@ -94,14 +161,40 @@ def save_faiss_index(index: faiss.Index, path: Path) -> None:
     os.replace(tmp, path)
 
 
-def is_rate_limit_error(exc: Exception) -> bool:
-    msg = str(exc)
-    return (
-        ("429" in msg)
-        or ("RESOURCE_EXHAUSTED" in msg)
-        or ("rate" in msg.lower() and "limit" in msg.lower())
-        or ("quota" in msg.lower() and "exceed" in msg.lower())
-    )
+def publish(index_path: Path, chunks_path: Path, scope: str, data_dir: Path = DATA_DIR) -> List[Path]:
+    # Copy an index and its chunk artifacts to data/{course}/{semester}/ under
+    # the names the Retriever loads: {course}_{semester}_faiss.index / _faiss.json
+    # / _chunks.jsonl / _chunks.store / _chunks.bm25. Each file is replaced
+    # atomically; the server reloads the semester on its next request.
+    course, sep, semester = scope.partition("/")
+    if not sep or not course or not semester:
+        raise ValueError(f"Invalid scope {scope!r}; expected COURSE/SEMESTER, e.g. FY/Sem-1")
+    folder = data_dir / course / semester
+    prefix = f"{course}_{semester.replace(' ', '-')}"
+    # Chunks before the store: the store is only used when it isn't older.
+    pairs = [
+        (chunks_path, folder / f"{prefix}_chunks.jsonl"),
+        (store_path_for(chunks_path), folder / f"{prefix}_chunks.store"),
+        (lexical_path_for(chunks_path), folder / f"{prefix}_chunks.bm25"),
+        (index_meta_path(index_path), folder / f"{prefix}_faiss.json"),
+        (index_path, folder / f"{prefix}_faiss.index"),
+    ]
+    for src, _ in (pairs[0], pairs[-1]):
+        if not src.exists():
+            raise FileNotFoundError(f"Nothing to publish: {src} is missing")
+
+    folder.mkdir(parents=True, exist_ok=True)
+    written = []
+    for src, dst in pairs:
+        if not src.exists():
+            print(f"Not publishing {src.name}: not built")
+            continue
+        tmp = Path(str(dst) + ".tmp")
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+        written.append(dst)
+    print(f"Published {len(written)} files to {folder}")
+    return written
 
 
 def extract_retry_after_seconds(exc: Exception) -> float:
@@ -129,16 +222,311 @@ def extract_retry_after_seconds(exc: Exception) -> float:
 class Ingestor:
     def __init__(
         self,
-        embedder: Embedder,
+        embedder: EmbeddingBackend,
         input_jsonl: Path = DEFAULT_INPUT_JSONL,
         index_path: Path = DEFAULT_INDEX_PATH,
         batch_size: int = 32,
+        workers: Optional[int] = None,
+        limiter: Optional[RateLimiter] = None,
+        store_path: Optional[Path] = None,
+        index_type: Optional[str] = None,
+        dedup_threshold: Optional[float] = None,
+        embedding_store: Optional[EmbeddingStore] = None,
     ):
         self.embedder = embedder
         self.input_jsonl = input_jsonl
         self.index_path = index_path
+        # Named after the chunks file, like the BM25 index the chunker writes
+        # (chunks.jsonl -> chunks.store, chunks.bm25).
+        self.store_path = store_path or store_path_for(input_jsonl)
         self.batch_size = batch_size
 
+        self.index_type = (index_type or os.getenv("INDEX_TYPE") or DEFAULT_INDEX_TYPE).lower()
+        if self.index_type not in INDEX_KINDS:
+            raise ValueError(f"Unknown INDEX_TYPE {self.index_type!r}; expected one of {INDEX_KINDS}")
+
+        if dedup_threshold is None:
+            dedup_threshold = float(os.getenv("DEDUP_THRESHOLD", DEFAULT_DEDUP_THRESHOLD))
+        self.dedup_threshold = dedup_threshold
+
+        if embedding_store is None and USE_EMBEDDING_STORE and embedder.remote:
+            embedding_store = EmbeddingStore(Path(os.getenv("EMBEDDING_STORE_DIR") or DEFAULT_EMBEDDING_STORE_DIR))
+        self.embedding_store = embedding_store
+
+        if workers is None:
+            try:
+                workers = int(os.getenv("INGEST_WORKERS", DEFAULT_INGEST_WORKERS))
+            except ValueError:
+                workers = DEFAULT_INGEST_WORKERS
+        self.workers = max(1, workers)
+
+        self.limiter = limiter or RateLimiter(
+            requests_per_minute=EMBED_REQUESTS_PER_MINUTE,
+            tokens_per_minute=EMBED_TOKENS_PER_MINUTE,
+            token_burst=embedder.max_tokens_per_request,
+        )
+
+    def _embed_with_retry(self, texts: list[str]) -> np.ndarray:
+        # Runs on a worker thread. A 429 pauses every worker via the shared limiter.
+        if not self.embedder.remote:
+            return self.embedder.embed_texts(texts)
+        tokens = sum(estimate_tokens(t) for t in texts)
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens)
+            try:
+                vecs = self.embedder.embed_texts(texts)
+                self.limiter.record_success()
+                return vecs
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= MAX_EMBED_RETRIES:
+                    raise
+                wait_s = extract_retry_after_seconds(e)
+                attempt += 1
+                print(
+                    f"Rate-limited (attempt {attempt}/{MAX_EMBED_RETRIES}). "
+                    f"Backing off all workers for {wait_s:.1f}s..."
+                )
+                self.limiter.backoff(wait_s)
+
+    def _embed_cached(self, texts: list[str]) -> np.ndarray:
+        # Runs on a worker thread: stored vectors for known texts, one request for the rest.
+        if self.embedding_store is None:
+            return self._embed_with_retry(texts)
+        vectors = self.embedding_store.get_many(self.embedder.vector_key, texts)
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            fresh = self._embed_with_retry([texts[i] for i in missing])
+            self.embedding_store.put_many(self.embedder.vector_key, [texts[i] for i in missing], fresh)
+            for i, vec in zip(missing, fresh):
+                vectors[i] = vec
+        return np.vstack(vectors)
+
+    def _plan_batches(self, texts: list[str]) -> List[Tuple[int, int, int]]:
+        # Contiguous (start, end, uncached) ranges of texts, each needing at most
+        # one embed request: request batches are cut from the uncached texts only,
+        # so cached chunks never count against the per-request limits.
+        if self.embedding_store is None:
+            return [(start, end, end - start) for start, end in self.embedder.batches(texts)]
+
+        cached = self.embedding_store.contains(self.embedder.vector_key, texts)
+        missing = [i for i, hit in enumerate(cached) if not hit]
+        plan: List[Tuple[int, int, int]] = []
+
+        def add_cached(start: int, end: int) -> None:
+            for pos in range(start, end, CACHED_BATCH_SPAN):
+                plan.append((pos, min(end, pos + CACHED_BATCH_SPAN), 0))
+
+        start = 0
+        for m_start, m_end in self.embedder.batches([texts[i] for i in missing]):
+            first, end = missing[m_start], missing[m_end - 1] + 1
+            add_cached(start, first)
+            plan.append((first, end, m_end - m_start))
+            start = end
+        add_cached(start, len(texts))
+
+        print(
+            f"Embedding store: {len(texts) - len(missing)} of {len(texts)} chunks cached, "
+            f"{len(missing)} to embed in {sum(1 for p in plan if p[2])} requests"
+        )
+        return plan
+
+    def _check_embedder(self, meta: Dict, index: faiss.Index) -> None:
+        # Vectors added to an existing index must come from the embedder it was built with.
+        try:
+            self.embedder.check_index(meta, int(index.d))
+        except EmbeddingMismatch as e:
+            raise RuntimeError(
+                f"Can't extend {self.index_path}: {e}. Use the same --embed-backend, "
+                f"or re-ingest from scratch (progress_faiss=0)."
+            ) from e
+
+    def _read_records(self) -> List[Dict]:
+        # Every chunk with text, in chunks.jsonl order.
+        return [r for r in iter_jsonl(self.input_jsonl) if r.get("text")]
+
+    def _annotate_duplicates(self, records: List[Dict]) -> List[Dict]:
+        if self.dedup_threshold <= 0 or not records:
+            return records
+
+        records, aliases = annotate_duplicates(records, self.dedup_threshold)
+        if aliases:
+            requests_all = len(list(self.embedder.batches([r["text"] for r in records])))
+            requests_kept = len(list(self.embedder.batches([r["text"] for r in records if "duplicate_of" not in r])))
+            print(
+                f"Near-duplicates: {aliases} of {len(records)} chunks alias an earlier chunk "
+                f"(threshold {self.dedup_threshold}); saving {aliases} embedding inputs, "
+                f"{requests_all - requests_kept} of {requests_all} requests"
+            )
+        return records
+
+    def _write_meta(self, index: faiss.Index, index_params: Dict, ids: str, **extra_meta) -> None:
+        write_index_meta(
+            self.index_path,
+            {
+                "index": index_params,
+                "dim": int(index.d),
+                "ntotal": int(index.ntotal),
+                "metric": index_metric(index),
+                "ids": ids,
+                **self.embedder.meta(),
+                "chunks": self.input_jsonl.name,
+                **extra_meta,
+            },
+        )
+
+    def _write_checkpoint(self, index: faiss.Index, ids: str) -> None:
+        # The meta goes with every checkpoint: a resumed run checks it against
+        # its embedder (backend, model, output dim) before appending vectors.
+        if isinstance(base_index(index), faiss.IndexFlat):
+            index_params = {"kind": "flat", "factory": "Flat"}
+        else:
+            # Appending to a finished ANN index: keep its recorded parameters.
+            index_params = read_index_meta(self.index_path).get("index", {})
+        save_faiss_index(index, self.index_path)
+        self._write_meta(index, index_params, ids)
+        write_progress(int(index.ntotal))
+
+    def _write_outputs(
+        self,
+        index: faiss.Index,
+        index_params: Dict,
+        ids: str,
+        records: Optional[List[Dict]] = None,
+        **extra_meta,
+    ) -> None:
+        save_faiss_index(index, self.index_path)
+        write_progress(int(index.ntotal))
+        self._write_meta(index, index_params, ids, **extra_meta)
+
+        if WRITE_CHUNK_STORE:
+            # The store keeps the dedup annotations: Retriever reads provenance from it.
+            if records is None:
+                records = (r for r in iter_jsonl(self.input_jsonl) if r.get("text"))
+            if ids == "position":
+                # Row i of the store is FAISS row i: same text filter, same order.
+                records = islice(records, int(index.ntotal))
+            count = write_chunk_store(self.store_path, records)
+            print(f"Wrote chunk store: {self.store_path} ({count} chunks)")
+
+    def _embed_records(self, records: list[Dict]) -> np.ndarray:
+        texts = [r["text"] for r in records]
+        batches = self._plan_batches(texts)
+        print(f"Embedding {len(texts)} chunks in {sum(1 for b in batches if b[2])} requests")
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # map() keeps batch order, so vectors line up with records.
+            return np.vstack(list(pool.map(lambda b: self._embed_cached(texts[b[0]:b[1]]), batches)))
+
+    # Per-document operations on an index labelled with chunk ids. They work
+    # on a loaded index and return it (HNSW is rebuilt on removal, so the
+    # returned object may be new); persist with _write_outputs.
+
+    def add_chunks(self, index: faiss.Index, records: list[Dict]) -> faiss.Index:
+        records = [r for r in records if r.get("text") and "duplicate_of" not in r]
+        if records:
+            ids = np.asarray([r["chunk_id"] for r in records], dtype=np.int64)
+            index.add_with_ids(self._embed_records(records), ids)
+        return index
+
+    def remove_chunks(self, index: faiss.Index, chunk_ids: Iterable[int], index_params: Optional[Dict] = None) -> faiss.Index:
+        index, removed = remove_ids(index, np.fromiter(chunk_ids, dtype=np.int64), index_params)
+        if removed:
+            print(f"Removed {removed} vectors")
+        return index
+
+    def replace_chunks(
+        self,
+        index: faiss.Index,
+        old_chunk_ids: Iterable[int],
+        records: list[Dict],
+        index_params: Optional[Dict] = None,
+    ) -> faiss.Index:
+        # Re-chunked document: drop its previous chunks, add the new ones.
+        index = self.remove_chunks(index, old_chunk_ids, index_params)
+        return self.add_chunks(index, records)
+
+    def _embedded_ids(self, index: faiss.Index) -> Set[int]:
+        # Chunk ids that currently have a vector.
+        if isinstance(index, faiss.IndexIDMap):
+            return set(faiss.vector_to_array(index.id_map).tolist())
+        # IVF keeps ids inside its inverted lists; the chunk store written with
+        # the index says which chunks were embedded.
+        if not self.store_path.exists():
+            raise RuntimeError(f"Chunk store {self.store_path} is needed to update this index in place")
+        store = ChunkStore(self.store_path)
+        return {
+            cid for cid, alias in zip(store.column("chunk_id"), store.column("duplicate_of"))
+            if cid is not None and alias is None
+        }
+
+    def apply_delta(self, delta_path: Path = DEFAULT_DELTA_PATH) -> int:
+        # Apply a chunker --incremental delta to the existing index: drop the
+        # vectors of changed/deleted files, embed only the appended chunks.
+        with open(delta_path, "r", encoding="utf-8") as f:
+            delta = json.load(f)
+
+        if not self.index_path.exists():
+            raise RuntimeError(f"No index at {self.index_path}; run a full ingestion first")
+        meta = read_index_meta(self.index_path)
+        index = faiss.read_index(str(self.index_path))
+        ntotal = int(index.ntotal)
+        ids = meta.get("ids", "position")
+        index_params = meta.get("index") or {"kind": "flat", "factory": "Flat"}
+        self._check_embedder(meta, index)
+
+        if meta.get("applied_delta") == delta["id"]:
+            print(f"Delta {delta['id']} already applied (ntotal={ntotal})")
+            return ntotal
+        if ids == "position" and ntotal != delta["base_total"]:
+            raise RuntimeError(
+                f"Index has {ntotal} vectors but delta {delta['id']} expects {delta['base_total']}; "
+                f"it was built from a different chunks.jsonl. Re-ingest from scratch (progress_faiss=0)."
+            )
+
+        store_records = None
+        if ids == "chunk_id":
+            # Diff by id rather than replaying ranges: dedup can also promote an
+            # alias (its original was deleted) or demote a chunk to an alias.
+            store_records = self._annotate_duplicates(self._read_records())
+            wanted = {r["chunk_id"]: r for r in store_records if "duplicate_of" not in r}
+            embedded = self._embedded_ids(index)
+            changed = set(delta["removed_ids"])
+            to_remove = [cid for cid in embedded if cid not in wanted or cid in changed]
+            to_add = [r for cid, r in wanted.items() if cid not in embedded or cid in changed]
+            index = self.replace_chunks(index, to_remove, to_add, index_params)
+            expected_total = len(wanted)
+        else:
+            added_start, added_count = (int(v) for v in delta["added"])
+            records = (r for r in iter_jsonl(self.input_jsonl) if r.get("text"))
+            added = list(islice(records, added_start, added_start + added_count))
+            if len(added) != added_count:
+                raise RuntimeError(f"{self.input_jsonl} is missing chunks {added_start}-{added_start + added_count}")
+
+            if index_params.get("kind", "flat") not in DELTA_INDEX_KINDS:
+                raise RuntimeError(
+                    f"Positional {index_params.get('kind')} indexes can't drop rows in place; "
+                    f"re-ingest from scratch to get an index labelled with chunk ids"
+                )
+            removed = [(int(start), int(count)) for start, count in delta["removed"]]
+            if removed:
+                rows = np.concatenate([np.arange(start, start + count, dtype=np.int64) for start, count in removed])
+                index.remove_ids(rows)
+                print(f"Removed {len(rows)} vectors of changed/deleted files")
+            if added:
+                index.add(self._embed_records(added))
+            expected_total = delta["new_total"]
+
+        if int(index.ntotal) != expected_total:
+            raise RuntimeError(f"Index has {int(index.ntotal)} vectors after the delta, expected {expected_total}")
+
+        self._write_outputs(index, index_params, ids, store_records, applied_delta=delta["id"])
+        print(
+            f"Applied delta {delta['id']}: {ntotal} -> {int(index.ntotal)} vectors "
+            f"({len(delta['files']['added'])} added, {len(delta['files']['changed'])} changed, "
+            f"{len(delta['files']['deleted'])} deleted files)"
+        )
+        return int(index.ntotal)
+
     def ingest(self) -> int:
         if not self.input_jsonl.exists():
             print(f"Input chunks file not found: {self.input_jsonl}")
@@ -187,6 +575,13 @@ class Ingestor:
             except Exception as e:
                 raise RuntimeError(f"Failed to read existing index at {self.index_path}: {e}") from e
 
+            meta = read_index_meta(self.index_path)
+            if not meta.get("embed_backend"):
+                # Checkpoints from before the meta was saved with them: the
+                # run is being resumed with the embedder that started it.
+                print(f"⚠ {self.index_path.name} has no embedder meta; assuming {self.embedder.vector_key}")
+                meta = {**self.embedder.meta(), "dim": meta.get("dim")}
+            self._check_embedder(meta, index)
             existing = int(getattr(index, "ntotal", 0))
             if existing <= 0:
                 print(
@@ -211,32 +606,33 @@ class Ingestor:
         if resume_from > 0:
             print(f"Resuming FAISS build from vector #{resume_from} (already indexed)")
 
+        # Checkpoints are IndexIDMap2; IVF indexes keep ids natively and say so in the meta.
+        index_has_ids = index is not None and (
+            isinstance(index, faiss.IndexIDMap) or read_index_meta(self.index_path).get("ids") == "chunk_id"
+        )
+
         vectors_batch: list[np.ndarray] = []
+        pending_rows = 0
         total = 0
 
-        last_embed_at: Optional[float] = None
-
+        # Collect this run's chunks in the SAME order as chunks.jsonl lines.
         # Cursor counts how many valid chunks (with text) we've passed.
+        texts: list[str] = []
+        labels: list[str] = []
+        chunk_ids: list[int] = []
         cursor = 0
 
-        # Build vectors in the SAME order as chunks.jsonl lines.
-        fatal_error: Optional[Exception] = None
-
-        def commit_batch() -> None:
-            nonlocal index
-            if index is None or not vectors_batch:
-                return
-            index.add(np.vstack(vectors_batch))
-            vectors_batch.clear()
-
-            if SAVE_INDEX_EVERY_BATCH:
-                save_faiss_index(index, self.index_path)
-                write_progress(int(index.ntotal))
-                print(f"✅ Saved checkpoint: {self.index_path.name} (ntotal={int(index.ntotal)})")
-
-        for record in iter_jsonl(self.input_jsonl):
-            text = record.get("text")
-            if not text:
+        # chunks.jsonl from a chunker that assigns ids -> id-labelled index,
+        # unless we are appending to an existing positional one. Near-duplicates
+        # only need no vector when vectors are looked up by id.
+        records = self._read_records()
+        use_ids = bool(records) and "chunk_id" in records[0] and (index is None or index_has_ids)
+        if use_ids:
+            records = self._annotate_duplicates(records)
+
+        for record in records:
+            text = record["text"]
+            if "duplicate_of" in record:
                 continue
 
             # Skip already-committed chunks when resuming.
@@ -244,106 +640,192 @@ class Ingestor:
                 cursor += 1
                 continue
 
-            if limit > 0 and total >= limit:
+            if limit > 0 and len(texts) >= limit:
                 print(f"Reached INGEST_LIMIT={limit}. Stopping early.")
                 break
 
             cursor += 1
+            doc_name = record.get("doc_name") or record.get("doc") or "(unknown)"
+            page = record.get("page")
+            labels.append(f"{doc_name} p{page}" if page is not None else doc_name)
+            texts.append(text)
+            if use_ids:
+                chunk_ids.append(int(record["chunk_id"]))
 
-            # Print progress so you know it's alive
-            if PRINT_EVERY_N > 0 and (total % PRINT_EVERY_N == 0):
-                doc_name = record.get("doc_name") or record.get("doc") or "(unknown)"
-                page = record.get("page")
-                extra = f" p{page}" if page is not None else ""
-                overall_i = resume_from + total + 1
-                overall_total = total_lines
-                if limit > 0:
-                    run_total = min(limit, max(0, total_lines - resume_from))
-                    print(
-                        f"Embedding {overall_i}/{overall_total} (run {total + 1}/{run_total}): {doc_name}{extra}"
-                    )
-                else:
-                    print(f"Embedding {overall_i}/{overall_total}: {doc_name}{extra}")
-
-            # Enforce 1 request / second
-            now = time.monotonic()
-            if last_embed_at is not None:
-                elapsed = now - last_embed_at
-                if elapsed < MIN_SECONDS_BETWEEN_EMBEDS:
-                    time.sleep(MIN_SECONDS_BETWEEN_EMBEDS - elapsed)
-
-            # Retry on quota/rate-limit errors
-            attempt = 0
-            while True:
-                try:
-                    vec = self.embedder.embed_text(text)
-                    last_embed_at = time.monotonic()
-                    break
-                except Exception as e:
-                    if not is_rate_limit_error(e) or attempt >= MAX_EMBED_RETRIES:
-                        fatal_error = e
-                        break
-                    wait_s = extract_retry_after_seconds(e)
-                    attempt += 1
-                    print(
-                        f"Rate-limited (attempt {attempt}/{MAX_EMBED_RETRIES}). "
-                        f"Sleeping {wait_s:.1f}s..."
-                    )
-                    time.sleep(wait_s)
-
-            if fatal_error is not None:
-                print(f"❌ Embedding failed. Saving current progress then exiting. Error: {fatal_error}")
-                # Save what we already have in-memory.
-                commit_batch()
-                # Also save index even if the last batch isn't full.
-                if index is not None and vectors_batch:
-                    index.add(np.vstack(vectors_batch))
-                    vectors_batch.clear()
-                    save_faiss_index(index, self.index_path)
-                    write_progress(int(index.ntotal))
-                    print(f"✅ Saved final partial batch (ntotal={int(index.ntotal)})")
-                return int(index.ntotal) if index is not None else 0
-
+        fatal_error: Optional[Exception] = None
+        added_rows = 0
+
+        def add_vectors(vecs: np.ndarray) -> None:
+            # Batches arrive in chunks.jsonl order, so the next ids are the next slice.
+            nonlocal added_rows
+            if use_ids:
+                index.add_with_ids(vecs, np.asarray(chunk_ids[added_rows:added_rows + len(vecs)], dtype=np.int64))
+            else:
+                index.add(vecs)
+            added_rows += len(vecs)
+
+        def commit_batch(force_save: bool = False) -> None:
+            nonlocal index, pending_rows
             if index is None:
-                index = faiss.IndexFlatL2(int(vec.shape[0]))
+                return
+            if vectors_batch:
+                add_vectors(np.vstack(vectors_batch))
+                vectors_batch.clear()
+                pending_rows = 0
+
+            if SAVE_INDEX_EVERY_BATCH or force_save:
+                self._write_checkpoint(index, "chunk_id" if use_ids else "position")
+                print(f"✅ Saved checkpoint: {self.index_path.name} (ntotal={int(index.ntotal)})")
+
+        # At most one embed_content request per batch, paced by the shared rate limiter.
+        batches = self._plan_batches(texts)
+        if self.workers > 1:
+            print(f"Concurrent ingestion: {self.workers} workers, {sum(1 for b in batches if b[2])} requests")
 
-            vectors_batch.append(vec)
-            total += 1
+        # Workers can finish out of order. Vectors only enter the index as a contiguous
+        # prefix of batches, so progress_faiss always matches chunks.jsonl order.
+        completed: Dict[int, np.ndarray] = {}
+        in_flight: Dict[Future, int] = {}
+        next_to_submit = 0
+        next_to_commit = 0
 
-            if len(vectors_batch) >= self.batch_size:
-                commit_batch()
-                print(f"Added batch to FAISS. Total embedded so far (this run): {total}")
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                while (
+                    fatal_error is None
+                    and next_to_submit < len(batches)
+                    and len(in_flight) < self.workers * 2
+                ):
+                    start, end, uncached = batches[next_to_submit]
+                    if PRINT_EVERY_N > 0 and (next_to_submit % PRINT_EVERY_N == 0):
+                        first_i = resume_from + start + 1
+                        last_i = resume_from + end
+                        print(
+                            f"Embedding {first_i}-{last_i}/{total_lines} "
+                            f"({uncached} of {end - start} chunks uncached): {labels[start]}"
+                        )
+                    future = pool.submit(self._embed_cached, texts[start:end])
+                    in_flight[future] = next_to_submit
+                    next_to_submit += 1
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_num = in_flight.pop(future)
+                    try:
+                        completed[batch_num] = future.result()
+                    except Exception as e:
+                        if fatal_error is None:
+                            fatal_error = e
+
+                while next_to_commit in completed:
+                    vecs = completed.pop(next_to_commit)
+                    next_to_commit += 1
+
+                    if index is None:
+                        index = flat_index(int(vecs.shape[1]), self.embedder.metric)
+                        if use_ids:
+                            index = faiss.IndexIDMap2(index)
+
+                    vectors_batch.append(vecs)
+                    pending_rows += int(vecs.shape[0])
+                    total += int(vecs.shape[0])
+
+                    if pending_rows >= self.batch_size:
+                        commit_batch()
+                        print(f"Added batch to FAISS. Total embedded so far (this run): {total}")
+
+        if fatal_error is not None:
+            print(f"❌ Embedding failed. Saving current progress then exiting. Error: {fatal_error}")
+            # Save the contiguous prefix we already have, even if the last batch isn't full.
+            commit_batch(force_save=True)
+            return int(index.ntotal) if index is not None else 0
 
         if index is None:
             print("No valid records found to ingest.")
             return 0
 
         if vectors_batch:
-            index.add(np.vstack(vectors_batch))
+            add_vectors(np.vstack(vectors_batch))
             vectors_batch.clear()
 
+        # Embeddings are checkpointed into a flat index; an ANN index is trained and
+        # built from those vectors once all of them are available.
+        is_flat_checkpoint = isinstance(base_index(index), faiss.IndexFlat)
+        if self.index_type != "flat" and is_flat_checkpoint:
+            vectors, ids = stored_vectors(index)
+            index, index_params = build_index(vectors, self.index_type, ids=ids, metric=index_metric(index))
+        elif is_flat_checkpoint:
+            index_params = {"kind": "flat", "factory": "Flat"}
+        else:
+            index_params = read_index_meta(self.index_path).get("index", {})
+
         # Final save
-        save_faiss_index(index, self.index_path)
-        write_progress(int(index.ntotal))
+        self._write_outputs(index, index_params, "chunk_id" if use_ids else "position", records)
 
         print(f"Ingestion complete: {total} chunks (this run)")
-        print(f"Wrote index: {self.index_path} (ntotal={int(index.ntotal)})")
+        if self.embedding_store is not None:
+            stats = self.embedding_store.stats()
+            print(
+                f"Embedding store: {stats['hits']} vectors reused, {stats['added']} added "
+                f"({stats['entries']} stored, {stats['bytes'] / 1e6:.1f} MB)"
+            )
+        print(f"Wrote index: {self.index_path} ({index_params.get('factory', '?')}, ntotal={int(index.ntotal)})")
         print(f"Using chunks metadata from: {self.input_jsonl}")
         return int(index.ntotal)
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Embed chunks.jsonl into a FAISS index")
+    parser.add_argument(
+        "--delta",
+        nargs="?",
+        const=DEFAULT_DELTA_PATH,
+        type=Path,
+        help="Apply a chunker --incremental delta (default output/delta.json) instead of a full ingestion",
+    )
+    parser.add_argument(
+        "--embed-backend",
+        choices=EMBED_BACKENDS,
+        help="Embedding backend for this index (default EMBED_BACKEND, else gemini); recorded in the index meta",
+    )
+    parser.add_argument(
+        "--embed-dim",
+        type=int,
+        help="Vector size: Gemini output_dimensionality (default GEMINI_EMBED_DIM, else 3072) "
+        "or hashing buckets (default HASHING_EMBED_DIM)",
+    )
+    parser.add_argument(
+        "--publish",
+        metavar="COURSE/SEMESTER",
+        help="Afterwards, copy the index, meta, chunks, chunk store and BM25 index to data/COURSE/SEMESTER/",
+    )
+    args = parser.parse_args()
+
     # Load env from one folder above this script (aiml/.env)
     load_dotenv(dotenv_path=ENV_PATH)
 
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError(f"GEMINI_API_KEY is not set (expected in {ENV_PATH})")
-
-    client = genai.Client(api_key=api_key)
-    embedder = Embedder(client=client)
+    # Read after load_dotenv so .env can choose the backend too.
+    backend = args.embed_backend or os.getenv("EMBED_BACKEND") or "gemini"
+    dim_env = "GEMINI_EMBED_DIM" if backend == "gemini" else "HASHING_EMBED_DIM"
+    dim = args.embed_dim or int(os.getenv(dim_env) or 0) or None
+
+    client = None
+    if backend == "gemini":
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError(f"GEMINI_API_KEY is not set (expected in {ENV_PATH})")
+        client = genai.Client(api_key=api_key)
+    embedder = create_embedder(backend, client=client, dim=dim)
     ingestor = Ingestor(embedder=embedder)
-    ingestor.ingest()
+    if args.delta:
+        ingestor.apply_delta(args.delta)
+    else:
+        ingestor.ingest()
+    if args.publish:
+        publish(ingestor.index_path, ingestor.input_jsonl, args.publish)
 
 
 if __name__ == "__main__":
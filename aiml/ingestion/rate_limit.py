@@ -0,0 +1,85 @@
+import threading
+import time
+from typing import Optional
+
+
+# Adaptive backoff: each 429 halves the effective rate (down to MIN_RATE_SCALE),
+# each successful request recovers a little of it.
+BACKOFF_RATE_FACTOR = 0.5
+RECOVERY_RATE_STEP = 0.05
+MIN_RATE_SCALE = 0.1
+
+
+class TokenBucket:
+    # Token bucket refilled continuously at `rate_per_minute`.
+    # Not thread-safe on its own; RateLimiter guards it with a lock.
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        if rate_per_minute <= 0:
+            raise ValueError(f"rate_per_minute must be > 0, got {rate_per_minute}")
+        self.rate_per_second = float(rate_per_minute) / 60.0
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate_per_second)
+        self.tokens = self.capacity
+        self._last = time.monotonic()
+
+    def refill(self, now: float, scale: float = 1.0) -> None:
+        elapsed = max(0.0, now - self._last)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_second * scale)
+        self._last = now
+
+    def wait_time(self, amount: float, scale: float = 1.0) -> float:
+        # Seconds until `amount` tokens are available (0 if already available).
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.rate_per_second * scale)
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    # Shared requests/min + tokens/min limiter for concurrent embedding workers.
+    # - acquire(tokens): block until one request carrying `tokens` fits in both buckets
+    # - backoff(seconds): pause every worker (e.g. after a 429) and lower the rate
+    # - record_success(): slowly restore the rate
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        request_burst: float = 1.0,
+        token_burst: Optional[float] = None,
+    ):
+        self.requests = TokenBucket(requests_per_minute, capacity=request_burst)
+        self.tokens = TokenBucket(tokens_per_minute, capacity=token_burst)
+        self.rate_scale = 1.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now, self.rate_scale)
+                self.tokens.refill(now, self.rate_scale)
+
+                wait_s = max(
+                    self._paused_until - now,
+                    self.requests.wait_time(1, self.rate_scale),
+                    self.tokens.wait_time(tokens, self.rate_scale),
+                )
+                if wait_s <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+            time.sleep(wait_s)
+
+    def backoff(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + max(0.0, seconds))
+            self.rate_scale = max(MIN_RATE_SCALE, self.rate_scale * BACKOFF_RATE_FACTOR)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.rate_scale = min(1.0, self.rate_scale + RECOVERY_RATE_STEP)
@@ -0,0 +1,171 @@
+import argparse
+import json
+import math
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# Compact BM25 inverted index stored next to each chunks.jsonl as <chunks>.bm25.
+# Doc ids are positions among records with text, i.e. the same ids as FAISS rows.
+#
+# Arrays (CSR layout, one np.savez file):
+#   vocab         utf-8 terms joined by "\n", term id = line number
+#   term_offsets  uint64[V+1] -> slice of postings for each term
+#   doc_ids       uint32 postings (sorted by doc id within a term)
+#   tfs           uint16 term frequency per posting
+#   doc_lengths   uint32[N] tokens per chunk
+
+LEXICAL_SUFFIX = ".bm25"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Very common words that carry no signal for course-material lookups.
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to was what "
+    "when where which why with explain define describe".split()
+)
+
+
+def lexical_path_for(chunks_path: Path) -> Path:
+    # data/FY/Sem-1/FY_Sem-1_chunks.jsonl -> data/FY/Sem-1/FY_Sem-1_chunks.bm25
+    return Path(chunks_path).with_suffix(LEXICAL_SUFFIX)
+
+
+def tokenize(text: str) -> List[str]:
+    # "Cauchy's equation" -> ["cauchy", "equation"]; "JK flip flop" -> ["jk", "flip", "flop"]
+    tokens = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        if tok in STOPWORDS or (len(tok) == 1 and not tok.isdigit()):
+            continue
+        tokens.append(tok)
+    return tokens
+
+
+def build_lexical_index(path: Path, texts: Iterable[str]) -> int:
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_lengths: List[int] = []
+
+    for doc_id, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths.append(len(tokens))
+        counts: Dict[str, int] = {}
+        for tok in tokens:
+            counts[tok] = counts.get(tok, 0) + 1
+        for tok, tf in counts.items():
+            postings.setdefault(tok, []).append((doc_id, tf))
+
+    vocab = sorted(postings)
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.uint64)
+    doc_ids: List[int] = []
+    tfs: List[int] = []
+    for i, term in enumerate(vocab):
+        for doc_id, tf in postings[term]:
+            doc_ids.append(doc_id)
+            tfs.append(min(tf, np.iinfo(np.uint16).max))
+        term_offsets[i + 1] = len(doc_ids)
+
+    return write_lexical_index(path, vocab, term_offsets, doc_ids, tfs, doc_lengths)
+
+
+def write_lexical_index(path: Path, vocab: List[str], term_offsets, doc_ids, tfs, doc_lengths) -> int:
+    # Writes already-built CSR arrays (layout above); vocab must be sorted.
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            vocab=np.frombuffer("\n".join(vocab).encode("utf-8"), dtype=np.uint8),
+            term_offsets=np.asarray(term_offsets, dtype=np.uint64),
+            doc_ids=np.asarray(doc_ids, dtype=np.uint32),
+            tfs=np.asarray(tfs, dtype=np.uint16),
+            doc_lengths=np.asarray(doc_lengths, dtype=np.uint32),
+        )
+    return len(doc_lengths)
+
+
+class BM25Index:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with np.load(self.path) as data:
+            vocab = data["vocab"].tobytes().decode("utf-8")
+            self.term_offsets = data["term_offsets"]
+            self.doc_ids = data["doc_ids"]
+            self.tfs = data["tfs"].astype(np.float32)
+            self.doc_lengths = data["doc_lengths"].astype(np.float32)
+
+        self.terms: Dict[str, int] = {t: i for i, t in enumerate(vocab.split("\n"))} if vocab else {}
+        self.num_docs = int(self.doc_lengths.shape[0])
+        avgdl = float(self.doc_lengths.mean()) if self.num_docs else 0.0
+        # Per-doc BM25 length normalization, precomputed once.
+        self._norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_lengths / max(avgdl, 1e-9))
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def idf(self, df: int) -> float:
+        return math.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns (doc_ids, scores), best first. Empty arrays when no query term matches.
+        # allowed: optional boolean mask over doc ids; other docs never rank.
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        matched = False
+        for tok in set(tokenize(query)):
+            term_id = self.terms.get(tok)
+            if term_id is None:
+                continue
+            start, end = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            scores[docs] += self.idf(end - start) * tf * (BM25_K1 + 1.0) / (tf + self._norm[docs])
+            matched = True
+
+        if not matched or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if allowed is not None:
+            keep = np.zeros(self.num_docs, dtype=bool)
+            n = min(self.num_docs, len(allowed))
+            keep[:n] = allowed[:n]
+            scores[~keep] = 0.0
+        k = min(top_k, self.num_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[scores[top] > 0]
+        return top.astype(np.int64), scores[top]
+
+    def resident_bytes(self) -> int:
+        arrays = self.term_offsets.nbytes + self.doc_ids.nbytes + self.tfs.nbytes
+        arrays += self.doc_lengths.nbytes + self._norm.nbytes
+        # dict of terms: rough per-entry overhead
+        return arrays + len(self.terms) * 100
+
+
+def iter_chunk_texts(chunks_path: Path) -> Iterable[str]:
+    # Same filter as Ingestor: only chunks with text get a FAISS row.
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            text = json.loads(line).get("text")
+            if text:
+                yield text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a BM25 lexical index from a chunks.jsonl file")
+    parser.add_argument("chunks_jsonl", type=Path)
+    args = parser.parse_args()
+
+    out = lexical_path_for(args.chunks_jsonl)
+    count = build_lexical_index(out, iter_chunk_texts(args.chunks_jsonl))
+    print(f"Wrote BM25 index for {count} chunks to {out} ({out.stat().st_size / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,28 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_cors import CORS
 from google import genai
 from google.api_core.exceptions import ResourceExhausted
+import hmac
+import json
 import os
+import re
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
-from embedder import Embedder
+from embedder import create_embedder
 from rag import Retriever
+from query_cache import QueryEmbeddingCache, DEFAULT_MAX_ENTRIES
 from askllm import QAService
+from admission import AdmissionGate, Overloaded
+from answer_cache import SemanticAnswerCache, DEFAULT_MAX_ENTRIES as ANSWER_CACHE_SIZE
+from context_packer import ContextPacker
+from sessions import session_key
+import metrics
 
 from config import Config
+from file_index import FileIndex
 from extensions import jwt, oauth
 from auth.google_oauth import init_google_oauth
 from routes.auth_routes import auth_bp
@@ -20,7 +31,123 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 
 load_dotenv()
 
-def create_app():
+# Browser cache lifetime for /pdf responses; revalidated with ETag afterwards.
+PDF_CACHE_MAX_AGE = int(os.getenv("PDF_CACHE_MAX_AGE", "3600"))
+
+# Most (course, semester) indexes one /ask may search; names become data/ paths.
+MAX_ASK_SCOPES = int(os.getenv("MAX_ASK_SCOPES", "4"))
+SCOPE_NAME = re.compile(r"^[\w\- ]+$")
+
+# `filters` in an /ask body: body key -> chunk field, and limits per field.
+FILTER_KEYS = {"subject": "subject", "category": "category", "document": "doc_name"}
+MAX_FILTER_VALUES = 16
+MAX_FILTER_VALUE_LENGTH = 200
+
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "aiml_request_seconds", "HTTP request latency by endpoint (until the response starts)", ["endpoint"]
+)
+REQUESTS = metrics.REGISTRY.counter("aiml_requests_total", "HTTP requests by endpoint and status", ["endpoint", "status"])
+
+
+def parse_scopes(raw):
+    """`scopes` from an /ask body: ["FY/Sem-1", {"course": "SY", "semester": "Sem-3"}].
+
+    Returns a list of (course, semester) or None when absent; raises ValueError.
+    """
+    if raw is None:
+        return None
+    if not isinstance(raw, list) or not 1 <= len(raw) <= MAX_ASK_SCOPES:
+        raise ValueError(f"scopes must be a list of 1-{MAX_ASK_SCOPES} course/semester pairs")
+    scopes = []
+    for item in raw:
+        if isinstance(item, str) and "/" in item:
+            course, semester = item.split("/", 1)
+        elif isinstance(item, dict):
+            course, semester = item.get("course"), item.get("semester")
+        else:
+            raise ValueError(f"Invalid scope {item!r}; expected \"Course/Semester\"")
+        if not all(isinstance(v, str) and SCOPE_NAME.match(v) for v in (course, semester)):
+            raise ValueError(f"Invalid scope {item!r}")
+        scopes.append((course, semester))
+    return scopes
+
+def parse_filters(raw):
+    """`filters` from an /ask body: {"subject": "BEE", "category": ["Theory", "PYQ"], "document": "Unit 1.pdf"}.
+
+    Returns {chunk field: [values]} or None when absent; raises ValueError.
+    """
+    if raw is None:
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError(f"filters must be an object with keys {', '.join(FILTER_KEYS)}")
+    filters = {}
+    for key, values in raw.items():
+        if key not in FILTER_KEYS:
+            raise ValueError(f"Unknown filter {key!r}; expected one of {', '.join(FILTER_KEYS)}")
+        if isinstance(values, str):
+            values = [values]
+        if (
+            not isinstance(values, list)
+            or not 1 <= len(values) <= MAX_FILTER_VALUES
+            or not all(isinstance(v, str) and 0 < len(v) <= MAX_FILTER_VALUE_LENGTH for v in values)
+        ):
+            raise ValueError(f"filters.{key} must be a string or a list of 1-{MAX_FILTER_VALUES} strings")
+        filters[FILTER_KEYS[key]] = values
+    return filters or None
+
+def register_metrics(retriever, query_cache, qa_service, answer_cache):
+    # Scrape-time views of the stats these components already keep.
+    registry = metrics.REGISTRY
+    registry.counter_callback(
+        "aiml_query_cache_lookups_total",
+        "Query embedding cache lookups by result",
+        lambda: {(result,): query_cache.stats()[result] for result in ("memory_hits", "disk_hits", "misses")},
+        ["result"],
+    )
+    if answer_cache is not None:
+        registry.counter_callback(
+            "aiml_answer_cache_lookups_total",
+            "Semantic answer cache lookups by result",
+            lambda: {(result,): answer_cache.stats()[result] for result in ("hits", "misses")},
+            ["result"],
+        )
+        registry.counter_callback(
+            "aiml_answer_cache_seconds_saved_total",
+            "Generation time skipped by answer cache hits",
+            lambda: {(): answer_cache.stats()["seconds_saved"]},
+        )
+    registry.gauge_callback(
+        "aiml_llm_gate",
+        "LLM admission gate: calls in flight and waiting",
+        lambda: {(state,): qa_service.gate.stats()[state] for state in ("in_flight", "waiting")},
+        ["state"],
+    )
+    registry.counter_callback(
+        "aiml_llm_gate_rejected_total",
+        "Requests rejected by the LLM admission gate (queue full or timed out)",
+        lambda: {(reason,): qa_service.gate.stats()[reason] for reason in ("rejected", "timed_out")},
+        ["reason"],
+    )
+    registry.gauge_callback(
+        "aiml_sessions", "Conversation sessions held in memory", lambda: {(): qa_service.conversations.stats()["sessions"]}
+    )
+    for field, help_text in (
+        ("vectors", "Vectors in each loaded FAISS index"),
+        ("chunks", "Chunks in each loaded index's chunk store"),
+        ("resident_bytes", "Approximate resident bytes of each loaded index"),
+    ):
+        registry.gauge_callback(
+            f"aiml_index_{field}",
+            help_text,
+            lambda field=field: {(s["scope"],): s[field] for s in retriever.loaded_scopes()},
+            ["scope"],
+        )
+
+
+def create_app(client=None):
     app = Flask(__name__)
     app.config.from_object(Config)
     app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET_KEY")
@@ -78,13 +205,73 @@ def create_app():
             )
         return response
 
-    # Initialize Gemini client
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    # Initialize Gemini client (callers may inject one, e.g. a local stub for benchmarks)
+    client = client or genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
     # Instantiate services
-    embedder = Embedder(client) # comment next 2 lines to test auth
-    retriever = Retriever(embedder)
-    qa_service = QAService(client, retriever)
+    # EMBED_BACKEND=hashing embeds queries in-process; GEMINI_EMBED_DIM / HASHING_EMBED_DIM
+    # size the vectors. Indexes built differently get a matching embedder from their meta.
+    backend = os.getenv("EMBED_BACKEND") or "gemini"
+    dim_env = "GEMINI_EMBED_DIM" if backend == "gemini" else "HASHING_EMBED_DIM"
+    embedder = create_embedder(backend, client=client, dim=int(os.getenv(dim_env) or 0) or None)  # comment next 2 lines to test auth
+    # QUERY_CACHE_PATH (optional) persists query embeddings in sqlite across restarts.
+    query_cache = QueryEmbeddingCache(
+        max_entries=int(os.getenv("QUERY_CACHE_SIZE", DEFAULT_MAX_ENTRIES)),
+        db_path=os.getenv("QUERY_CACHE_PATH") or None,
+    )
+    retriever = Retriever(embedder, query_cache=query_cache)
+
+    # WARM_SCOPES="FY/Sem-1,SY/Sem-3" loads those indexes in the background at startup.
+    warm_scopes = [
+        tuple(scope.strip().split("/", 1))
+        for scope in os.getenv("WARM_SCOPES", "FY/Sem-1").split(",")
+        if "/" in scope
+    ]
+    if warm_scopes:
+        retriever.warm(warm_scopes)
+
+    # LLM_MAX_IN_FLIGHT / LLM_MAX_QUEUE / LLM_QUEUE_TIMEOUT_SECONDS size the gate.
+    # ANSWER_CACHE_THRESHOLD / ANSWER_CACHE_TTL_SECONDS / ANSWER_CACHE_SIZE tune the
+    # semantic answer cache; ANSWER_CACHE_SIZE=0 turns it off.
+    answer_cache = SemanticAnswerCache() if ANSWER_CACHE_SIZE > 0 else None
+    # CONTEXT_TOKEN_BUDGET / CONTEXT_CANDIDATES / CONTEXT_MMR_LAMBDA size the prompt context.
+    qa_service = QAService(
+        client, retriever, gate=AdmissionGate(), answer_cache=answer_cache, packer=ContextPacker()
+    )
+
+    register_metrics(retriever, query_cache, qa_service, answer_cache)
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_token = metrics.track_request()
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        total = time.perf_counter() - started
+        endpoint = request.endpoint or "unmatched"
+        REQUEST_SECONDS.observe(total, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+        # Streamed responses run their stages after the headers are sent.
+        if not response.is_streamed:
+            response.headers["Server-Timing"] = metrics.server_timing(metrics.request_stages(), total)
+        return response
+
+    @app.teardown_request
+    def _stop_request_timer(exc):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            metrics.untrack_request(token)
+
+    @app.errorhandler(Overloaded)
+    def _overloaded(e):
+        response = jsonify({"error": "Server is busy, please retry shortly", "retryAfter": e.retry_after})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
 
 
     @app.route("/health", methods=["GET"])
@@ -95,13 +282,29 @@ def create_app():
                 "status": "ok",
                 "service": "aiml",
                 "path": request.path,
+                "query_cache": query_cache.stats(),
+                "indexes": retriever.registry.stats(),
+                "sessions": qa_service.conversations.stats(),
+                "llm_gate": qa_service.gate.stats(),
+                "answer_cache": answer_cache.stats() if answer_cache is not None else None,
             }
         ), 200
 
 
+    @app.route("/metrics", methods=["GET"])
+    def metrics_route():
+        """Prometheus text exposition of request, stage, cache, gate and index metrics."""
+        if METRICS_TOKEN:
+            supplied = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(supplied, f"Bearer {METRICS_TOKEN}"):
+                return jsonify({"error": "Unauthorized"}), 401
+        return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
     @app.route("/ask", methods=["POST"])
     @jwt_required()
     def ask_route():
+        """Answer a question. 503 + Retry-After when the LLM admission queue is full."""
         role = get_jwt()['role']
 
         if role!="student":
@@ -111,35 +314,113 @@ def create_app():
         question = data.get("question", "")
         course = data.get("course", "FY") # Default to FY
         semester = data.get("semester", "Sem-1")  # Default to semester 1
+        session_id = data.get("sessionId")  # Frontend chat session; scopes conversation history
 
         if not question:
             return jsonify({"error": "Question is required"}), 400
+        # Optional: search several semesters at once (e.g. SY + FY prerequisites),
+        # and/or only some subjects, categories or documents.
+        try:
+            scopes = parse_scopes(data.get("scopes"))
+            filters = parse_filters(data.get("filters"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        result = qa_service.ask(question, course=course, semester=semester)
+        result = qa_service.ask(
+            question,
+            course=course,
+            semester=semester,
+            session_key=session_key(get_jwt_identity(), session_id),
+            scopes=scopes,
+            filters=filters,
+        )
         return jsonify(result)
+
+    def _sse(event: str, data) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    @app.route("/ask/stream", methods=["POST"])
+    @jwt_required()
+    def ask_stream_route():
+        """Same body as /ask, answered as Server-Sent Events.
+
+        Events: `sources` (sent as soon as retrieval finishes), `token` ({"text": ...}
+        per streamed piece of the answer), then `done` ({"answer": ...}) or `error`.
+        """
+        role = get_jwt()['role']
+
+        if role!="student":
+            return jsonify({"error": "Unauthorized"}), 403
+
+        data = request.get_json()
+        question = data.get("question", "")
+        course = data.get("course", "FY")
+        semester = data.get("semester", "Sem-1")
+        key = session_key(get_jwt_identity(), data.get("sessionId"))
+
+        if not question:
+            return jsonify({"error": "Question is required"}), 400
+        try:
+            scopes = parse_scopes(data.get("scopes"))
+            filters = parse_filters(data.get("filters"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Reject before the 200 + event stream starts.
+        qa_service.gate.check()
+
+        def generate():
+            try:
+                for event, payload in qa_service.ask_stream(
+                    question, course=course, semester=semester, session_key=key, scopes=scopes, filters=filters
+                ):
+                    yield _sse(event, {"text": payload} if event == "token" else payload)
+            except Overloaded as e:
+                # Queue timeout after the stream started; same body as the 503.
+                yield _sse("error", {"error": "Server is busy, please retry shortly", "retryAfter": e.retry_after})
+            except Exception:
+                # Details (paths, upstream API errors) stay in the log.
+                app.logger.exception("[ask/stream] failed")
+                yield _sse("error", {"error": "Failed to generate an answer, please try again"})
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            # Disable proxy buffering so tokens reach the browser as they arrive.
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
     
+    # filename / relative path -> PDF lookup table, refreshed when the data tree changes
+    pdf_index = FileIndex(Path(__file__).resolve().parent / "data")
+    app.logger.info("[startup] indexed %d PDFs for /pdf", len(pdf_index))
+
     @app.route("/pdf/<path:filename>", methods=["GET"])
     @jwt_required()
     def serve_pdf(filename):
-        """Serve PDF files from the data directory"""
+        """Serve PDF files from the data directory.
+
+        Supports conditional requests (ETag / Last-Modified -> 304) and HTTP
+        Range requests so the PDF viewer can fetch pages incrementally.
+        """
         try:
-            # Security: Only allow serving PDFs from data directory
-            data_dir = Path("./data").resolve()
-            
-            # Search for the file in data directory recursively
-            pdf_path = None
-            for file in data_dir.rglob(filename):
-                if file.is_file() and file.suffix.lower() == '.pdf':
-                    pdf_path = file
-                    break
-            
-            if pdf_path and pdf_path.exists():
-                return send_file(
+            # Security: only files in the prebuilt data-dir index can be served
+            pdf_path = pdf_index.lookup(filename)
+
+            if pdf_path:
+                response = send_file(
                     pdf_path,
                     mimetype='application/pdf',
                     as_attachment=False,
-                    download_name=filename
+                    download_name=pdf_path.name,
+                    conditional=True,
+                    etag=True,
+                    max_age=PDF_CACHE_MAX_AGE,
                 )
+                # Authenticated content: browsers may cache, shared proxies may not.
+                response.cache_control.private = True
+                response.cache_control.public = False
+                response.headers["Accept-Ranges"] = "bytes"
+                return response
             else:
                 return jsonify({"error": "PDF not found"}), 404
                 
@@ -0,0 +1,243 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from embedder import is_rate_limit_error
+
+
+# Minimal Prometheus-style metrics (text exposition format 0.0.4) and
+# per-request stage timers.
+#
+# - Counter / Histogram are updated in place by the request path.
+# - Callback metrics read existing stats (caches, gate, loaded indexes) at
+#   scrape time, so those components don't need to know about metrics.
+# - stage("embed") times a block into aiml_stage_seconds and, when a request
+#   is being tracked (track_request), into that request's breakdown for the
+#   Server-Timing header. The breakdown is a contextvar: work handed to a
+#   thread pool must be submitted with contextvars.copy_context().run to be
+#   included.
+
+# Seconds; covers cached embeddings (sub-ms) up to long generations.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts, +Inf count at the end), sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[slot] += 1
+            self._sums[key] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((k, list(c), self._sums[k]) for k, c in self._counts.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    # Values read at scrape time: fn() -> {label values tuple: value}.
+    def __init__(self, name: str, help_text: str, kind: str, labels: Sequence[str], fn: Callable[[], Dict[LabelValues, float]]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def samples(self) -> List[str]:
+        values = self.fn()
+        return [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in sorted(values.items())]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-registering a callback (e.g. a second create_app) replaces it.
+                if isinstance(metric, CallbackMetric):
+                    self._metrics[metric.name] = metric
+                    return metric
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def gauge_callback(self, name: str, help_text: str, fn, labels: Sequence[str] = ()) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help_text, "gauge", labels, fn))
+
+    def counter_callback(self, name: str, help_text: str, fn, labels: Sequence[str] = ()) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help_text, "counter", labels, fn))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: List[str] = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:  # a broken callback must not take /metrics down
+                lines.append(f"# {metric.name} unavailable: {type(e).__name__}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "aiml_stage_seconds", "Time spent per request stage (embed, index_load, search, generate, ...)", ["stage"]
+)
+RATE_LIMITED = REGISTRY.counter(
+    "aiml_rate_limited_total", "Upstream 429 / RESOURCE_EXHAUSTED errors by call", ["call"]
+)
+LLM_TOKENS = REGISTRY.counter(
+    "aiml_llm_tokens_total", "Gemini prompt and response tokens (usage metadata)", ["kind"]
+)
+
+
+_request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+# Stages of one request can finish on several threads (parallel scope searches).
+_stages_lock = threading.Lock()
+
+
+def track_request():
+    # Start collecting stage times for the current request; returns a reset token.
+    return _request_stages.set({})
+
+
+def untrack_request(token) -> None:
+    _request_stages.reset(token)
+
+
+def request_stages() -> Dict[str, float]:
+    stages = _request_stages.get()
+    if stages is None:
+        return {}
+    with _stages_lock:
+        return dict(stages)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _request_stages.get()
+        if stages is not None:
+            with _stages_lock:
+                stages[name] = stages.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def count_rate_limits(call: str) -> Iterator[None]:
+    try:
+        yield
+    except Exception as e:
+        if is_rate_limit_error(e):
+            RATE_LIMITED.inc(call=call)
+        raise
+
+
+def server_timing(stages: Dict[str, float], total: Optional[float] = None) -> str:
+    # "embed;dur=12.3, search;dur=0.4, total;dur=950.2" (milliseconds)
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def record_usage(usage) -> None:
+    # google-genai usage_metadata (or None).
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_token_count", None)
+    response = getattr(usage, "candidates_token_count", None)
+    if prompt:
+        LLM_TOKENS.inc(prompt, kind="prompt")
+    if response:
+        LLM_TOKENS.inc(response, kind="response")
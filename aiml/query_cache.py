@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+DEFAULT_MAX_ENTRIES = 4096
+
+
+def normalize_query(text: str) -> str:
+    # "Explain  Drift velocity?" and "explain drift velocity" share one entry.
+    text = unicodedata.normalize("NFKC", text).lower()
+    return " ".join(text.split()).rstrip("?!. ")
+
+
+class QueryEmbeddingCache:
+    # Two-tier cache for query embeddings keyed by (model, normalized query):
+    # - bounded in-memory LRU
+    # - optional sqlite file so entries survive restarts
+    # Safe to share across request threads.
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, db_path: Optional[str] = None):
+        self.max_entries = max(1, int(max_entries))
+        self.db_path = db_path
+
+        self._lru: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def get(self, model: str, query: str) -> Optional[np.ndarray]:
+        key = (model, normalize_query(query))
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                return vec
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?", key
+                ).fetchone()
+                if row is not None:
+                    vec = np.frombuffer(row[0], dtype="float32")
+                    self._put_memory(key, vec)
+                    self.disk_hits += 1
+                    return vec
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, query: str, vec: np.ndarray) -> None:
+        key = (model, normalize_query(query))
+        vec = np.ascontiguousarray(vec, dtype="float32").reshape(-1)
+        vec.setflags(write=False)
+        with self._lock:
+            self._put_memory(key, vec)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, vector, created_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key[0], key[1], vec.tobytes(), time.time()),
+                )
+                self._db.commit()
+
+    def _put_memory(self, key: Tuple[str, str], vec: np.ndarray) -> None:
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+                "persistent": self._db is not None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
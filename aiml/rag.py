@@ -1,10 +1,77 @@
+import contextvars
 import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Sequence, Tuple, Union
 
 import faiss
+import numpy as np
 
-from embedder import Embedder
+from chunk_store import ChunkStore, store_path_for
+from embedder import EmbeddingBackend, EmbeddingMismatch, embedder_for_meta
+from index_factory import id_selector, index_meta_path, index_nbytes, read_index_meta, search_params
+from index_registry import IndexRegistry
+from lexical import BM25Index, lexical_path_for
+from metrics import count_rate_limits, stage
+from query_cache import QueryEmbeddingCache
+
+
+# Resident-size budget for loaded semester indexes + metadata. 0 = never evict.
+DEFAULT_MEMORY_BUDGET_MB = float(os.getenv("INDEX_MEMORY_BUDGET_MB", "0"))
+
+# Retrieval modes:
+# - vector:  FAISS only (needs a query embedding)
+# - lexical: BM25 only, zero network calls
+# - hybrid:  both, fused with weighted reciprocal rank fusion
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+DEFAULT_RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+# In hybrid mode, a query embedding slower than this falls back to BM25-only.
+# Empty = always wait for the embedding.
+EMBED_TIMEOUT_SECONDS = float(os.getenv("EMBED_TIMEOUT_SECONDS", "2.5") or 0) or None
+
+# Hybrid fusion: each side contributes weight / (RRF_K + rank).
+RRF_K = 60
+VECTOR_WEIGHT = 1.0
+LEXICAL_WEIGHT = 1.0
+HYBRID_CANDIDATE_FACTOR = 4
+
+# Threads used to load and search scopes in parallel (Retriever.retrieve_many).
+MAX_PARALLEL_SCOPES = 8
+
+# BM25 score that maps to relevance 0.5.
+BM25_RELEVANCE_HALF_SCORE = 10.0
+
+# Chunk fields a search can be restricted to (retrieve(filters=...)); values
+# come from each subject folder's metadata.json and the file name.
+FILTER_FIELDS = ("subject", "category", "doc_name")
+# Distinct filters whose chunk masks / FAISS selectors are kept per loaded index.
+MAX_CACHED_FILTERS = 64
+
+# Canonical filters: ((field, (casefolded values, ...)), ...), sorted.
+FilterKey = Tuple[Tuple[str, Tuple[str, ...]], ...]
+
+
+def filter_key(filters: Optional[Dict[str, Union[str, Sequence[str]]]]) -> Optional[FilterKey]:
+    # {"subject": ["BEE"], "category": "Theory"} -> hashable key; None = no filter.
+    # A chunk matches when, for every field, its value is one of the given ones.
+    if not filters:
+        return None
+    key = []
+    for field in sorted(filters):
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Unknown filter field {field!r}; expected one of {FILTER_FIELDS}")
+        values = filters[field]
+        if isinstance(values, str):
+            values = [values]
+        values = tuple(sorted({str(v).casefold() for v in values}))
+        if values:
+            key.append((field, values))
+    return tuple(key) or None
 
 
 def _load_jsonl(path: str) -> List[Dict]:
@@ -21,18 +88,161 @@ def _load_jsonl(path: str) -> List[Dict]:
     return records
 
 
-def _distance_to_relevance(distance: float) -> float:
-    # FAISS IndexFlatL2 returns squared L2 distance. Map to (0,1] with a simple monotonic transform.
-    # 0 -> 1.0, larger distance -> closer to 0.
+def _distance_to_relevance(distance: float, unit_vectors: bool = False) -> float:
+    # Squared L2 distance -> (0,1]. For unit vectors d = 2 - 2*cos, so the
+    # relevance is the cosine similarity itself (clipped at 0); otherwise a
+    # simple monotonic transform: 0 -> 1.0, larger distance -> closer to 0.
     if distance < 0:
         distance = 0.0
+    if unit_vectors:
+        return max(0.0, 1.0 - float(distance) / 2.0)
     return 1.0 / (1.0 + float(distance))
 
 
+def _bm25_to_relevance(score: float) -> float:
+    # BM25 scores are unbounded. Map to (0,1) with a saturating transform.
+    return float(score) / (float(score) + BM25_RELEVANCE_HALF_SCORE)
+
+
+def _records_nbytes(records: List[Dict]) -> int:
+    # Shallow estimate: list + dicts + values (keys are shared/interned).
+    total = sys.getsizeof(records)
+    for record in records:
+        total += sys.getsizeof(record) + sum(sys.getsizeof(v) for v in record.values())
+    return total
+
+
+class ChunkFilter:
+    # The chunks of one index that pass a filter: a boolean mask over chunk
+    # positions (BM25 doc ids) and a FAISS selector over the matching labels,
+    # so filtered vector search skips the other vectors instead of
+    # post-filtering a top-k.
+    def __init__(self, mask: np.ndarray, labels: np.ndarray, with_selector: bool):
+        self.mask = mask
+        self.count = int(labels.size)
+        self.selector = id_selector(labels) if with_selector and labels.size else None
+        self.nbytes = mask.nbytes + (labels.nbytes * 2 if self.selector is not None else 0)
+
+
+class SemesterResources:
+    # `chunks` is either a list of dicts (chunks.jsonl) or a ChunkStore; both
+    # support len() and chunks[position]. BM25 doc ids are positions; FAISS
+    # labels are positions too for older indexes, or chunk ids when the index
+    # meta says "ids": "chunk_id" (see positions()).
+    def __init__(
+        self,
+        index,
+        chunks: Union[List[Dict], ChunkStore],
+        meta: Optional[Dict] = None,
+        lexical: Optional[BM25Index] = None,
+        embedder: Optional[EmbeddingBackend] = None,
+    ):
+        self.index = index
+        self.chunks = chunks
+        # Contents of {course}_{semester}_faiss.json (index type and parameters).
+        self.meta = meta or {}
+        # BM25 index from {course}_{semester}_chunks.bm25, if the chunker built one.
+        self.lexical = lexical
+        # Inner-product indexes hold unit vectors (normalised embedders).
+        self.inner_product = self.meta.get("metric") == "ip"
+        # Embeds queries for this index (the backend it was built with); None
+        # when that backend isn't available here, which leaves BM25 only.
+        self.embedder = embedder
+        # False when a file was missing or unreadable; IndexRegistry then
+        # doesn't keep these resources.
+        self.cacheable = True
+
+        # chunk id -> position lookup: ids sorted once, searched with searchsorted.
+        self._sorted_ids: Optional[np.ndarray] = None
+        self._id_order: Optional[np.ndarray] = None
+        if self.meta.get("ids") == "chunk_id":
+            if isinstance(chunks, ChunkStore):
+                ids = chunks.chunk_ids()
+            else:
+                ids = np.fromiter((c.get("chunk_id", -1) for c in chunks), dtype=np.int64, count=len(chunks))
+            if ids is None:
+                ids = np.full(len(chunks), -1, dtype=np.int64)
+            self._id_order = np.argsort(ids, kind="stable")
+            self._sorted_ids = np.asarray(ids)[self._id_order]
+
+        self._filters: "OrderedDict[FilterKey, ChunkFilter]" = OrderedDict()
+        self._filters_lock = threading.Lock()
+
+        # Near-duplicates (see ingestion/dedup.py) have no vector; BM25 hits on
+        # them are folded into the chunk they alias. Only the chunk store
+        # carries these annotations.
+        self._aliases: Dict[int, int] = {}
+        if self._sorted_ids is not None and isinstance(chunks, ChunkStore):
+            alias_rows = [(i, a) for i, a in enumerate(chunks.column("duplicate_of")) if a is not None]
+            if alias_rows:
+                targets = self.positions(np.asarray([a for _, a in alias_rows], dtype=np.int64))
+                self._aliases = {i: int(t) for (i, _), t in zip(alias_rows, targets) if t >= 0}
+
+    def positions(self, labels: np.ndarray) -> np.ndarray:
+        # FAISS result labels -> chunk positions; -1 for labels with no chunk.
+        labels = np.asarray(labels, dtype=np.int64)
+        if self._sorted_ids is None:
+            return np.where((labels >= 0) & (labels < len(self.chunks)), labels, -1)
+        if len(self._sorted_ids) == 0:
+            return np.full(labels.shape, -1, dtype=np.int64)
+        slots = np.minimum(np.searchsorted(self._sorted_ids, labels), len(self._sorted_ids) - 1)
+        found = (self._sorted_ids[slots] == labels) & (labels >= 0)
+        return np.where(found, self._id_order[slots], -1)
+
+    def canonical(self, position: int) -> int:
+        return self._aliases.get(position, position)
+
+    def chunk_filter(self, key: FilterKey) -> ChunkFilter:
+        with self._filters_lock:
+            flt = self._filters.get(key)
+            if flt is not None:
+                self._filters.move_to_end(key)
+                return flt
+
+        mask = np.ones(len(self.chunks), dtype=bool)
+        for field, values in key:
+            if isinstance(self.chunks, ChunkStore):
+                mask &= self.chunks.matches(field, values)
+            else:
+                wanted = set(values)
+                mask &= np.fromiter(
+                    (str(c.get(field, "")).casefold() in wanted for c in self.chunks), dtype=bool, count=len(self.chunks)
+                )
+        positions = np.flatnonzero(mask)
+        if self._sorted_ids is not None:
+            # Labels are chunk ids: ids of the matching positions.
+            ids = np.empty(len(self._sorted_ids), dtype=np.int64)
+            ids[self._id_order] = self._sorted_ids
+            labels = np.unique(ids[positions])
+            labels = labels[labels >= 0]
+        else:
+            labels = positions.astype(np.int64)
+        flt = ChunkFilter(mask, labels, with_selector=self.index is not None)
+
+        with self._filters_lock:
+            self._filters[key] = flt
+            while len(self._filters) > MAX_CACHED_FILTERS:
+                self._filters.popitem(last=False)
+        return flt
+
+    def resident_bytes(self) -> int:
+        if isinstance(self.chunks, ChunkStore):
+            chunks_bytes = self.chunks.resident_bytes()
+        else:
+            chunks_bytes = _records_nbytes(self.chunks)
+        lexical_bytes = self.lexical.resident_bytes() if self.lexical is not None else 0
+        id_bytes = self._sorted_ids.nbytes + self._id_order.nbytes if self._sorted_ids is not None else 0
+        id_bytes += len(self._aliases) * 100
+        id_bytes += sum(f.nbytes for f in list(self._filters.values()))
+        return index_nbytes(self.index) + chunks_bytes + lexical_bytes + id_bytes
+
+
+_AIML_DIR = Path(__file__).resolve().parent
+
+
 def _curr_file_parent() -> Path:
-    # aiml/rag.py -> aiml/ -> repo root
-    print(Path(__file__).resolve().parent)
-    return Path(__file__).resolve().parent
+    # aiml/rag.py -> aiml/ (resolved once; this runs on every retrieve)
+    return _AIML_DIR
 
 
 def _candidate_paths(data_dir: Path, course: str, semester: str) -> Tuple[Path, Path]:
@@ -60,19 +270,35 @@ def _candidate_paths(data_dir: Path, course: str, semester: str) -> Tuple[Path,
 class Retriever:
     def __init__(
         self,
-        embedder: Embedder,
+        embedder: EmbeddingBackend,
         index_path: str = "ingestion/output/faiss.index",
         chunks_path: str = "ingestion/output/chunks.jsonl",
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        memory_budget_mb: Optional[float] = None,
+        mode: str = DEFAULT_RETRIEVAL_MODE,
+        embed_timeout: Optional[float] = EMBED_TIMEOUT_SECONDS,
     ):
+        # Default query embedder; indexes built with another backend get their own (see _embedder_for).
         self.embedder = embedder
+        self._embedders: Dict[str, EmbeddingBackend] = {}
+        self._embedders_lock = threading.Lock()
+        self.query_cache = query_cache
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+        self.mode = mode
+        self.embed_timeout = embed_timeout
+        self._embed_pool: Optional[ThreadPoolExecutor] = None
+        self._search_pool: Optional[ThreadPoolExecutor] = None
         # Defaults/fallback when course+semester aren't provided
         self.default_index_path = index_path
         self.default_chunks_path = chunks_path
 
-        # Cache loaded resources by (course, semester) or by resolved fallback paths
-        self._cache: dict[tuple, tuple] = {}
+        # Loaded resources by (course, semester) or by resolved fallback paths.
+        # Single-flight loads + LRU eviction under INDEX_MEMORY_BUDGET_MB (0 = unbounded).
+        budget_mb = memory_budget_mb if memory_budget_mb is not None else DEFAULT_MEMORY_BUDGET_MB
+        self.registry = IndexRegistry(memory_budget_bytes=int(budget_mb * 1024 * 1024) or None)
 
-    def _load_resources(self, course: Optional[str], semester: Optional[str]):
+    def _resolve_paths(self, course: Optional[str], semester: Optional[str]) -> Tuple[tuple, Path, Path]:
         if course and semester:
             data_dir = _curr_file_parent() / "data"
             index_path, chunks_path = _candidate_paths(data_dir, course, semester)
@@ -81,20 +307,20 @@ class Retriever:
             index_path = _curr_file_parent() / self.default_index_path
             chunks_path = _curr_file_parent() / self.default_chunks_path
             cache_key = ("fallback", str(index_path), str(chunks_path))
+        return cache_key, index_path, chunks_path
 
-        if cache_key in self._cache:
-            return self._cache[cache_key]
+    def _read_chunks(self, chunks_path: Path) -> Union[List[Dict], ChunkStore]:
+        # Prefer the compact chunk store when it is at least as new as chunks.jsonl.
+        store_path = store_path_for(chunks_path)
+        if store_path.exists() and (
+            not chunks_path.exists() or store_path.stat().st_mtime >= chunks_path.stat().st_mtime
+        ):
+            try:
+                return ChunkStore(store_path)
+            except Exception as e:
+                print(f"Failed to open chunk store at {store_path}, falling back to {chunks_path}: {e}")
 
-        index = None
         chunks: List[Dict] = []
-
-        try:
-            if not index_path.exists():
-                raise FileNotFoundError(str(index_path))
-            index = faiss.read_index(str(index_path))
-        except Exception as e:
-            print(f"FAISS index not found at {index_path}: {e}")
-
         try:
             if not chunks_path.exists():
                 raise FileNotFoundError(str(chunks_path))
@@ -105,9 +331,322 @@ class Retriever:
                     chunks = json.load(f)
         except Exception as e:
             print(f"Chunks file not found at {chunks_path}: {e}")
+        return chunks
 
-        self._cache[cache_key] = (index, chunks)
-        return index, chunks
+    def _read_resources(self, index_path: Path, chunks_path: Path) -> "SemesterResources":
+        with stage("index_load"):
+            return self._read_resources_untimed(index_path, chunks_path)
+
+    def _read_resources_untimed(self, index_path: Path, chunks_path: Path) -> "SemesterResources":
+        index = None
+        meta: Dict = {}
+        lexical: Optional[BM25Index] = None
+        # A file that exists but can't be read (e.g. mid-rewrite) is retried
+        # on the next request instead of being cached as missing.
+        failed = False
+
+        try:
+            if not index_path.exists():
+                raise FileNotFoundError(str(index_path))
+            index = faiss.read_index(str(index_path))
+            meta = read_index_meta(index_path)
+        except Exception as e:
+            print(f"FAISS index not found at {index_path}: {e}")
+            failed = index_path.exists()
+
+        lexical_path = lexical_path_for(chunks_path)
+        if lexical_path.exists():
+            try:
+                lexical = BM25Index(lexical_path)
+            except Exception as e:
+                print(f"Failed to load BM25 index at {lexical_path}: {e}")
+                failed = True
+
+        embedder = self._embedder_for(index_path, index, meta) if index is not None else None
+        resources = SemesterResources(index, self._read_chunks(chunks_path), meta, lexical, embedder)
+        # No chunks: the semester isn't ingested (yet), or its chunks are unreadable.
+        resources.cacheable = not failed and len(resources.chunks) > 0
+        return resources
+
+    def _embedder_for(self, index_path: Path, index, meta: Dict) -> Optional[EmbeddingBackend]:
+        # Query embedder matching the backend/model/dim recorded in the index meta.
+        try:
+            self.embedder.check_index(meta, int(index.d))
+            return self.embedder
+        except EmbeddingMismatch:
+            pass
+        try:
+            embedder = embedder_for_meta(meta, client=getattr(self.embedder, "client", None))
+            embedder.check_index(meta, int(index.d))
+        except Exception as e:
+            print(f"No query embedder for {index_path} ({e}); vector search disabled for it.")
+            return None
+        with self._embedders_lock:
+            return self._embedders.setdefault(embedder.vector_key, embedder)
+
+    def _load_resources(self, course: Optional[str], semester: Optional[str]) -> "SemesterResources":
+        # Keyed by paths and checked against index_version(), so a re-ingested
+        # or delta-updated semester is reloaded on its next request.
+        cache_key, index_path, chunks_path = self._resolve_paths(course, semester)
+        return self.registry.get(
+            cache_key, lambda: self._read_resources(index_path, chunks_path), self.index_version(course, semester)
+        )
+
+    def index_version(self, course: Optional[str], semester: Optional[str]) -> str:
+        # Changes whenever the semester's index or chunk files are rewritten
+        # (re-ingestion, applied delta). Only stats files; nothing is loaded.
+        _, index_path, chunks_path = self._resolve_paths(course, semester)
+        parts = []
+        for path in (
+            index_path,
+            index_meta_path(index_path),
+            chunks_path,
+            store_path_for(chunks_path),
+            lexical_path_for(chunks_path),
+        ):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            parts.append(f"{path.name}:{st.st_size}:{st.st_mtime_ns}")
+        return "|".join(parts)
+
+    def loaded_scopes(self) -> List[Dict]:
+        # Per loaded index: sizes for /metrics. "scope" is the index file stem
+        # without _faiss.index (FY_Sem-1).
+        scopes = []
+        for key, resources in self.registry.items():
+            name = Path(key[1]).name
+            scope = name[: -len("_faiss.index")] if name.endswith("_faiss.index") else name
+            scopes.append(
+                {
+                    "scope": scope,
+                    "vectors": int(resources.index.ntotal) if resources.index is not None else 0,
+                    "chunks": len(resources.chunks),
+                    "resident_bytes": resources.resident_bytes(),
+                }
+            )
+        return scopes
+
+    def warm(self, scopes: List[Tuple[str, str]]):
+        # Load (course, semester) indexes on a background thread so the first
+        # student on each semester doesn't pay the load latency.
+        jobs = []
+        for course, semester in scopes:
+            cache_key, index_path, chunks_path = self._resolve_paths(course, semester)
+            jobs.append(
+                (
+                    cache_key,
+                    lambda i=index_path, c=chunks_path: self._read_resources(i, c),
+                    self.index_version(course, semester),
+                )
+            )
+        return self.registry.warm(jobs)
+
+    def embed_query(self, query: str, embedder: Optional[EmbeddingBackend] = None) -> np.ndarray:
+        embedder = embedder or self.embedder
+        if not embedder.remote:
+            # Cheaper to recompute than to look up.
+            with stage("embed"):
+                return embedder.embed_text(query)
+        with stage("embed"):
+            if self.query_cache is None:
+                return self._embed_remote(query, embedder)
+
+            vec = self.query_cache.get(embedder.vector_key, query)
+            if vec is None:
+                vec = self._embed_remote(query, embedder)
+                self.query_cache.put(embedder.vector_key, query, vec)
+            return vec
+
+    def _embed_remote(self, query: str, embedder: EmbeddingBackend) -> np.ndarray:
+        with count_rate_limits("embed"):
+            return embedder.embed_text(query)
+
+    def embed_query_with_fallback(self, query: str, embedder: Optional[EmbeddingBackend] = None) -> Optional[np.ndarray]:
+        # Returns None when the embedding fails or takes longer than embed_timeout;
+        # a late result still lands in the query cache for the next request.
+        embedder = embedder or self.embedder
+        try:
+            if self.embed_timeout is None or not embedder.remote:
+                return self.embed_query(query, embedder)
+            if self._embed_pool is None:
+                self._embed_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="query-embed")
+            future = self._embed_pool.submit(contextvars.copy_context().run, self.embed_query, query, embedder)
+            return future.result(timeout=self.embed_timeout)
+        except Exception as e:
+            print(f"Query embedding unavailable ({type(e).__name__}: {e}); using BM25 only.")
+            return None
+
+    def _search_scope(
+        self,
+        resources: SemesterResources,
+        query: str,
+        q_vec: Optional[np.ndarray],
+        k_vector: int,
+        k_lexical: int,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        filters: Optional[FilterKey] = None,
+    ) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+        # Candidates from one semester: (position, distance) from FAISS and
+        # (position, BM25 score) from the lexical index, each best first,
+        # among the chunks that pass `filters`.
+        with stage("search"):
+            flt = resources.chunk_filter(filters) if filters else None
+            if flt is not None and not flt.count:
+                return [], []
+            return self._search_scope_untimed(resources, query, q_vec, k_vector, k_lexical, nprobe, ef_search, flt)
+
+    def _search_scope_untimed(
+        self,
+        resources: SemesterResources,
+        query: str,
+        q_vec: Optional[np.ndarray],
+        k_vector: int,
+        k_lexical: int,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        flt: Optional[ChunkFilter] = None,
+    ) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+        vector_hits: List[Tuple[int, float]] = []
+        index = resources.index
+        if k_vector and q_vec is not None and index is not None:
+            if index.d != q_vec.shape[-1]:
+                print(f"Skipping vector search: index dim {index.d} != query dim {q_vec.shape[-1]}")
+            else:
+                params = search_params(
+                    index, nprobe=nprobe, ef_search=ef_search, sel=flt.selector if flt is not None else None
+                )
+                if flt is not None:
+                    k_vector = min(k_vector, flt.count)
+                distances, labels = index.search(q_vec.reshape(1, -1), k_vector, params=params)
+                if resources.inner_product:
+                    # Similarities -> squared L2 between unit vectors, so every
+                    # index's hits sort (and merge) by ascending distance.
+                    # float64: unfilled slots (label -1) hold -FLT_MAX.
+                    distances = 2.0 - 2.0 * distances.astype(np.float64)
+                for dist, pos in zip(distances[0], resources.positions(labels[0])):
+                    if pos < 0:
+                        continue
+                    vector_hits.append((int(pos), float(dist)))
+
+        lexical_hits: List[Tuple[int, float]] = []
+        if k_lexical and resources.lexical is not None:
+            ids, scores = resources.lexical.search(query, k_lexical, allowed=flt.mask if flt is not None else None)
+            seen = set()
+            for i, s in zip(ids, scores):
+                if i >= len(resources.chunks):
+                    continue
+                pos = resources.canonical(int(i))
+                if flt is not None and not flt.mask[pos]:
+                    # Near-duplicate of a chunk outside the filter.
+                    continue
+                if pos not in seen:
+                    seen.add(pos)
+                    lexical_hits.append((pos, float(s)))
+        return vector_hits, lexical_hits
+
+    def _map_scopes(self, fn, items: List) -> List:
+        # One task per scope; FAISS and numpy release the GIL while searching.
+        if len(items) == 1:
+            return [fn(items[0])]
+        if self._search_pool is None:
+            self._search_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_SCOPES, thread_name_prefix="scope-search")
+        # Each task gets a copy of the request context so its stage timers count.
+        futures = [self._search_pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+        return [f.result() for f in futures]
+
+    def _retrieve(
+        self,
+        query: str,
+        scopes: List[Tuple[Optional[str], Optional[str]]],
+        top_k: int,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        mode: Optional[str],
+        filters: Optional[FilterKey] = None,
+    ) -> List[Tuple[int, Dict]]:
+        # Globally ranked (scope index, chunk with relevance) across scopes. The
+        # query is embedded once per embedding backend in use; vector candidates
+        # from every index are merged by distance (both backends produce unit
+        # vectors, so distances share a 0-2 range) and lexical ones by BM25
+        # score, then fused once, so scores are comparable across scopes.
+        mode = mode or self.mode
+        loaded = self._map_scopes(lambda scope: self._load_resources(*scope), scopes)
+
+        usable: List[Tuple[int, SemesterResources]] = []
+        for n, resources in enumerate(loaded):
+            if not resources.chunks:
+                print("Cannot retrieve: chunks metadata not loaded.")
+            elif resources.index is None and resources.lexical is None:
+                print("Cannot retrieve: FAISS index not loaded.")
+            else:
+                usable.append((n, resources))
+        if not usable:
+            return []
+        # Degrade to whatever these scopes actually have.
+        if all(r.lexical is None for _, r in usable):
+            mode = "vector"
+        elif all(r.index is None for _, r in usable):
+            mode = "lexical"
+
+        # Query vector per embedder (by vector_key).
+        q_vecs: Dict[str, Optional[np.ndarray]] = {}
+        if mode != "lexical":
+            for embedder in {r.embedder.vector_key: r.embedder for _, r in usable if r.embedder is not None}.values():
+                if mode == "hybrid":
+                    q_vecs[embedder.vector_key] = self.embed_query_with_fallback(query, embedder)
+                else:
+                    q_vecs[embedder.vector_key] = self.embed_query(query, embedder)
+            if all(vec is None for vec in q_vecs.values()):
+                mode = "lexical"
+
+        def q_vec(resources: SemesterResources) -> Optional[np.ndarray]:
+            return q_vecs.get(resources.embedder.vector_key) if resources.embedder is not None else None
+
+        k_candidates = top_k if mode != "hybrid" else top_k * HYBRID_CANDIDATE_FACTOR
+        k_vector = k_candidates if mode != "lexical" else 0
+        k_lexical = k_candidates if mode != "vector" else 0
+        searched = self._map_scopes(
+            lambda item: self._search_scope(
+                item[1], query, q_vec(item[1]), k_vector, k_lexical, nprobe, ef_search, filters
+            ),
+            usable,
+        )
+
+        # Keys are (scope index, position); sorts are stable, so a single scope keeps its own order.
+        vector_hits = sorted(
+            (((n, pos), d) for (n, _), (hits, _) in zip(usable, searched) for pos, d in hits),
+            key=lambda hit: hit[1],
+        )
+        lexical_hits = sorted(
+            (((n, pos), s) for (n, _), (_, hits) in zip(usable, searched) for pos, s in hits),
+            key=lambda hit: hit[1],
+            reverse=True,
+        )
+
+        def chunk(key: Tuple[int, int], relevance: float) -> Tuple[int, Dict]:
+            n, pos = key
+            return n, {**loaded[n].chunks[pos], "relevance": relevance}
+
+        if mode == "vector":
+            return [
+                chunk(key, _distance_to_relevance(d, loaded[key[0]].inner_product)) for key, d in vector_hits[:top_k]
+            ]
+        if mode == "lexical":
+            return [chunk(key, _bm25_to_relevance(s)) for key, s in lexical_hits[:top_k]]
+
+        fused: Dict[Tuple[int, int], float] = {}
+        for rank, (key, _) in enumerate(vector_hits, start=1):
+            fused[key] = fused.get(key, 0.0) + VECTOR_WEIGHT / (RRF_K + rank)
+        for rank, (key, _) in enumerate(lexical_hits, start=1):
+            fused[key] = fused.get(key, 0.0) + LEXICAL_WEIGHT / (RRF_K + rank)
+
+        # Normalize so a chunk ranked first by both sides scores 1.0.
+        best_possible = (VECTOR_WEIGHT + LEXICAL_WEIGHT) / (RRF_K + 1)
+        ranked = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        return [chunk(key, score / best_possible) for key, score in ranked]
 
     def retrieve(
         self,
@@ -115,26 +654,33 @@ class Retriever:
         top_k: int = 3,
         course: Optional[str] = None,
         semester: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        mode: Optional[str] = None,
+        filters: Optional[Dict[str, Union[str, Sequence[str]]]] = None,
     ) -> List[Dict]:
-        index, chunks = self._load_resources(course, semester)
+        # nprobe (IVF indexes) and ef_search (HNSW) trade recall for latency per call;
+        # None uses the values stored with the index.
+        # mode overrides the Retriever default (see RETRIEVAL_MODES).
+        # filters restricts the search to chunks by FILTER_FIELDS, e.g.
+        # {"subject": "BEE", "category": ["Theory"]} (case-insensitive).
+        hits = self._retrieve(query, [(course, semester)], top_k, nprobe, ef_search, mode, filter_key(filters))
+        return [chunk for _, chunk in hits]
 
-        if index is None:
-            print("Cannot retrieve: FAISS index not loaded.")
-            return []
-        if not chunks:
-            print("Cannot retrieve: chunks metadata not loaded.")
+    def retrieve_many(
+        self,
+        query: str,
+        scopes: List[Tuple[str, str]],
+        top_k: int = 3,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        mode: Optional[str] = None,
+        filters: Optional[Dict[str, Union[str, Sequence[str]]]] = None,
+    ) -> List[Dict]:
+        # Like retrieve(), over several (course, semester) indexes searched in
+        # parallel; one global top_k, each chunk tagged with its "scope" ("FY/Sem-1").
+        scopes = list(dict.fromkeys(scopes))
+        if not scopes:
             return []
-
-        q_vec = self.embedder.embed_text(query).reshape(1, -1)
-        distances, indices = index.search(q_vec, top_k)
-
-        results: List[Dict] = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx == -1:
-                continue
-            if idx < 0 or idx >= len(chunks):
-                continue
-            chunk = chunks[idx]
-            results.append({**chunk, "relevance": _distance_to_relevance(float(dist))})
-
-        return results
+        hits = self._retrieve(query, scopes, top_k, nprobe, ef_search, mode, filter_key(filters))
+        return [{**chunk, "scope": "/".join(scopes[n])} for n, chunk in hits]
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from embedder import estimate_tokens
+
+
+# Per-session conversation memory for QAService.
+# Only the student's question and the model's answer are kept per turn (not the
+# RAG context), so history stays small and is never shared between students.
+DEFAULT_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "6"))
+DEFAULT_MAX_HISTORY_TOKENS = int(os.getenv("SESSION_MAX_HISTORY_TOKENS", "4000"))
+DEFAULT_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+DEFAULT_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "5000"))
+
+
+def session_key(identity: str, session_id: Optional[str]) -> Tuple[str, str]:
+    return (identity, session_id or "default")
+
+
+class ConversationSession:
+    def __init__(self, max_turns: int):
+        # (question, answer, tokens) newest last
+        self.turns: Deque[Tuple[str, str, int]] = deque(maxlen=max_turns)
+        self.tokens = 0
+        self.last_active = time.monotonic()
+
+    def add(self, question: str, answer: str, max_tokens: int) -> None:
+        if len(self.turns) == self.turns.maxlen:
+            self.tokens -= self.turns[0][2]
+        tokens = estimate_tokens(question) + estimate_tokens(answer)
+        self.turns.append((question, answer, tokens))
+        self.tokens += tokens
+        # Token budget: drop oldest turns (possibly all of them) until it fits.
+        while self.turns and self.tokens > max_tokens:
+            self.tokens -= self.turns.popleft()[2]
+
+
+class ConversationStore:
+    # Thread-safe, bounded map of session key -> ConversationSession.
+    # Sessions are kept in last-access order, so idle eviction and the global
+    # max_sessions cap both pop from the front.
+
+    def __init__(
+        self,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        max_history_tokens: int = DEFAULT_MAX_HISTORY_TOKENS,
+        idle_ttl_seconds: float = DEFAULT_IDLE_TTL_SECONDS,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+    ):
+        self.max_turns = max(1, max_turns)
+        self.max_history_tokens = max_history_tokens
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[Tuple[str, str], ConversationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    def _evict(self, now: float) -> None:
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_active > self.idle_ttl_seconds:
+                self._sessions.popitem(last=False)
+                self.evicted_idle += 1
+            elif len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted_capacity += 1
+            else:
+                break
+
+    def history(self, key: Tuple[str, str]) -> List[Tuple[str, str]]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(key)
+            if session is None:
+                return []
+            session.last_active = now
+            self._sessions.move_to_end(key)
+            return [(q, a) for q, a, _ in session.turns]
+
+    def append(self, key: Tuple[str, str], question: str, answer: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = ConversationSession(self.max_turns)
+                self._sessions[key] = session
+            session.add(question, answer, self.max_history_tokens)
+            session.last_active = now
+            self._sessions.move_to_end(key)
+            self._evict(now)
+
+    def clear(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "history_tokens": sum(s.tokens for s in self._sessions.values()),
+                "evicted_idle": self.evicted_idle,
+                "evicted_capacity": self.evicted_capacity,
+            }
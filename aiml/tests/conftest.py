@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modules import each other top-level (`from embedder import ...`), as when run from aiml/.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,117 @@
+import json
+
+import faiss
+import pytest
+
+import ingestion.ingest as ing
+from benchmarks.stubs import StubClient
+from embedder import Embedder, HashingEmbedder
+from index_factory import read_index_meta
+from ingestion.rate_limit import RateLimiter
+
+CHUNKS = 23
+TEXTS_PER_REQUEST = 5
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Ingestion output (progress_faiss, checkpoints) goes to tmp_path, never ingestion/output.
+    progress = tmp_path / "progress_faiss"
+    monkeypatch.setattr(ing, "OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(ing, "PROGRESS_FILE", progress)
+    monkeypatch.setattr(ing.read_progress, "__defaults__", (progress,))
+    monkeypatch.setattr(ing.write_progress, "__defaults__", (progress,))
+    # Stub vectors must never reach the shared embedding store.
+    monkeypatch.setattr(ing, "USE_EMBEDDING_STORE", False)
+    monkeypatch.setattr(ing, "DEFAULT_EMBEDDING_STORE_DIR", tmp_path / "embeddings")
+    monkeypatch.setenv("EMBEDDING_STORE_DIR", str(tmp_path / "embeddings"))
+    monkeypatch.setenv("INGEST_LIMIT", "0")
+    ing.write_progress(0)
+
+    with open(tmp_path / "chunks.jsonl", "w", encoding="utf-8") as f:
+        for i in range(CHUNKS):
+            text = f"chunk {i} about topic {i * 7} with words alpha{i} beta{i % 3} gamma{i * i}"
+            f.write(json.dumps({"text": text, "doc_name": "notes.pdf", "page": i + 1, "chunk_id": 1000 + i}) + "\n")
+    return tmp_path
+
+
+class FailingAfter:
+    # Wraps an embedder's embed_texts to raise after `calls` successful calls.
+    def __init__(self, embedder, calls):
+        self.embed_texts = embedder.embed_texts
+        self.left = calls
+        embedder.embed_texts = self
+
+    def __call__(self, texts):
+        if self.left <= 0:
+            raise RuntimeError("embedding service unavailable")
+        self.left -= 1
+        return self.embed_texts(texts)
+
+
+def ingestor(workdir, embedder):
+    embedder.max_texts_per_request = TEXTS_PER_REQUEST
+    return ing.Ingestor(
+        embedder,
+        input_jsonl=workdir / "chunks.jsonl",
+        index_path=workdir / "FY_Sem-1_faiss.index",
+        batch_size=TEXTS_PER_REQUEST,
+        workers=1,
+        limiter=RateLimiter(requests_per_minute=10**6, tokens_per_minute=10**9, request_burst=100),
+        dedup_threshold=0,
+    )
+
+
+def interrupted_then_resumed(workdir, make_embedder):
+    first = make_embedder()
+    FailingAfter(first, calls=2)
+    assert ingestor(workdir, first).ingest() == 2 * TEXTS_PER_REQUEST
+    assert ing.read_progress() == 2 * TEXTS_PER_REQUEST
+
+    assert ingestor(workdir, make_embedder()).ingest() == CHUNKS
+    index = faiss.read_index(str(workdir / "FY_Sem-1_faiss.index"))
+    assert index.ntotal == CHUNKS
+    return index, read_index_meta(workdir / "FY_Sem-1_faiss.index")
+
+
+def test_checkpoint_records_embedder(workdir):
+    embedder = Embedder(StubClient(dim=32), output_dimensionality=8)
+    FailingAfter(embedder, calls=1)
+    ingestor(workdir, embedder).ingest()
+
+    meta = read_index_meta(workdir / "FY_Sem-1_faiss.index")
+    assert meta["embed_key"] == embedder.vector_key
+    assert (meta["dim"], meta["ntotal"], meta["metric"], meta["ids"]) == (8, TEXTS_PER_REQUEST, "ip", "chunk_id")
+
+
+def test_resume_reduced_dimension(workdir):
+    index, meta = interrupted_then_resumed(
+        workdir, lambda: Embedder(StubClient(dim=32), output_dimensionality=8)
+    )
+    assert index.d == 8
+    assert meta["embed_key"] == "gemini-embedding-001@8"
+
+
+def test_resume_hashing_backend(workdir):
+    index, meta = interrupted_then_resumed(workdir, lambda: HashingEmbedder(64))
+    assert index.d == 64
+    assert meta["embed_backend"] == "hashing"
+
+
+def test_resume_checkpoint_without_meta(workdir):
+    # Checkpoints written before the meta was saved with them.
+    embedder = HashingEmbedder(64)
+    FailingAfter(embedder, calls=2)
+    ingestor(workdir, embedder).ingest()
+    (workdir / "FY_Sem-1_faiss.json").unlink()
+
+    assert ingestor(workdir, HashingEmbedder(64)).ingest() == CHUNKS
+
+
+def test_resume_rejects_other_embedder(workdir):
+    embedder = Embedder(StubClient(dim=32), output_dimensionality=8)
+    FailingAfter(embedder, calls=1)
+    ingestor(workdir, embedder).ingest()
+
+    with pytest.raises(RuntimeError, match="Can't extend"):
+        ingestor(workdir, Embedder(StubClient(dim=32), output_dimensionality=16)).ingest()
@@ -108,6 +108,7 @@ export default function ChatSessionPage() {
           semester: semesterNumber.startsWith("Sem-")
             ? semesterNumber
             : `Sem-${semesterNumber}`,
+          sessionId,
         }),
       });
 
@@ -132,6 +133,7 @@ export default function ChatSessionPage() {
             "Document"
           ).replace(".pdf", ""),
           pageNumber: src.pageNumber || src.page,
+          pageEnd: src.pageEnd || src.page_end,
           relevance: src.relevance || 0.85,
           excerpt: src.excerpt || src.text || "",
           filePath: src.filePath || src.source_path || "",
@@ -10,6 +10,7 @@ export interface Source {
   fileName: string;
   title: string;
   pageNumber?: number;
+  pageEnd?: number; // last page when the excerpt spans several pages
   relevance: number; // 0-1 score
   excerpt?: string;
   filePath?: string; // Backend file path for PDF access